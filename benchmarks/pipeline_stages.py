@@ -0,0 +1,215 @@
+"""
+Benchmark từng stage của pipeline /recommend trên dữ liệu tổng hợp, chạy offline
+(embedding provider "hashing", Qdrant embedded hoặc index NumPy trong thư mục tạm):
+
+  upsert (cold + warm) -> retrieve -> hybrid_rerank -> get_discount_vouchers -> calculate_tco (+ batch)
+  -> filter_and_calculate_tco (+ batch cho mọi profile) -> endpoint /recommend (handler, không qua HTTP)
+
+    python -m benchmarks.pipeline_stages --sizes 1000,10000 --profiles 200 --output benchmarks/stages.json
+    python -m benchmarks.pipeline_stages --sizes 1000 --baseline benchmarks/stages.json   # so sánh regression
+
+Kết quả JSON: {"meta": {...}, "results": [{stage, catalog_size, calls, mean_ms, p50_ms, p99_ms, total_s}]}
+(retrieve kèm mean_hits, filter_and_calculate_tco kèm mean_cars).
+Retrieve đi qua search_relaxed như /recommend; stage nào chạy trên kết quả rỗng (không có hit / xe) thì
+dừng với lỗi thay vì ghi số đo của một nhánh rỗng.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+from benchmarks.synthetic import generate_profiles, write_dataset
+from configs.recommender_config import RECOMMENDER_CONFIG
+
+
+def configure(work_dir: str, backend: str, dim: int):
+    """Trỏ RECOMMENDER_CONFIG sang dữ liệu tạm + embedding stub; phải gọi trước khi tạo recommender."""
+    RECOMMENDER_CONFIG.update({
+        "embedding_provider": "hashing",
+        "embedding_dim": dim,
+        "embedding_cache_path": os.path.join(work_dir, "embeddings.sqlite3"),
+        "vector_backend": backend,
+        "use_mock_semantic_search": False,
+        "warmup_on_startup": False,
+        "business_signals_path": os.path.join(work_dir, "business_signals.csv"),  # không tồn tại -> mặc định
+        "business_signals_refresh_seconds": 0,
+        "response_cache_enabled": False,
+    })
+
+
+def require(ok: bool, message: str):
+    """Dừng benchmark nếu dữ liệu đầu vào của stage rỗng (số đo sẽ vô nghĩa)."""
+    if not ok:
+        raise RuntimeError(f"benchmark input is empty: {message}")
+
+
+def timed(stage: str, n: int, calls: Iterable[Callable]) -> Dict:
+    latencies = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "stage": stage,
+        "catalog_size": n,
+        "calls": len(latencies),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "total_s": round(float(latencies.sum()) / 1000, 4),
+    }
+
+
+def bench_size(n: int, args, work_dir: str) -> List[Dict]:
+    import main
+    import recommender
+    from fastapi import Response
+    from tco_calculator import TCOCalculator
+    from utils.db import get_vouchers_from_db
+    from utils.vehicle_repository import VehicleRepository
+    from utils import vehicle_repository
+    from utils.voucher_utils import get_discount_vouchers, get_voucher_index
+
+    size_dir = os.path.join(work_dir, f"n{n}")
+    data = write_dataset(size_dir, n, n_vouchers=args.vouchers, seed=args.seed)
+    profiles = generate_profiles(args.profiles, data["rows"], seed=args.seed)
+    # Repository dùng chung của process trỏ sang vehicles.json tổng hợp của size này
+    vehicle_repository._repository = VehicleRepository(data["vehicles_path"])
+    RECOMMENDER_CONFIG["numpy_index_path"] = os.path.join(size_dir, "vector_index")
+    results = []
+
+    holder = {}
+    results.append(timed("upsert_cold", n, [
+        lambda: holder.setdefault("rec", recommender.HybridCarRecommender(
+            data["csv_path"], qdrant_path=os.path.join(size_dir, "qdrant_storage")))
+    ]))
+    rec = holder["rec"]
+    results.append(timed("upsert_warm", n, [rec._upsert]))
+    # main.* dùng recommender chung của process
+    recommender._recommender = rec
+
+    top_k, top_n = RECOMMENDER_CONFIG["top_k"], RECOMMENDER_CONFIG["top_n"]
+    inputs = [main.build_search_inputs(p, rec) for p in profiles]
+    vectors = [rec._get_embedding(i["pref_text"]) for i in inputs]
+    hits = []
+    retrieve = timed("retrieve", n, [
+        (lambda i=i, v=v: hits.append(rec.search_relaxed(v, top_k=top_k, filters=i["filters"])))
+        for i, v in zip(inputs, vectors)
+    ])
+    empty = sum(1 for h in hits if not h)
+    require(not empty, f"{empty}/{len(hits)} profiles retrieved no cars (n={n})")
+    retrieve["mean_hits"] = round(float(np.mean([len(h) for h in hits])), 2)
+    results.append(retrieve)
+    ranked = []
+    results.append(timed("hybrid_rerank", n, [
+        (lambda i=i, h=h, v=v: ranked.append(rec.hybrid_rerank(
+            hits=h, user_pref=i["user_pref"], pref_text=i["pref_text"], strategy=i["strategy"],
+            business_cfg=i["business_cfg"], top_n=top_n, pref_vec=v)))
+        for i, h, v in zip(inputs, hits, vectors)
+    ]))
+    require(all(ranked), f"hybrid_rerank returned no cars for some profiles (n={n})")
+    semantic_results = [main.suggested_cars_from_hits(r, i) for r, i in zip(ranked, inputs)]
+
+    vehicles = vehicle_repository._repository.all()[:args.vehicles]
+    vouchers = get_vouchers_from_db(data["vouchers_path"])
+    voucher_index = get_voucher_index(data["vouchers_path"])
+    levels = [p.memberLevel for p in profiles]
+    results.append(timed("get_discount_vouchers", n, [
+        (lambda v=v, lvl=lvl: get_discount_vouchers(vouchers, v, v.year, lvl))
+        for v, lvl in zip(vehicles, levels * (len(vehicles) // max(len(levels), 1) + 1))
+    ]))
+    results.append(timed("get_discount_vouchers_indexed", n, [
+        (lambda v=v, lvl=lvl: get_discount_vouchers(voucher_index, v, v.year, lvl))
+        for v, lvl in zip(vehicles, levels * (len(vehicles) // max(len(levels), 1) + 1))
+    ]))
+    calc = TCOCalculator(profiles[0])
+    results.append(timed("calculate_tco", n, [(lambda v=v: calc.calculate_tco(vehicle=v)) for v in vehicles]))
+    # Một lần gọi cho cả danh sách xe (so với tổng của calculate_tco ở trên)
+    results.append(timed("calculate_tco_batch", n, [lambda: calc.calculate_tco_batch(vehicles, horizons=(5,))]))
+
+    priced = []
+    tco = timed("filter_and_calculate_tco", n, [
+        (lambda p=p, s=s: priced.append(main.filter_and_calculate_tco(p, s, main.get_finance_offers(p))))
+        for p, s in zip(profiles, semantic_results)
+    ])
+    require(any(priced), f"filter_and_calculate_tco kept no cars for any profile (n={n})")
+    tco["mean_cars"] = round(float(np.mean([len(c) for c in priced])), 2)
+    results.append(tco)
+    results.append(timed("filter_and_calculate_tco_batch", n, [
+        lambda: main.filter_and_calculate_tco_batch(profiles, semantic_results)
+    ]))
+    results.append(timed("endpoint_recommend", n, [
+        (lambda p=p: asyncio.run(main.recommend_cars(p, Response()))) for p in profiles
+    ]))
+
+    recommender._recommender = None
+    rec.close()
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> List[Dict]:
+    """So p50 với file kết quả trước; trả về các stage chậm hơn quá threshold (vd. 0.2 = 20%)."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["stage"], r["catalog_size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["stage"], r["catalog_size"]))
+        if not base or not base["p50_ms"]:
+            continue
+        delta = r["p50_ms"] / base["p50_ms"] - 1
+        print(f"  {r['stage']:<30} n={r['catalog_size']:>8} p50 {base['p50_ms']:.3f} -> {r['p50_ms']:.3f}ms ({delta:+.1%})")
+        if delta > threshold:
+            regressions.append({**r, "baseline_p50_ms": base["p50_ms"], "delta": round(delta, 4)})
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark từng stage của pipeline gợi ý xe")
+    parser.add_argument("--sizes", default="1000,10000", help="kích thước catalog, vd. 1000,100000,1000000")
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--vehicles", type=int, default=2000, help="số xe cho stage voucher/TCO")
+    parser.add_argument("--vouchers", type=int, default=200)
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/stages.json")
+    parser.add_argument("--baseline", default=None, help="file kết quả trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 chậm hơn bao nhiêu thì coi là regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure(work_dir, args.backend, args.dim)
+        results = []
+        for n in [int(v) for v in args.sizes.split(",")]:
+            for row in bench_size(n, args, work_dir):
+                results.append(row)
+                print(f"n={n:>8} {row['stage']:<30} calls={row['calls']:>5} "
+                      f"p50={row['p50_ms']:.3f}ms p99={row['p99_ms']:.3f}ms total={row['total_s']:.2f}s")
+
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+    meta = {
+        "commit": _git_commit(), "python": sys.version.split()[0], "platform": platform.platform(),
+        "backend": args.backend, "embedding": f"hashing-{args.dim}", "profiles": args.profiles, "seed": args.seed,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results, "regressions": regressions}, f, indent=2)
+    print(f"✅ Wrote {len(results)} rows -> {args.output}")
+    if regressions:
+        print(f"❌ {len(regressions)} stage(s) regressed more than {args.threshold:.0%}")
+        sys.exit(1)
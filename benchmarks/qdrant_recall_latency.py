@@ -0,0 +1,163 @@
+"""
+Benchmark recall@k và latency (p50/p99) của collection Qdrant theo các thiết lập HNSW / quantization / on_disk
+trên catalog tổng hợp, so với brute-force cosine (NumPy) làm ground truth.
+
+    python -m benchmarks.qdrant_recall_latency --url http://localhost:6333 --sizes 10000,100000,1000000
+    python -m benchmarks.qdrant_recall_latency --sizes 10000 --m 16,32 --ef 32,64,128 --quantization none,scalar,product
+
+Cần Qdrant server (--url): embedded Qdrant (--path/:memory:) không build HNSW nên mọi thiết lập đều là exact search.
+Vector được sinh theo từng chunk với seed cố định -> 1M xe không cần giữ toàn bộ ma trận trong RAM.
+"""
+import argparse
+import itertools
+import json
+import time
+from typing import Dict, Iterator, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, SearchParams
+
+from utils.qdrant_params import hnsw_config, quantization_config, search_params, vector_params
+
+COLLECTION = "cars_benchmark"
+CHUNK_SIZE = 10000
+
+
+def _parse_list(value: str, cast=str) -> List:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def synthetic_chunks(n: int, dim: int, seed: int = 0) -> Iterator[np.ndarray]:
+    """
+    Catalog tổng hợp có cụm (giống embedding thật: xe cùng hãng/dòng nằm gần nhau), đã chuẩn hoá L2.
+    Sinh lại được y hệt từ seed nên mỗi cấu hình index dùng cùng một catalog.
+    """
+    n_clusters = max(8, int(np.sqrt(n)))
+    centers = np.random.default_rng(seed).standard_normal((n_clusters, dim)).astype(np.float32)
+    for start in range(0, n, CHUNK_SIZE):
+        rng = np.random.default_rng(seed + 1 + start // CHUNK_SIZE)
+        size = min(CHUNK_SIZE, n - start)
+        vecs = centers[rng.integers(0, n_clusters, size)] + 0.35 * rng.standard_normal((size, dim)).astype(np.float32)
+        yield vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def synthetic_queries(n: int, dim: int, count: int, seed: int = 0) -> np.ndarray:
+    """Query = một xe ngẫu nhiên trong catalog + nhiễu (giống pref_text gần với mô tả xe)."""
+    rng = np.random.default_rng(seed + 10 ** 6)
+    picks = set(rng.choice(n, size=count, replace=False).tolist())
+    queries = []
+    for chunk_index, chunk in enumerate(synthetic_chunks(n, dim, seed)):
+        start = chunk_index * CHUNK_SIZE
+        rows = [i - start for i in picks if start <= i < start + len(chunk)]
+        queries.extend(chunk[rows])
+    queries = np.asarray(queries, dtype=np.float32)
+    queries += 0.2 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def brute_force_top_k(n: int, dim: int, queries: np.ndarray, k: int, seed: int = 0) -> np.ndarray:
+    """Top-k chính xác theo cosine, gộp dần theo chunk (argpartition) -> (Q, k) id."""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    for chunk_index, chunk in enumerate(synthetic_chunks(n, dim, seed)):
+        scores = queries @ chunk.T
+        ids = np.broadcast_to(np.arange(len(chunk)) + chunk_index * CHUNK_SIZE, scores.shape)
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, ids], axis=1)
+        keep = np.argpartition(-all_scores, min(k, all_scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, keep, axis=1)
+        best_ids = np.take_along_axis(all_ids, keep, axis=1)
+    return best_ids
+
+
+def build_collection(client: QdrantClient, n: int, dim: int, settings: Dict, seed: int = 0) -> float:
+    """Tạo collection theo settings, upload catalog, chờ index xong; trả về thời gian build (giây)."""
+    started = time.perf_counter()
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    client.create_collection(
+        collection_name=COLLECTION,
+        vectors_config=vector_params(dim, settings),
+        hnsw_config=hnsw_config(settings),
+        quantization_config=quantization_config(settings),
+    )
+    for chunk_index, chunk in enumerate(synthetic_chunks(n, dim, seed)):
+        offset = chunk_index * CHUNK_SIZE
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[PointStruct(id=offset + i, vector=v.tolist()) for i, v in enumerate(chunk)],
+            wait=False,
+        )
+    while client.get_collection(COLLECTION).status != "green":
+        time.sleep(0.5)
+    return time.perf_counter() - started
+
+
+def measure(client: QdrantClient, queries: np.ndarray, truth: np.ndarray, k: int, params) -> Dict[str, float]:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        hits = client.query_points(collection_name=COLLECTION, query=query.tolist(), limit=k, search_params=params).points
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({h.id for h in hits} & set(expected.tolist())) / k)
+    return {
+        "recall_at_k": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def run(args) -> List[Dict]:
+    client = QdrantClient(url=args.url) if args.url else QdrantClient(path=args.path or ":memory:")
+    results = []
+    for n in _parse_list(args.sizes, int):
+        queries = synthetic_queries(n, args.dim, args.queries, args.seed)
+        truth = brute_force_top_k(n, args.dim, queries, args.k, args.seed)
+        grid = itertools.product(
+            _parse_list(args.m, int), _parse_list(args.ef_construct, int),
+            _parse_list(args.quantization), _parse_list(args.on_disk, lambda v: v.lower() == "true"),
+        )
+        for m, ef_construct, quantization, on_disk in grid:
+            settings = {
+                "hnsw_m": m, "hnsw_ef_construct": ef_construct, "vectors_on_disk": on_disk,
+                "quantization": None if quantization == "none" else quantization,
+                "quantization_rescore": not args.no_rescore, "quantization_oversampling": args.oversampling,
+            }
+            build_seconds = build_collection(client, n, args.dim, settings, args.seed)
+            runs = [("exact", SearchParams(exact=True))] + [
+                (ef, search_params({**settings, "hnsw_ef_search": ef})) for ef in _parse_list(args.ef, int)
+            ]
+            for ef, params in runs:
+                row = {"catalog_size": n, "dim": args.dim, "k": args.k, **settings, "hnsw_ef_search": ef,
+                       "build_seconds": round(build_seconds, 2), **measure(client, queries, truth, args.k, params)}
+                results.append(row)
+                print(f"n={n:>8} m={m:<3} efc={ef_construct:<4} q={quantization:<8} disk={on_disk!s:<5} "
+                      f"ef={ef!s:<6} recall@{args.k}={row['recall_at_k']:.4f} "
+                      f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms")
+        client.delete_collection(COLLECTION)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark cho HNSW + quantization của Qdrant")
+    parser.add_argument("--url", default=None, help="Qdrant server, vd. http://localhost:6333")
+    parser.add_argument("--path", default=None, help="embedded Qdrant (chỉ exact search)")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--m", default="16,32")
+    parser.add_argument("--ef-construct", default="100,200")
+    parser.add_argument("--ef", default="32,64,128,256")
+    parser.add_argument("--quantization", default="none,scalar,product")
+    parser.add_argument("--on-disk", default="false", help="vd. false,true")
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--no-rescore", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/qdrant_recall_latency.json")
+    args = parser.parse_args()
+    rows = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    print(f"✅ Wrote {len(rows)} rows -> {args.output}")
@@ -0,0 +1,159 @@
+"""
+Đo cold start của một worker (mỗi lần chạy là một process Python mới):
+  - import_s: thời gian `import main`
+  - startup_s: lifespan của FastAPI (precompile TCO + warm-up recommender: đọc catalog, sync index)
+  - first_response_s: request /recommend đầu tiên (handler, không qua HTTP)
+  - process_s: từ lúc spawn process tới khi có response đầu tiên (gồm khởi động interpreter)
+  - heavy_modules: các dependency nặng đã bị nạp sau import / sau response đầu tiên
+
+    python -m benchmarks.startup --runs 5 --catalog 1000 --backend numpy
+    python -m benchmarks.startup --real --budget-seconds 3      # cấu hình thật của repo, fail nếu vượt budget
+    python -m benchmarks.startup --importtime                    # top module chậm nhất khi import main
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "langchain", "qdrant_client", "pandas", "openai"]
+
+
+def _loaded_heavy_modules() -> List[str]:
+    return [m for m in HEAVY_MODULES if m in sys.modules]
+
+
+def child(args) -> Dict:
+    """Chạy trong process con: import -> lifespan -> request đầu tiên."""
+    started = time.perf_counter()
+    import main
+    import_s = time.perf_counter() - started
+    after_import = _loaded_heavy_modules()
+
+    work_dir = None
+    if not args.real:
+        from benchmarks.pipeline_stages import configure
+        from benchmarks.synthetic import generate_profiles, write_dataset
+        from configs.recommender_config import RECOMMENDER_CONFIG
+        from utils import vehicle_repository
+        from utils.vehicle_repository import VehicleRepository
+
+        work_dir = tempfile.mkdtemp(prefix="startup-bench-")
+        configure(work_dir, args.backend, args.dim)
+        data = write_dataset(work_dir, args.catalog, seed=args.seed)
+        RECOMMENDER_CONFIG.update({
+            "csv_path": data["csv_path"],
+            "qdrant_path": os.path.join(work_dir, "qdrant_storage"),
+            "numpy_index_path": os.path.join(work_dir, "vector_index"),
+            "warmup_on_startup": True,
+        })
+        vehicle_repository._repository = VehicleRepository(data["vehicles_path"])
+        profile = generate_profiles(1, data["rows"], seed=args.seed)[0]
+    else:
+        from benchmarks.synthetic import generate_profiles, generate_catalog
+        profile = generate_profiles(1, generate_catalog(50, seed=args.seed), seed=args.seed)[0]
+
+    async def serve_first_request():
+        from fastapi import Response
+        lifespan_started = time.perf_counter()
+        async with main.lifespan(main.app):
+            startup_s = time.perf_counter() - lifespan_started
+            request_started = time.perf_counter()
+            await main.recommend_cars(profile, Response())
+            first_response_s = time.perf_counter() - request_started
+        return startup_s, first_response_s
+
+    startup_s, first_response_s = asyncio.run(serve_first_request())
+    return {
+        "import_s": round(import_s, 4),
+        "startup_s": round(startup_s, 4),
+        "first_response_s": round(first_response_s, 4),
+        "heavy_modules_after_import": after_import,
+        "heavy_modules_after_first_response": _loaded_heavy_modules(),
+        "work_dir": work_dir,
+    }
+
+
+def run_once(args) -> Dict:
+    cmd = [sys.executable, "-m", "benchmarks.startup", "--child",
+           "--catalog", str(args.catalog), "--backend", args.backend, "--dim", str(args.dim), "--seed", str(args.seed)]
+    if args.real:
+        cmd.append("--real")
+    started = time.perf_counter()
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    process_s = time.perf_counter() - started
+    result = json.loads(out.strip().splitlines()[-1])
+    work_dir = result.pop("work_dir")
+    if work_dir:
+        # Thư mục tạm của process con (dữ liệu tổng hợp + index)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result["process_s"] = round(process_s, 4)
+    return result
+
+
+def import_profile(top: int = 15) -> List[Dict]:
+    """`python -X importtime -c "import main"` -> các module có thời gian import (cumulative) lớn nhất."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                         check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        # "import time:       123 |        456 |   module"
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3:
+            continue
+        self_us, cumulative_us = parts[0].split(":", 1)[1].strip(), parts[1].strip()
+        if not (self_us.isdigit() and cumulative_us.isdigit()):
+            continue
+        rows.append({"module": parts[2].strip(), "self_ms": int(self_us) / 1000,
+                     "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động worker + response đầu tiên")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--catalog", type=int, default=1000, help="số xe của catalog tổng hợp")
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real", action="store_true", help="dùng RECOMMENDER_CONFIG và dữ liệu thật của repo")
+    parser.add_argument("--budget-seconds", type=float, default=None,
+                        help="median process_s vượt budget thì exit 1 (dùng trong CI)")
+    parser.add_argument("--importtime", action="store_true", help="in top module chậm nhất khi import main")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args)))
+        sys.exit(0)
+
+    if args.importtime:
+        for row in import_profile():
+            print(f"  {row['module']:<50} cumulative={row['cumulative_ms']:>9.1f}ms self={row['self_ms']:>8.1f}ms")
+
+    runs = []
+    for i in range(args.runs):
+        runs.append(run_once(args))
+        r = runs[-1]
+        print(f"run {i + 1}: import={r['import_s']:.3f}s startup={r['startup_s']:.3f}s "
+              f"first_response={r['first_response_s']:.3f}s process={r['process_s']:.3f}s "
+              f"heavy={','.join(r['heavy_modules_after_first_response']) or '-'}")
+    summary = {
+        key: round(statistics.median(r[key] for r in runs), 4)
+        for key in ("import_s", "startup_s", "first_response_s", "process_s")
+    }
+    print(f"median: {summary}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, indent=2)
+
+    if args.budget_seconds is not None and summary["process_s"] > args.budget_seconds:
+        print(f"❌ time-to-first-response {summary['process_s']:.2f}s exceeds budget {args.budget_seconds:.2f}s")
+        sys.exit(1)
@@ -0,0 +1,157 @@
+"""
+Sinh dữ liệu tổng hợp cùng shape với data/vehicle_raw_vector_db.csv, data/vehicles.json, data/vouchers.json
+và Profile, tất định theo seed (dùng cho benchmarks/pipeline_stages.py).
+"""
+import csv
+import json
+import os
+import random
+from datetime import date
+from typing import Dict, List
+
+from configs.recommender_config import RECOMMENDER_CONFIG
+from configs.region_expense_config import REGION_CONFIG
+from models.finance import Finance
+from models.profile import Profile
+
+TEMPLATE_CSV = "data/vehicle_raw_vector_db.csv"
+FUEL_TYPES = {"Electric": "EV", "Hybrid": "Hybrid", "Diesel": "Gasoline", "Gasoline": "Gasoline"}
+ENVIRONMENTS = ["Urban", "Suburban", "Urban/Suburban", "Rural", "Highway", "Off-road"]
+USE_CASES = ["Fuel efficiency, daily commute", "Family trips, long drives", "Towing, work",
+             "Weekend adventures", "Luxury, business", "First car, budget"]
+HABITS = ["daily commute", "family trips", "long drives", "off-road", "city driving", "weekend adventures"]
+CAMPAIGNS = ["", "clearance sale", "ev week", "year end", "new arrivals"]
+MEMBER_LEVELS = ["regular", "silver", "gold", "platinum"]
+COLORS = ["White", "Black", "Silver", "Red", "Blue", "Gray"]
+
+
+def _templates() -> List[Dict[str, str]]:
+    """(Make, Model, BodyType, EngineType) có thật trong catalog mẫu; làm khung cho xe tổng hợp."""
+    with open(TEMPLATE_CSV, "r", encoding="utf-8") as f:
+        seen = {}
+        for row in csv.DictReader(f):
+            key = (row["Make"], row["Model"])
+            seen.setdefault(key, {k: row[k].strip() for k in ("Make", "Model", "BodyType", "EngineType")})
+    return list(seen.values())
+
+
+def generate_catalog(n: int, seed: int = 0) -> List[Dict]:
+    """n dòng catalog (các cột như vehicle_raw_vector_db.csv), kèm base_price để sinh vehicles.json."""
+    rng = random.Random(seed)
+    templates = _templates()
+    rows = []
+    for i in range(n):
+        t = rng.choice(templates)
+        year = rng.choice([2023, 2024, 2025, 2026])
+        trim = f"T{i % 997}"
+        price = rng.randrange(18000, 90000, 500)
+        horsepower = rng.randrange(110, 520, 5)
+        env, use_case = rng.choice(ENVIRONMENTS), rng.choice(USE_CASES)
+        rows.append({
+            "Year": year, "Make": t["Make"], "Model": t["Model"], "Trim": trim,
+            "BodyType": t["BodyType"], "EngineType": t["EngineType"], "HorsePower": horsepower,
+            "DrivingEnvironment": env, "UseCase": use_case,
+            "Description": (f"{t['Make']} {t['Model']} {trim} {year} is a {t['EngineType'].lower()} "
+                            f"{t['BodyType'].lower()} for {use_case.lower()}. Priced around ${price:,} "
+                            f"with {horsepower} horsepower."),
+            "Zip": f"{rng.randrange(10000, 99999)}",
+            "base_price": price,
+        })
+    return rows
+
+
+def vehicles_from_catalog(rows: List[Dict], seed: int = 0) -> List[Dict]:
+    """Một xe (vehicles.json) cho mỗi identity Year/Make/Model/Trim của catalog."""
+    rng = random.Random(seed + 1)
+    vehicles, seen = [], set()
+    for r in rows:
+        key = (r["Year"], r["Make"], r["Model"], r["Trim"])
+        if key in seen:
+            continue
+        seen.add(key)
+        fuel_type = FUEL_TYPES.get(r["EngineType"], "Gasoline")
+        mpg = None if fuel_type == "EV" else rng.randrange(18, 55)
+        kwh = round(rng.uniform(0.22, 0.4), 2) if fuel_type == "EV" else None
+        vehicles.append({
+            "make": r["Make"], "model": r["Model"], "trim": r["Trim"], "year": r["Year"],
+            "color": rng.choice(COLORS), "base_price": r["base_price"], "fuel_type": fuel_type,
+            "fuel_efficiency": kwh if fuel_type == "EV" else mpg, "mpg": mpg, "kwh_per_mile": kwh,
+            "transmission": "Automatic", "body_type": r["BodyType"], "seats": 5, "drivetrain": "FWD",
+            "description": r["Description"],
+        })
+    return vehicles
+
+
+def generate_vouchers(n: int, rows: List[Dict], seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed + 2)
+    vouchers = []
+    for i in range(n):
+        r = rng.choice(rows)
+        kind = rng.choices(["discount", "free_maintenance", "low_interest"], weights=[4, 2, 1])[0]
+        vouchers.append({
+            "id": f"VOUCHER{i:06d}", "title": f"Ưu đãi {r['Make']} {r['Model']}", "description": "",
+            "conditions_apply_text": "", "valid_until": f"{rng.choice([2025, 2026, 2027])}-12-31",
+            "type": kind, "value": rng.randrange(500, 4000, 250) if kind == "discount" else 1,
+            "applicable_makes": [r["Make"]],
+            "applicable_models": [r["Model"]] if rng.random() < 0.7 else [],
+            "applicable_years": [r["Year"]] if rng.random() < 0.5 else [],
+            "excluded_trims": [], "member_levels": rng.sample(MEMBER_LEVELS[1:], rng.randint(1, 3)),
+            "min_vehicle_price": rng.choice([0, 15000, 25000]),
+        })
+    return vouchers
+
+
+def generate_profiles(n: int, rows: List[Dict], seed: int = 0) -> List[Profile]:
+    """
+    Profile dựng quanh một xe "anchor" có thật trong catalog: ngân sách gần giá xe (bộ lọc giá ±2300$),
+    engine_type và xe mới/cũ khớp với anchor (ràng buộc cứng), hãng luôn gồm hãng của anchor.
+    Body type / hãng khác được trộn ngẫu nhiên (filter mềm, recommender tự nới) -> mọi profile đều có xe.
+    """
+    rng = random.Random(seed + 3)
+    makes = sorted({r["Make"] for r in rows})
+    body_types = sorted({r["BodyType"] for r in rows})
+    newest_used_year = date.today().year - RECOMMENDER_CONFIG["new_car_max_age_years"] - 1
+    profiles = []
+    for _ in range(n):
+        anchor = rng.choice(rows)
+        condition = "new" if anchor["Year"] > newest_used_year else "used"
+        profiles.append(Profile(
+            state=rng.choice(list(REGION_CONFIG)),
+            zip=anchor["Zip"],
+            finance=Finance(
+                payment_method=rng.choice(["cash", "loan", "lease"]),
+                cash_budget=float(anchor["base_price"] + rng.randrange(-2000, 2000, 100)),
+                monthly_capacity=float(rng.randrange(300, 1500, 50)),
+            ),
+            habit=rng.choice(HABITS),
+            annual_mileage=rng.randrange(6000, 25000, 1000),
+            parking=rng.choice(ENVIRONMENTS),
+            brand_preference=list(dict.fromkeys([anchor["Make"]] + rng.sample(makes, rng.randint(0, 2)))),
+            body_type=[anchor["BodyType"]] if rng.random() < 0.7 else rng.sample(body_types, 1),
+            engine_type=anchor["EngineType"],
+            car_condition_preference=rng.choice([condition, "both"]),
+            memberLevel=rng.choice(MEMBER_LEVELS),
+            campaign=rng.choice(CAMPAIGNS),
+        ))
+    return profiles
+
+
+def write_dataset(out_dir: str, n: int, n_vouchers: int = 200, seed: int = 0) -> Dict[str, str]:
+    """Ghi catalog CSV + vehicles.json + vouchers.json vào out_dir; trả về đường dẫn và rows."""
+    os.makedirs(out_dir, exist_ok=True)
+    rows = generate_catalog(n, seed)
+    paths = {
+        "csv_path": os.path.join(out_dir, "vehicle_raw_vector_db.csv"),
+        "vehicles_path": os.path.join(out_dir, "vehicles.json"),
+        "vouchers_path": os.path.join(out_dir, "vouchers.json"),
+    }
+    columns = [c for c in rows[0] if c != "base_price"]
+    with open(paths["csv_path"], "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(paths["vehicles_path"], "w", encoding="utf-8") as f:
+        json.dump(vehicles_from_catalog(rows, seed), f, ensure_ascii=False)
+    with open(paths["vouchers_path"], "w", encoding="utf-8") as f:
+        json.dump(generate_vouchers(n_vouchers, rows, seed), f, ensure_ascii=False)
+    return {**paths, "rows": rows}
@@ -0,0 +1,148 @@
+"""
+So sánh hai backend retrieval của HybridCarRecommender trên catalog tổng hợp:
+  - embedded Qdrant (QdrantClient(path=...), named vectors retrieval/personal)
+  - NumpyVectorIndex (ma trận mmap + argpartition + boolean mask)
+Đo thời gian build, p50/p99 latency cho query không filter, có filter (MatchAny + range) và search_batch.
+
+    python -m benchmarks.vector_backend --sizes 1000,5000,20000 --dim 1536
+"""
+import argparse
+import json
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, QueryRequest
+
+from benchmarks.qdrant_recall_latency import CHUNK_SIZE, synthetic_chunks, synthetic_queries
+from recommender import HybridCarRecommender, PERSONAL_VECTOR, RETRIEVAL_VECTOR
+from utils.numpy_index import NumpyVectorIndex
+from utils.qdrant_params import vector_params
+
+COLLECTION = "cars_backend_benchmark"
+MAKES = ["toyota", "honda", "ford", "bmw", "tesla", "kia", "hyundai", "subaru", "jeep", "chevrolet"]
+FILTERS = {"MakeKey": ["toyota", "honda", "kia"], "PriceUSD": {"gte": 20000, "lte": 35000, "allow_missing": True}}
+
+
+def synthetic_points(n: int, dim: int, seed: int = 0):
+    """(id, payload, retrieval_vec, personal_vec) theo chunk; personal = retrieval xáo trộn chiều."""
+    rng = np.random.default_rng(seed + 7)
+    for chunk_index, chunk in enumerate(synthetic_chunks(n, dim, seed)):
+        personal = np.roll(chunk, 1, axis=1)
+        for i, (vec, pvec) in enumerate(zip(chunk, personal)):
+            row = chunk_index * CHUNK_SIZE + i
+            payload = {"MakeKey": MAKES[rng.integers(len(MAKES))]}
+            if rng.random() < 0.9:
+                payload["PriceUSD"] = float(rng.integers(15000, 80000))
+            yield str(uuid.uuid5(uuid.NAMESPACE_OID, str(row))), payload, vec, pvec
+
+
+def _latency(fn, queries) -> Dict[str, float]:
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}
+
+
+def bench_numpy(n: int, dim: int, queries: np.ndarray, k: int, dtype: str, seed: int) -> Dict:
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        index = NumpyVectorIndex(path, dim, dtype)
+        index.upsert(list(synthetic_points(n, dim, seed)))
+        index.commit()
+        build = time.perf_counter() - started
+        qlist = [q.tolist() for q in queries]
+        return {
+            "backend": f"numpy-{dtype}",
+            "build_seconds": round(build, 2),
+            "unfiltered": _latency(lambda q: index.search(q, k), qlist),
+            "filtered": _latency(lambda q: index.search(q, k, FILTERS), qlist),
+            "batch_ms_per_query": _batch_ms(lambda: index.search_batch(qlist, k), len(qlist)),
+        }
+
+
+def bench_qdrant(n: int, dim: int, queries: np.ndarray, k: int, seed: int) -> Dict:
+    with tempfile.TemporaryDirectory() as path:
+        client = QdrantClient(path=path)
+        started = time.perf_counter()
+        client.create_collection(
+            collection_name=COLLECTION,
+            vectors_config={RETRIEVAL_VECTOR: vector_params(dim, {}), PERSONAL_VECTOR: vector_params(dim, {})},
+        )
+        batch = []
+        for pid, payload, vec, pvec in synthetic_points(n, dim, seed):
+            batch.append(PointStruct(id=pid, payload=payload,
+                                     vector={RETRIEVAL_VECTOR: vec.tolist(), PERSONAL_VECTOR: pvec.tolist()}))
+            if len(batch) == 1000:
+                client.upsert(collection_name=COLLECTION, points=batch)
+                batch = []
+        if batch:
+            client.upsert(collection_name=COLLECTION, points=batch)
+        build = time.perf_counter() - started
+        qlist = [q.tolist() for q in queries]
+        query_filter = HybridCarRecommender._build_filter(FILTERS)
+
+        def search(q, f=None):
+            return client.query_points(collection_name=COLLECTION, query=q, using=RETRIEVAL_VECTOR,
+                                       limit=k, query_filter=f, with_vectors=[PERSONAL_VECTOR]).points
+
+        def search_batch():
+            return client.query_batch_points(collection_name=COLLECTION, requests=[
+                QueryRequest(query=q, using=RETRIEVAL_VECTOR, limit=k,
+                             with_payload=True, with_vector=[PERSONAL_VECTOR])
+                for q in qlist
+            ])
+
+        result = {
+            "backend": "qdrant-embedded",
+            "build_seconds": round(build, 2),
+            "unfiltered": _latency(search, qlist),
+            "filtered": _latency(lambda q: search(q, query_filter), qlist),
+            "batch_ms_per_query": _batch_ms(search_batch, len(qlist)),
+        }
+        client.close()
+        return result
+
+
+def _batch_ms(fn, count: int) -> float:
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000 / max(count, 1)
+
+
+def run(args) -> List[Dict]:
+    results = []
+    for n in [int(v) for v in args.sizes.split(",")]:
+        queries = synthetic_queries(n, args.dim, min(args.queries, n), args.seed)
+        rows = [bench_numpy(n, args.dim, queries, args.k, dtype, args.seed) for dtype in args.dtypes.split(",")]
+        if not args.skip_qdrant:
+            rows.append(bench_qdrant(n, args.dim, queries, args.k, args.seed))
+        for row in rows:
+            row.update({"catalog_size": n, "dim": args.dim, "k": args.k})
+            print(f"n={n:>7} {row['backend']:<16} build={row['build_seconds']:>6.2f}s "
+                  f"p50={row['unfiltered']['p50_ms']:.2f}ms p99={row['unfiltered']['p99_ms']:.2f}ms "
+                  f"filtered p50={row['filtered']['p50_ms']:.2f}ms batch={row['batch_ms_per_query']:.3f}ms/q")
+        results.extend(rows)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NumpyVectorIndex vs embedded Qdrant")
+    parser.add_argument("--sizes", default="1000,5000,20000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--dtypes", default="float32,float16")
+    parser.add_argument("--skip-qdrant", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/vector_backend.json")
+    args = parser.parse_args()
+    rows = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    print(f"✅ Wrote {len(rows)} rows -> {args.output}")
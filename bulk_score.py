@@ -0,0 +1,244 @@
+"""
+Bulk scoring offline: đọc Profile từ JSONL/CSV theo luồng, chạy semantic search + voucher/TCO
+và ghi kết quả dần ra JSONL hoặc Parquet, có checkpoint để chạy tiếp khi bị dừng giữa chừng.
+
+    python bulk_score.py profiles.jsonl results.jsonl
+    python bulk_score.py profiles.csv results_parquet/ --format parquet --workers 8
+
+--format parquet cần thêm pyarrow (dependency tuỳ chọn, không nằm trong requirements.txt: pip install pyarrow).
+Semantic search chạy trong process chính theo từng chunk (embedding batch + Qdrant search_batch,
+embedded Qdrant chỉ cho một process mở storage); voucher + TCO chạy trên process pool.
+"""
+import argparse
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dacite import Config, from_dict
+
+from models.profile import Profile
+
+LIST_FIELDS = {"colors", "brand_preference", "body_type", "features"}
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+DACITE_CONFIG = Config(type_hooks={int: int, float: float, bool: _parse_bool})
+
+
+def _csv_record(row: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Dòng CSV phẳng -> dict lồng nhau cho Profile: cột "finance.cash_budget" -> finance.cash_budget,
+    cột danh sách (brand_preference, body_type, ...) phân tách bằng "|".
+    """
+    record: Dict[str, Any] = {}
+    for key, value in row.items():
+        if value is None or value == "":
+            continue
+        if key in LIST_FIELDS:
+            value = [v.strip() for v in value.split("|") if v.strip()]
+        target = record
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return record
+
+
+def iter_profiles(path: str, skip: int = 0) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (index, Profile) theo luồng; profile không parse được yield (index, Exception).
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            rows, parse = csv.DictReader(f), _csv_record
+        else:
+            rows, parse = (line for line in f if line.strip()), json.loads
+        for index, row in enumerate(rows):
+            if index < skip:
+                continue
+            # Parse trong try: một dòng JSON hỏng chỉ thành lỗi của profile đó, không dừng cả lần chạy
+            try:
+                profile = from_dict(data_class=Profile, data=parse(row), config=DACITE_CONFIG)
+            except Exception as e:
+                yield index, e
+                continue
+            yield index, profile
+
+
+def _score_chunk(items: List[Tuple[int, Profile, Dict[str, Any]]]) -> List[str]:
+    """Worker: voucher + TCO cho một chunk, trả về các dòng JSON đã encode."""
+    from fastapi.encoders import jsonable_encoder
+    from main import score_profiles
+    if not items:
+        return []
+    indices, profiles, semantic_results = (list(column) for column in zip(*items))
+    return [
+        json.dumps(jsonable_encoder(result), ensure_ascii=False)
+        for result in score_profiles(indices, profiles, semantic_results)
+    ]
+
+
+class Checkpoint:
+    """
+    Checkpoint
+    Lưu số profile đã ghi xong (và offset file JSONL) cạnh file output; ghi bằng os.replace
+    để không bao giờ còn checkpoint dở dang.
+    """
+
+    def __init__(self, output: str):
+        self.path = output.rstrip("/") + ".ckpt.json"
+        self.processed = 0
+        self.offset = 0
+        self.parts = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.processed = state.get("processed", 0)
+            self.offset = state.get("offset", 0)
+            self.parts = state.get("parts", 0)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"processed": self.processed, "offset": self.offset, "parts": self.parts}, f)
+        os.replace(tmp, self.path)
+
+
+class JsonlWriter:
+    def __init__(self, output: str, checkpoint: Checkpoint):
+        self.checkpoint = checkpoint
+        mode = "r+" if os.path.exists(output) and checkpoint.processed else "w"
+        self._f = open(output, mode, encoding="utf-8")
+        # Bỏ phần ghi dở sau checkpoint cuối cùng
+        self._f.seek(checkpoint.offset)
+        self._f.truncate()
+
+    def write(self, lines: List[str]):
+        if lines:
+            self._f.write("\n".join(lines) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.checkpoint.offset = self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+
+class ParquetWriter:
+    """Mỗi chunk một file part-XXXXXX.parquet trong thư mục output (resume = thêm part mới)."""
+
+    def __init__(self, output: str, checkpoint: Checkpoint):
+        try:
+            import pyarrow  # noqa: F401  (báo lỗi sớm nếu thiếu pyarrow)
+        except ImportError as e:
+            raise ImportError("--format parquet cần pyarrow (pip install pyarrow)") from e
+        self.output = output
+        self.checkpoint = checkpoint
+        os.makedirs(output, exist_ok=True)
+
+    def write(self, lines: List[str]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        rows = [json.loads(line) for line in lines]
+        table = pa.table({
+            "index": [r["index"] for r in rows],
+            "status": [r["status"] for r in rows],
+            "error": [r.get("error") for r in rows],
+            "result": [json.dumps(r["result"], ensure_ascii=False) if "result" in r else None for r in rows],
+        })
+        pq.write_table(table, os.path.join(self.output, f"part-{self.checkpoint.parts:06d}.parquet"))
+        self.checkpoint.parts += 1
+
+    def close(self):
+        pass
+
+
+def _chunks(iterator, size: int):
+    chunk = []
+    for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(input_path: str, output: str, fmt: str = "jsonl", chunk_size: int = 256,
+        workers: int = None, resume: bool = True) -> int:
+    """Chạy bulk scoring; trả về tổng số profile đã ghi (kể cả phần đã có từ checkpoint)."""
+    from main import semantic_search_batch
+    from configs.recommender_config import RECOMMENDER_CONFIG
+
+    checkpoint = Checkpoint(output)
+    if not resume:
+        checkpoint.processed = checkpoint.offset = checkpoint.parts = 0
+    writer = ParquetWriter(output, checkpoint) if fmt == "parquet" else JsonlWriter(output, checkpoint)
+    workers = workers or os.cpu_count() or 1
+    use_mock = RECOMMENDER_CONFIG["use_mock_semantic_search"]
+
+    def finish(future, count):
+        writer.write(future.result())
+        checkpoint.processed += count
+        checkpoint.save()
+        print(f"  … scored {checkpoint.processed} profiles")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for chunk in _chunks(iter_profiles(input_path, skip=checkpoint.processed), chunk_size):
+                valid = [(i, p) for i, p in chunk if isinstance(p, Profile)]
+                # Chạy offline: không ai gọi /recommend/{id}/explain cho kết quả này -> không lưu explanation
+                semantic_results = semantic_search_batch(
+                    [p for _, p in valid], useMock=use_mock, store_explanations=False
+                )
+                semantic_of = {i: r for (i, _), r in zip(valid, semantic_results)}
+                items, errors = [], []
+                for i, p in chunk:
+                    result = p if not isinstance(p, Profile) else semantic_of[i]
+                    if isinstance(result, Exception):
+                        errors.append((i, result))
+                    else:
+                        items.append((i, p, result))
+                # Profile/semantic lỗi không cần sang worker; ghi kèm chunk để giữ thứ tự checkpoint
+                future = pool.submit(_score_chunk, items)
+                in_flight.append((future, len(chunk), errors))
+                while len(in_flight) > 2 * workers:
+                    _drain(in_flight.popleft(), writer, finish)
+            while in_flight:
+                _drain(in_flight.popleft(), writer, finish)
+    finally:
+        writer.close()
+    return checkpoint.processed
+
+
+def _drain(entry, writer, finish):
+    future, count, errors = entry
+    if errors:
+        writer.write([
+            json.dumps({"index": i, "status": "error", "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False)
+            for i, e in errors
+        ])
+    finish(future, count)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-score Profile records offline")
+    parser.add_argument("input", help="file .jsonl hoặc .csv chứa Profile")
+    parser.add_argument("output", help="file .jsonl hoặc thư mục Parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="mặc định = số core")
+    parser.add_argument("--no-resume", action="store_true", help="bỏ qua checkpoint, chạy lại từ đầu")
+    args = parser.parse_args()
+    total = run(args.input, args.output, fmt=args.format, chunk_size=args.chunk_size,
+                workers=args.workers, resume=not args.no_resume)
+    print(f"✅ Scored {total} profiles -> {args.output}")
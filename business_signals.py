@@ -1,34 +1,120 @@
-import pandas as pd
+import os
+import threading
+from typing import TYPE_CHECKING
 import numpy as np
+from utils.rerank_utils import static_business_score
 
-def attach_business_signals(df: pd.DataFrame) -> pd.DataFrame:
+if TYPE_CHECKING:
+    import pandas as pd
+
+SIGNAL_KEYS = ["Year", "Make", "Model", "Trim", "Zip"]
+SIGNAL_COLUMNS = ["marginUSD", "inventory_days", "brand_priority"]
+
+# Giá trị mặc định theo nhãn hàng khi xe chưa có trong nguồn tín hiệu kinh doanh
+DEFAULT_MARGIN = {
+    "Toyota": 3800, "Honda": 3600, "Tesla": 5500, "Ford": 4200,
+    "Chevrolet": 3200, "Jeep": 4000, "BMW": 7000, "Subaru": 3500,
+    "Hyundai": 3000, "Kia": 2900
+}
+DEFAULT_BRAND_PRIORITY = {
+    "Toyota": 0.7, "Honda": 0.6, "Tesla": 0.5, "Ford": 0.55,
+    "Chevrolet": 0.5, "Jeep": 0.55, "BMW": 0.4, "Subaru": 0.5,
+    "Hyundai": 0.45, "Kia": 0.45
+}
+DEFAULT_INVENTORY_DAYS = 28
+
+
+def load_business_signals(path: str) -> "pd.DataFrame":
+    """
+    Đọc tín hiệu kinh doanh (marginUSD, inventory_days, brand_priority) theo từng xe
+    từ file CSV (export từ DMS/ERP). Trả về DataFrame rỗng nếu file không tồn tại.
     """
-    Gắn thêm tín hiệu kinh doanh nếu thiếu:
-      - marginUSD: lợi nhuận/xe (mock theo phân khúc/brand)
+    import pandas as pd
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(columns=SIGNAL_KEYS + SIGNAL_COLUMNS)
+    signals = pd.read_csv(path)
+    return signals.drop_duplicates(subset=SIGNAL_KEYS, keep="last")
+
+
+def attach_business_signals(df: "pd.DataFrame", signals: "pd.DataFrame" = None) -> "pd.DataFrame":
+    """
+    Gắn tín hiệu kinh doanh cho catalog:
+      - marginUSD: lợi nhuận/xe
       - inventory_days: số ngày tồn kho
       - brand_priority: mức ưu tiên nhãn hàng (0..1)
-    Bạn có thể thay bằng dữ liệu thật nếu có.
+      - biz_static: phần business score cố định theo xe (tính sẵn, lưu vào payload Qdrant)
+    Ưu tiên giá trị trong `signals`, sau đó tới cột có sẵn trong catalog, cuối cùng là mặc định
+    theo nhãn hàng (tất định, không random -> điểm không đổi giữa các lần khởi động).
     """
     df = df.copy()
 
+    if signals is not None and len(signals):
+        renamed = {c: f"{c}__signal" for c in SIGNAL_COLUMNS}
+        df = df.merge(signals[SIGNAL_KEYS + SIGNAL_COLUMNS].rename(columns=renamed), on=SIGNAL_KEYS, how="left")
+        for col, sig_col in renamed.items():
+            sig = df.pop(sig_col)
+            df[col] = sig.combine_first(df[col]) if col in df.columns else sig
+
     if "marginUSD" not in df.columns:
-        base = {
-            "Toyota": 3800, "Honda": 3600, "Tesla": 5500, "Ford": 4200,
-            "Chevrolet": 3200, "Jeep": 4000, "BMW": 7000, "Subaru": 3500,
-            "Hyundai": 3000, "Kia": 2900
-        }
-        df["marginUSD"] = df["Make"].map(base).fillna(3000) + np.random.randint(-500, 500, size=len(df))
+        df["marginUSD"] = np.nan
+    df["marginUSD"] = df["marginUSD"].fillna(df["Make"].map(DEFAULT_MARGIN)).fillna(3000)
 
     if "inventory_days" not in df.columns:
-        # Giả lập: xe phổ thông tồn kho lâu hơn xe hot
-        df["inventory_days"] = np.clip(np.random.normal(loc=28, scale=10, size=len(df)).astype(int), 3, 90)
+        df["inventory_days"] = np.nan
+    df["inventory_days"] = df["inventory_days"].fillna(DEFAULT_INVENTORY_DAYS).astype(int)
 
     if "brand_priority" not in df.columns:
-        brand_boost = {
-            "Toyota": 0.7, "Honda": 0.6, "Tesla": 0.5, "Ford": 0.55,
-            "Chevrolet": 0.5, "Jeep": 0.55, "BMW": 0.4, "Subaru": 0.5,
-            "Hyundai": 0.45, "Kia": 0.45
-        }
-        df["brand_priority"] = df["Make"].map(brand_boost).fillna(0.4)
+        df["brand_priority"] = np.nan
+    df["brand_priority"] = df["brand_priority"].fillna(df["Make"].map(DEFAULT_BRAND_PRIORITY)).fillna(0.4)
 
+    df["biz_static"] = static_business_score(
+        df["marginUSD"].to_numpy(dtype=float),
+        df["inventory_days"].to_numpy(dtype=float),
+        df["brand_priority"].to_numpy(dtype=float),
+    )
     return df
+
+
+class BusinessSignalRefresher:
+    """
+    BusinessSignalRefresher
+    Thread nền theo dõi file tín hiệu kinh doanh (mtime); khi file đổi thì đọc lại và gọi
+    `on_change(signals)` để recommender cập nhật các xe có margin/tồn kho thay đổi.
+    """
+
+    def __init__(self, path: str, on_change, interval_seconds: float = 60):
+        self.path = path
+        self.on_change = on_change
+        self.interval_seconds = interval_seconds
+        self._mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="business-signal-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds)
+            self._thread = None
+
+    def check(self) -> bool:
+        """Đọc lại tín hiệu nếu file đã đổi; trả về True nếu đã gọi on_change."""
+        if not os.path.exists(self.path):
+            return False
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        self.on_change(load_business_signals(self.path))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ Business signal refresh failed: {e}")
@@ -0,0 +1,64 @@
+# configs/recommender_config.py
+# Cấu hình cho HybridCarRecommender (catalog, Qdrant, vòng đời service)
+
+RECOMMENDER_CONFIG = {
+    "csv_path": "data/vehicle_raw_vector_db.csv",
+    "qdrant_path": "./qdrant_storage",
+    "qdrant_url": None,  # vd. "http://localhost:6333"; None = embedded Qdrant tại qdrant_path
+    "collection_name": "cars",
+    # Backend vector: "qdrant" | "numpy" (exact search trong process, ma trận mmap; hợp với catalog vài nghìn xe)
+    "vector_backend": "qdrant",
+    "numpy_index_path": "./vector_index",
+    "numpy_index_dtype": "float32",  # "float16" = nửa RAM/đĩa, score lệch ~1e-3
+    # Index của collection (xem benchmarks/qdrant_recall_latency.py để chọn theo kích thước catalog)
+    "hnsw_m": 16,
+    "hnsw_ef_construct": 100,
+    "hnsw_ef_search": None,  # None = mặc định của Qdrant; tăng để recall cao hơn, đổi lại latency
+    "vectors_on_disk": False,  # True = vector gốc mmap trên đĩa (catalog lớn, RAM ít)
+    "quantization": None,  # None | "scalar" (int8) | "product" (PQ x16)
+    "quantization_always_ram": True,
+    "quantization_rescore": True,  # chấm lại top ứng viên bằng vector gốc
+    "quantization_oversampling": 2.0,
+    "top_k": 15,
+    "top_n": 5,  # số xe gợi ý trả về sau rerank
+    "use_mock_semantic_search": True,  # /recommend dùng danh sách xe mock thay vì HybridCarRecommender
+    # Lọc trước trong Qdrant theo Profile (ngân sách, body type, hãng, loại động cơ, xe mới/cũ)
+    "prefilter_from_profile": True,
+    "new_car_max_age_years": 1,  # model year >= năm hiện tại - 1 được coi là xe mới
+    # Filter có kết quả < top_k -> nới dần filter mềm (bỏ hãng trước, rồi kiểu thân xe) và search lại
+    "relax_soft_filters": True,
+    # Cache response của /recommend theo profile (LRU + TTL), tự invalidate khi catalog/voucher/tín hiệu/REGION_CONFIG đổi
+    "response_cache_enabled": True,
+    "response_cache_entries": 10000,
+    "response_cache_ttl_seconds": 300,
+    # Explanation: rerank chỉ ghi contributions dạng số; reasons render khi cần (xe trả về / explain)
+    "deferred_explanations": True,
+    "explain_store_enabled": True,  # lưu kết quả theo recommendation_id cho GET /recommend/{id}/explain
+    "explain_store_entries": 10000,
+    "explain_ttl_seconds": 900,  # nên >= response_cache_ttl_seconds để id trong response cache còn explain được
+    "timing_headers": False,  # thêm header Server-Timing (ms từng stage) vào response của /recommend
+    "warmup_on_startup": True,  # tạo recommender ngay khi FastAPI khởi động (bỏ qua khi use_mock_semantic_search)
+    # Tín hiệu kinh doanh (margin, tồn kho, brand priority) theo xe + chu kỳ refresh nền (0 = tắt)
+    "business_signals_path": "data/business_signals.csv",
+    "business_signals_refresh_seconds": 60,
+    "sync_batch_size": 256,  # số point mỗi lần upsert/delete/scroll khi sync catalog -> Qdrant
+    # Ingest: số xe mỗi request embedding, số batch chạy song song, retry khi API lỗi/rate limit
+    "ingest_batch_size": 64,
+    "ingest_concurrency": 4,
+    "embedding_max_retries": 5,
+    "embedding_backoff_seconds": 0.5,  # backoff luỹ thừa: 0.5s, 1s, 2s, ...
+    # Embed query trong lúc xử lý request: ít retry, backoff ngắn (chờ thêm tối đa 0.25s)
+    "embedding_request_max_retries": 1,
+    "embedding_request_backoff_seconds": 0.25,
+    # Embedding backend: "openai" | "sentence-transformers" (local, CPU) | "hashing" (stub tất định cho test)
+    "embedding_provider": "openai",
+    "embedding_model": "text-embedding-ada-002",  # vd. "all-MiniLM-L6-v2" cho sentence-transformers
+    "embedding_dim": None,  # None = theo model (ada-002: 1536); text-embedding-3-* nhận số nhỏ hơn; hashing mặc định 256
+    "embedding_device": "cpu",
+    "embedding_batch_size": 64,  # batch encode của sentence-transformers
+    "openai_api_key": "key-placeholder",  # Replace with your actual OpenAI API key
+    # Cache embedding: LRU trong RAM + SQLite trên đĩa (key = hash(model + text))
+    "embedding_cache_path": "./embedding_cache/embeddings.sqlite3",
+    "embedding_cache_memory_entries": 10000,
+    "embedding_cache_disk_entries": 1000000,
+}
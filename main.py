@@ -1,53 +1,118 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import json
+import time
 from models.profile import Profile
 from models.finance import Finance
 from tco_calculator import TCOCalculator
+from configs.recommender_config import RECOMMENDER_CONFIG
+from utils.metrics import (
+    CANDIDATES, STRATEGY_PICKS, observe_stage, render_metrics, server_timing_header, stage_timer,
+    start_request_timings,
+)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Khởi tạo HybridCarRecommender một lần khi startup, đóng Qdrant khi shutdown.
+    Dùng mock semantic search thì /recommend không cần recommender -> bỏ qua warm-up (không embed catalog).
+    """
+    from recommender import init_recommender, ashutdown_recommender
+    from tco_calculator import precompile_region_coefficients
+    precompile_region_coefficients()
+    if RECOMMENDER_CONFIG["warmup_on_startup"] and not RECOMMENDER_CONFIG["use_mock_semantic_search"]:
+        try:
+            init_recommender()
+        except Exception as e:
+            # Không chặn startup; get_recommender() sẽ thử lại ở request đầu tiên
+            print(f"⚠️ Recommender warm-up failed: {e}")
+    yield
+    await ashutdown_recommender()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # -----------------------------
 # Mock helper functions
 # -----------------------------
-def semantic_search_from_profile(profile: Profile, useMock: bool = False) -> Dict[str, Any]:
+MOCK_SEMANTIC_RESULT = {
+    "suggested_cars": [
+        {
+            "year": 2022,
+            "make": "Honda",
+            "model": "Civic",
+            "trim": "EX Sedan",
+            "reason": "Phù hợp với ngân sách, tiết kiệm nhiên liệu và kiểu dáng sedan"
+        },
+        {
+            "year": 2023,
+            "make": "Tesla",
+            "model": "Model 3",
+            "trim": "Long Range AWD",
+            "reason": "Xe điện, có Autopilot, thân thiện môi trường, phù hợp với nhu cầu EV"
+        },
+        {
+            "year": 2021,
+            "make": "Honda",
+            "model": "Accord",
+            "trim": "Sport Special Edition",
+            "reason": "Không gian rộng rãi cho gia đình, nhiều tính năng an toàn"
+        }
+    ]
+}
+
+
+# Khoảng giá chấp nhận quanh cash_budget (dùng cả khi lọc trong Qdrant lẫn khi tính TCO)
+PRICE_WINDOW_USD = 2300
+
+
+# Filter mềm (payload key) -> field của Profile, để báo cho client ràng buộc nào đã được nới
+RELAXED_FILTER_FIELDS = {"MakeKey": "brand_preference", "BodyTypeKey": "body_type"}
+
+
+def profile_filters(profile: Profile, rec, max_discount: float = 0.0) -> Dict[str, Any]:
     """
-    Semantic search trong vector DB từ payload -> gợi ý danh sách xe (dùng HybridCarRecommender)
+    Profile -> filters cho Qdrant để ANN chỉ trả về xe khả thi:
+      - cash_budget ± PRICE_WINDOW_USD -> range trên PriceUSD (xe chưa có giá vẫn giữ lại);
+        cận trên cộng thêm max_discount vì lọc ngân sách thật sự (iter_budget_candidates) tính
+        trên giá sau voucher, xe chỉ vừa ngân sách nhờ voucher không được bị loại ở bước retrieve
+      - body_type / brand_preference -> MatchAny, engine_type -> MatchValue
+      - car_condition_preference "new" / "used" -> range trên Year
+    Hãng và body type là filter mềm: không đủ top_k xe thì recommender nới dần (hãng trước)
+    và suggested_cars_from_hits báo lại qua "relaxed_filters".
+    """
+    from datetime import date
+
+    if not RECOMMENDER_CONFIG["prefilter_from_profile"]:
+        return {}
+    budget = profile.finance.cash_budget if profile.finance else None
+    price_range = (budget - PRICE_WINDOW_USD, budget + PRICE_WINDOW_USD + max_discount) if budget else None
+    newest_used_year = date.today().year - RECOMMENDER_CONFIG["new_car_max_age_years"] - 1
+    year_range = {
+        "new": (newest_used_year + 1, None),
+        "used": (None, newest_used_year),
+    }.get((profile.car_condition_preference or "both").lower())
+    return rec.build_filters(
+        makes=profile.brand_preference,
+        body_types=profile.body_type,
+        engine_type=getattr(profile, "engine_type", None),
+        price_range=price_range,
+        year_range=year_range,
+    )
+
+
+def build_search_inputs(profile: Profile, rec) -> Dict[str, Any]:
+    """
+    Profile -> user_pref, pref_text, strategy, business_cfg, filters cho HybridCarRecommender
     """
-    if (useMock):
-        return {
-            "suggested_cars": [
-                {
-                    "year": 2022,
-                    "make": "Honda",
-                    "model": "Civic",
-                    "trim": "EX Sedan",
-                    "reason": "Phù hợp với ngân sách, tiết kiệm nhiên liệu và kiểu dáng sedan"
-                },
-                {
-                    "year": 2023,
-                    "make": "Tesla",
-                    "model": "Model 3",
-                    "trim": "Long Range AWD",
-                    "reason": "Xe điện, có Autopilot, thân thiện môi trường, phù hợp với nhu cầu EV"
-                },
-                {
-                    "year": 2021,
-                    "make": "Honda",
-                    "model": "Accord",
-                    "trim": "Sport Special Edition",
-                    "reason": "Không gian rộng rãi cho gia đình, nhiều tính năng an toàn"
-                }
-            ]
-        }
-    from recommender import HybridCarRecommender
     from configs.strategy_config import auto_pick_strategy
-    import numpy as np
-    CSV_PATH = "data/vehicle_raw_vector_db.csv"
-    TOP_K = 15
-    rec = HybridCarRecommender(CSV_PATH)
 
     # Build user_pref from profile
     user_pref = {
@@ -65,36 +130,116 @@ def semantic_search_from_profile(profile: Profile, useMock: bool = False) -> Dic
     context = {
         "campaign": getattr(profile, "campaign", ""),
         "user_tier": getattr(profile, "memberLevel", "regular"),
-        "avg_inventory_days": float(np.mean(rec.df["inventory_days"]))
+        "avg_inventory_days": rec.avg_inventory_days
     }
     strategy = auto_pick_strategy(context)
+    STRATEGY_PICKS.inc(strategy=strategy)
 
     business_cfg = {
         "promoted_brands": [b for b in profile.brand_preference],
         "promoted_models": [],
     }
+    return {
+        "user_pref": user_pref,
+        "pref_text": pref_text,
+        "strategy": strategy,
+        "business_cfg": business_cfg,
+        "filters": profile_filters(profile, rec, max_discount=max_voucher_discount(profile)),
+    }
 
-    hits = rec.retrieve(pref_text, top_k=TOP_K)
-    ranked = rec.hybrid_rerank(
-        hits=hits,
-        user_pref=user_pref,
-        pref_text=pref_text,
-        strategy=strategy,
-        business_cfg=business_cfg
-    )
 
+def max_voucher_discount(profile: Profile) -> float:
+    """Voucher giảm giá lớn nhất có thể áp cho profile (bộ special_offers mà bước voucher sẽ dùng)."""
+    from utils.voucher_utils import compiled_voucher_index
+
+    if not profile.finance:
+        return 0.0
+    return compiled_voucher_index(get_finance_offers(profile).get("special_offers", [])).max_discount
+
+
+def suggested_cars_from_hits(ranked, inputs: Optional[Dict[str, Any]] = None,
+                             store_explanation: bool = True) -> Dict[str, Any]:
+    """
+    Hits đã rerank -> suggested_cars; reasons chỉ render cho các xe này.
+    Có `inputs` (build_search_inputs), store_explanation và explain store bật -> lưu kết quả,
+    trả kèm recommendation_id.
+    Xe chỉ tìm được sau khi nới filter mềm -> kèm "relaxed_filters" (field Profile đã nới, vd. brand_preference).
+    """
+    from utils.rerank_utils import hit_reasons
+
+    user_pref = inputs["user_pref"] if inputs else {}
     # Build response schema
     suggested_cars = []
-    for h in ranked[:5]:
+    for h in ranked:
         p = h.payload
         suggested_cars.append({
             "year": p.get("Year"),
             "make": p.get("Make"),
             "model": p.get("Model"),
             "trim": p.get("Trim"),
-            "reason": "; ".join(h.reasons[:3])
+            "reason": "; ".join(hit_reasons(h, user_pref)[:3])
         })
-    return {"suggested_cars": suggested_cars}
+    result = {"suggested_cars": suggested_cars}
+    relaxed = {key for h in ranked for key in h.relaxed_filters}
+    if relaxed:
+        result["relaxed_filters"] = [field for key, field in RELAXED_FILTER_FIELDS.items() if key in relaxed]
+    if inputs and store_explanation and RECOMMENDER_CONFIG["explain_store_enabled"]:
+        from utils.explanation_store import get_explanation_store
+        result["recommendation_id"] = get_explanation_store().put(
+            ranked, inputs["user_pref"], inputs["pref_text"], inputs["strategy"]
+        )
+    return result
+
+
+def semantic_search_from_profile(profile: Profile, useMock: bool = False) -> Dict[str, Any]:
+    """
+    Semantic search trong vector DB từ payload -> gợi ý danh sách xe (dùng HybridCarRecommender)
+    """
+    if (useMock):
+        return MOCK_SEMANTIC_RESULT
+    from recommender import get_recommender
+    TOP_K = RECOMMENDER_CONFIG["top_k"]
+    rec = get_recommender()
+    with stage_timer("semantic_search"):
+        inputs = build_search_inputs(profile, rec)
+        # Query và pref_text là cùng một chuỗi -> chỉ embed một lần cho cả retrieve lẫn rerank
+        memo = rec.embedding_memo()
+
+        hits = rec.search_relaxed(memo.get(inputs["pref_text"]), top_k=TOP_K, filters=inputs["filters"])
+        CANDIDATES.observe(len(hits), phase="retrieved")
+        ranked = rec.hybrid_rerank(
+            hits=hits,
+            user_pref=inputs["user_pref"],
+            pref_text=inputs["pref_text"],
+            strategy=inputs["strategy"],
+            business_cfg=inputs["business_cfg"],
+            top_n=RECOMMENDER_CONFIG["top_n"],
+            pref_vec=memo.get(inputs["pref_text"])
+        )
+        return suggested_cars_from_hits(ranked, inputs)
+
+
+async def asemantic_search_from_profile(profile: Profile, useMock: bool = False) -> Dict[str, Any]:
+    """
+    Bản async của semantic_search_from_profile: embedding + Qdrant không chặn event loop.
+    """
+    if (useMock):
+        return MOCK_SEMANTIC_RESULT
+    from recommender import get_recommender
+    rec = await run_in_threadpool(get_recommender)
+    with stage_timer("semantic_search"):
+        inputs = build_search_inputs(profile, rec)
+        ranked = await rec.arecommend(
+            query=inputs["pref_text"],
+            user_pref=inputs["user_pref"],
+            pref_text=inputs["pref_text"],
+            strategy=inputs["strategy"],
+            business_cfg=inputs["business_cfg"],
+            top_k=RECOMMENDER_CONFIG["top_k"],
+            top_n=RECOMMENDER_CONFIG["top_n"],
+            filters=inputs["filters"]
+        )
+        return suggested_cars_from_hits(ranked, inputs)
 
 
 def get_finance_offers(profile: Profile) -> Dict[str, Any]:
@@ -111,76 +256,411 @@ def get_finance_offers(profile: Profile) -> Dict[str, Any]:
 
 
 def filter_and_calculate_tco(profile, semantic_result, finance_result):
-    from utils.db import get_vehicles_from_db
-    from utils.voucher_utils import get_discount_vouchers
+    with stage_timer("filter_and_calculate_tco"):
+        return list(iter_cars_with_tco(profile, semantic_result, finance_result))
 
-    vehicles = get_vehicles_from_db()
 
-    cars_with_tco = []
-    
-    for pref in semantic_result["suggested_cars"]:
-        matches = [
-            v for v in vehicles
-            if v.year == pref["year"]
-            and v.make == pref["make"]
-            and v.model == pref["model"]
-            and v.trim == pref["trim"]
-        ]
-        for vehicle in matches:
-            # Voucher check
-            discount_vouchers = get_discount_vouchers(
-                finance_result.get("special_offers", []), vehicle, vehicle.year, getattr(profile, "memberLevel", None)
-            )
-            discount_voucher = discount_vouchers[0] if discount_vouchers else None
-            voucher_discount = discount_voucher.value if discount_voucher else 0
-
-            # Price filter (±2300$ + voucher)
-            if not (profile.finance.cash_budget - 2300 <= (vehicle.base_price - voucher_discount) <= profile.finance.cash_budget + 2300):
-                continue
+def iter_budget_candidates(profile, semantic_result, finance_result):
+    """
+    Generator: (pref, vehicle, discount_voucher) cho từng xe khớp kết quả semantic search
+    và qua lọc ngân sách (±PRICE_WINDOW_USD sau voucher).
+    Thời gian voucher và số xe trước/sau lọc ngân sách được cộng dồn rồi ghi metric một lần
+    khi generator kết thúc (kể cả khi client stream ngắt giữa chừng).
+    """
+    from utils.vehicle_repository import get_vehicle_repository
+    from utils.voucher_utils import compiled_voucher_index, get_discount_vouchers
 
-            # TCO calc
-            calc = TCOCalculator(profile)
+    vehicles = get_vehicle_repository()
+    # Index compile một lần cho mỗi bộ voucher (dùng lại giữa các request), mỗi xe chỉ còn vài lookup dict
+    voucher_index = compiled_voucher_index(finance_result.get("special_offers", []))
+    voucher_seconds = 0.0
+    matched = kept = 0
+
+    try:
+        for pref in semantic_result["suggested_cars"]:
+            matches = vehicles.find(pref["year"], pref["make"], pref["model"], pref["trim"])
+            for vehicle in matches:
+                matched += 1
+                # Voucher check
+                started = time.perf_counter()
+                discount_vouchers = get_discount_vouchers(
+                    voucher_index, vehicle, vehicle.year, getattr(profile, "memberLevel", None)
+                )
+                voucher_seconds += time.perf_counter() - started
+                discount_voucher = discount_vouchers[0] if discount_vouchers else None
+                voucher_discount = discount_voucher.value if discount_voucher else 0
+
+                # Price filter (±PRICE_WINDOW_USD + voucher)
+                if not (profile.finance.cash_budget - PRICE_WINDOW_USD <= (vehicle.base_price - voucher_discount) <= profile.finance.cash_budget + PRICE_WINDOW_USD):
+                    continue
+                kept += 1
+                yield pref, vehicle, discount_voucher
+    finally:
+        observe_stage("voucher", voucher_seconds)
+        CANDIDATES.observe(matched, phase="before_budget_filter")
+        CANDIDATES.observe(kept, phase="after_budget_filter")
+
+
+def car_with_tco(pref, vehicle, discount_voucher, tco_info) -> Dict[str, Any]:
+    voucher_discount = discount_voucher.value if discount_voucher else 0
+    car_info = {
+        "year": vehicle.year,
+        "make": vehicle.make,
+        "model": vehicle.model,
+        "trim": vehicle.trim,
+        "color": getattr(vehicle, "color", None),
+        "reason": f"{pref['reason']} + phù hợp với khả năng tài chính (voucher áp dụng: {voucher_discount}$)"
+    }
+    # Merge all tco_info fields
+    car_info.update(tco_info)
+    return car_info
+
+
+def iter_cars_with_tco(profile, semantic_result, finance_result):
+    """
+    Generator: yield từng xe ngay khi xong voucher + TCO (dùng cho /recommend/stream),
+    không giữ toàn bộ danh sách kết quả trong bộ nhớ.
+    Thời gian TCO được cộng dồn rồi ghi metric một lần khi generator kết thúc.
+    """
+    candidates = iter_budget_candidates(profile, semantic_result, finance_result)
+    calc = None
+    tco_seconds = 0.0
+
+    try:
+        for pref, vehicle, discount_voucher in candidates:
+            # TCO calc (một calculator cho cả request)
+            started = time.perf_counter()
+            calc = calc or TCOCalculator(profile)
             tco_info = calc.calculate_tco(vehicle=vehicle, voucher=discount_voucher)
+            tco_seconds += time.perf_counter() - started
+            yield car_with_tco(pref, vehicle, discount_voucher, tco_info)
+    finally:
+        candidates.close()
+        observe_stage("tco", tco_seconds)
+
+
+def filter_and_calculate_tco_batch(profiles: List[Profile], semantic_results: List[Any]) -> List[Any]:
+    """
+    Voucher + TCO cho nhiều profile: lọc ngân sách theo từng profile, sau đó TCO của mọi xe còn lại
+    được tính theo state bằng calculate_tco_batch (calculate_tco_many) thay vì từng xe một.
+    Phần tử kết quả là danh sách xe, hoặc Exception nếu profile đó lỗi.
+    """
+    from tco_calculator import calculate_tco_many
+
+    results: List[Any] = [None] * len(profiles)
+    candidates = []
+    with stage_timer("filter_and_calculate_tco"):
+        for i, (profile, semantic_result) in enumerate(zip(profiles, semantic_results)):
+            if isinstance(semantic_result, Exception):
+                results[i] = semantic_result
+                continue
+            try:
+                found = list(iter_budget_candidates(profile, semantic_result, get_finance_offers(profile)))
+                # Như iter_cars_with_tco: chỉ cần calculator (và state hợp lệ) khi còn xe qua lọc ngân sách
+                calc = TCOCalculator(profile) if found else None
+            except Exception as e:
+                results[i] = e
+                continue
+            results[i] = []
+            candidates.extend((i, calc, pref, vehicle, voucher) for pref, vehicle, voucher in found)
 
-            car_info = {
-                "year": vehicle.year,
-                "make": vehicle.make,
-                "model": vehicle.model,
-                "trim": vehicle.trim,
-                "color": getattr(vehicle, "color", None),
-                "reason": f"{pref['reason']} + phù hợp với khả năng tài chính (voucher áp dụng: {voucher_discount}$)"
-            }
-            # Merge all tco_info fields
-            car_info.update(tco_info)
-            cars_with_tco.append(car_info)
-    return cars_with_tco
+        with stage_timer("tco"):
+            try:
+                tco_infos = calculate_tco_many([(calc, vehicle, voucher) for _, calc, _, vehicle, voucher in candidates])
+            except Exception as e:
+                tco_infos = [e] * len(candidates)
+        for (i, _, pref, vehicle, voucher), tco_info in zip(candidates, tco_infos):
+            if isinstance(tco_info, Exception):
+                results[i] = tco_info
+            elif not isinstance(results[i], Exception):
+                results[i].append(car_with_tco(pref, vehicle, voucher, tco_info))
+    return results
+
+
+def profile_summary(profile: Profile) -> Dict[str, Any]:
+    return {
+        "location": f"{profile.state}, {getattr(profile, 'zip', '')}",
+        "budget": {
+            "cash_budget": profile.finance.cash_budget,
+            "monthly_capacity": profile.finance.monthly_capacity,
+            "payment_method": profile.finance.payment_method
+        },
+        "eco_friendly": getattr(profile, 'eco_friendly', None),
+    }
+
+
+def finance_info(profile: Profile) -> Dict[str, Any]:
+    return {
+        "payment_capacity": f"You can afford cars up to ${profile.finance.cash_budget} in cash "
+                            f"or around ${profile.finance.monthly_capacity}/month if financed.",
+    }
 
 
 # -----------------------------
 # Endpoint
 # -----------------------------
+def response_cache_versions() -> Dict[str, Any]:
+    """
+    Version của các nguồn dữ liệu mà response phụ thuộc; đổi bất kỳ cái nào thì response cache bị xoá.
+    "date" đổi mỗi ngày -> voucher hết hạn (valid_until) và xe mới/cũ theo năm không bị cache cũ che mất.
+    REGION_CONFIG đổi -> bảng hệ số TCO được compile lại (region_config_version, serialize config một lần)
+    và version tăng, nên response cũ bị xoá.
+    """
+    import os
+    from datetime import date
+    from tco_calculator import region_config_version
+
+    def mtime(path):
+        return os.path.getmtime(path) if path and os.path.exists(path) else None
+
+    return {
+        "catalog": mtime(RECOMMENDER_CONFIG["csv_path"]),
+        "vehicles": mtime("data/vehicles.json"),
+        "vouchers": mtime("data/vouchers.json"),
+        "business_signals": mtime(RECOMMENDER_CONFIG["business_signals_path"]),
+        "region_config": region_config_version(),
+        "date": date.today().isoformat(),
+    }
+
+
 @app.post("/recommend")
-def recommend_cars(profile: Profile):
-    semantic_result = semantic_search_from_profile(profile, useMock=True)
+async def recommend_cars(profile: Profile, response: Response):
+    """
+    timing_headers bật -> thêm header Server-Timing với thời gian từng stage của chính request này.
+    """
+    timings = start_request_timings() if RECOMMENDER_CONFIG["timing_headers"] else None
+    try:
+        with stage_timer("recommend"):
+            return await _recommend_cars(profile, response)
+    finally:
+        if timings is not None:
+            response.headers["Server-Timing"] = server_timing_header(timings)
+
+
+async def _recommend_cars(profile: Profile, response: Response):
+    from utils.response_cache import get_response_cache, profile_cache_key
+
+    cache, key = None, None
+    if RECOMMENDER_CONFIG["response_cache_enabled"]:
+        cache = get_response_cache()
+        cache.validate(response_cache_versions())
+        key = profile_cache_key(profile)
+        cached = cache.get(key)
+        if cached is not None:
+            response.headers["X-Cache"] = "HIT"
+            return cached
+
+    semantic_result = await asemantic_search_from_profile(profile, useMock=RECOMMENDER_CONFIG["use_mock_semantic_search"])
     
     finance_result = get_finance_offers(profile)
-    car_recommendations = filter_and_calculate_tco(profile, semantic_result, finance_result)
+    # Voucher + TCO là CPU thuần, chạy trong threadpool để event loop tiếp tục nhận request
+    car_recommendations = await run_in_threadpool(filter_and_calculate_tco, profile, semantic_result, finance_result)
+    result = jsonable_encoder(build_recommendation_response(profile, semantic_result, car_recommendations))
+    if cache is not None:
+        cache.put(key, result)
+    response.headers["X-Cache"] = "MISS" if cache is not None else "BYPASS"
+    return result
+
+
+@app.get("/recommend/cache")
+def recommend_cache_stats():
+    """Số liệu response cache của /recommend (hit rate, eviction, invalidation theo lý do)."""
+    from utils.response_cache import get_response_cache
+    return get_response_cache().stats()
+
+
+@app.get("/recommend/{recommendation_id}/explain")
+def explain_recommendation(recommendation_id: str):
+    """
+    Giải thích một lần gợi ý (id trả về trong response của /recommend): với từng xe đã xếp hạng,
+    score vec/rule/emb/biz/final, contributions của từng rule/boost, reasons và dòng explain_hit.
+    Dữ liệu chỉ giữ trong explain_ttl_seconds; hết hạn -> 404.
+    """
+    from recommender import HybridCarRecommender
+    from models.car_hit import CarHit
+    from utils.explanation_store import get_explanation_store
+    from utils.rerank_utils import hit_reasons
+
+    record = get_explanation_store().get(recommendation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Recommendation {recommendation_id} not found or expired")
+    cars = []
+    for rank, item in enumerate(record["hits"], start=1):
+        h = CarHit(
+            id=item["id"], vec_score=item["vec_score"], payload=item["car"],
+            rule_score=item["rule_score"], emb_score=item["emb_score"], biz_score=item["biz_score"],
+            final_score=item["final_score"], contributions=item["contributions"],
+        )
+        car = item["car"]
+        cars.append({
+            "rank": rank,
+            "year": car.get("Year"),
+            "make": car.get("Make"),
+            "model": car.get("Model"),
+            "trim": car.get("Trim"),
+            "scores": {
+                "vec": h.vec_score, "rule": h.rule_score, "emb": h.emb_score,
+                "biz": h.biz_score, "final": h.final_score,
+            },
+            "contributions": h.contributions,
+            "reasons": hit_reasons(h, record["user_pref"]),
+            "explanation": HybridCarRecommender.explain_hit(h, record["user_pref"]),
+        })
+    return {
+        "recommendation_id": recommendation_id,
+        "strategy": record["strategy"],
+        "pref_text": record["pref_text"],
+        "expires_in_seconds": record["expires_in_seconds"],
+        "cars": cars,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Metric dạng Prometheus text: latency từng stage, embedding call/token, cache, số ứng viên, strategy."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def build_recommendation_response(profile: Profile, semantic_result, car_recommendations) -> Dict[str, Any]:
     return {
         "summary": "We found cars that match your preferences, budget, and lifestyle.",
+        "recommendation_id": semantic_result.get("recommendation_id"),
+        "relaxed_filters": semantic_result.get("relaxed_filters", []),
         "your_profile": {
-            "location": f"{profile.state}, {getattr(profile, 'zip', '')}",
-            "budget": {
-                "cash_budget": profile.finance.cash_budget,
-                "monthly_capacity": profile.finance.monthly_capacity,
-                "payment_method": profile.finance.payment_method
-            },
-            "eco_friendly": getattr(profile, 'eco_friendly', None),
+            **profile_summary(profile),
             "preferences_from_semantic_search": semantic_result["suggested_cars"]
         },
-        "finance_info": {
-            "payment_capacity": f"You can afford cars up to ${profile.finance.cash_budget} in cash "
-                                f"or around ${profile.finance.monthly_capacity}/month if financed.",
-        },
+        "finance_info": finance_info(profile),
         "recommended_cars": [car for car in car_recommendations],
         # "next_step": "You can compare detailed specifications or request dealership offers."
     }
+
+
+def semantic_search_batch(profiles: List[Profile], useMock: bool = False,
+                          store_explanations: bool = True) -> List[Any]:
+    """
+    Semantic search cho nhiều profile: embedding batch + Qdrant search_batch + rerank từng profile.
+    Phần tử lỗi là Exception (không làm hỏng cả batch).
+    store_explanations=False (vd. bulk scoring offline) -> không lưu vào explain store.
+    """
+    if useMock:
+        return [MOCK_SEMANTIC_RESULT for _ in profiles]
+    from recommender import get_recommender
+    rec = get_recommender()
+    results: List[Any] = [None] * len(profiles)
+    items, positions = [], []
+    for i, profile in enumerate(profiles):
+        try:
+            items.append(build_search_inputs(profile, rec))
+            positions.append(i)
+        except Exception as e:
+            results[i] = e
+    try:
+        ranked_per_item = rec.recommend_batch(
+            items, top_k=RECOMMENDER_CONFIG["top_k"], top_n=RECOMMENDER_CONFIG["top_n"]
+        ) if items else []
+    except Exception as e:
+        # Lỗi chung (embedding/Qdrant) -> đánh dấu lỗi cho các profile của batch
+        ranked_per_item = [e] * len(items)
+    for i, inputs, ranked in zip(positions, items, ranked_per_item):
+        results[i] = ranked if isinstance(ranked, Exception) else suggested_cars_from_hits(
+            ranked, inputs, store_explanation=store_explanations
+        )
+    return results
+
+
+def score_profiles(indices: List[int], profiles: List[Profile], semantic_results: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Voucher + TCO (theo lô) cho các profile đã có kết quả semantic search;
+    lỗi của từng profile trả về dạng status "error".
+    """
+    cars_per_profile = filter_and_calculate_tco_batch(profiles, semantic_results)
+    results = []
+    for index, profile, semantic_result, cars in zip(indices, profiles, semantic_results, cars_per_profile):
+        try:
+            if isinstance(cars, Exception):
+                raise cars
+            results.append({
+                "index": index,
+                "status": "ok",
+                "result": build_recommendation_response(profile, semantic_result, cars),
+            })
+        except Exception as e:
+            results.append({"index": index, "status": "error", "error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+def recommend_batch(profiles: List[Profile]) -> List[Dict[str, Any]]:
+    semantic_results = semantic_search_batch(profiles, useMock=RECOMMENDER_CONFIG["use_mock_semantic_search"])
+    return score_profiles(list(range(len(profiles))), profiles, semantic_results)
+
+
+@app.post("/recommend/batch")
+def recommend_cars_batch(profiles: List[Profile]):
+    """
+    Gợi ý cho nhiều profile trong một request (job marketing chạy đêm).
+    Mỗi profile có status riêng; lỗi của một profile không làm hỏng cả batch.
+    """
+    return {"results": recommend_batch(profiles)}
+
+
+def _ndjson(event: Dict[str, Any]) -> str:
+    return json.dumps(jsonable_encoder(event), ensure_ascii=False) + "\n"
+
+
+@app.post("/recommend/stream")
+def recommend_cars_stream(profile: Profile):
+    """
+    Bản streaming của /recommend (NDJSON, mỗi dòng một event):
+      - summary: thông tin profile + tài chính, gửi ngay lập tức
+      - preferences: kết quả semantic search
+      - car: từng xe ngay khi voucher + TCO xong
+      - error: lỗi xảy ra sau khi stream đã bắt đầu (status 200 đã gửi, không đổi được nữa)
+      - done: luôn là dòng cuối; count = số xe đã gửi, status "ok" | "error"
+        (client không thấy done nghĩa là stream bị cắt giữa chừng)
+    """
+    def events():
+        count = 0
+        try:
+            yield _ndjson({
+                "type": "summary",
+                "summary": "We found cars that match your preferences, budget, and lifestyle.",
+                "your_profile": profile_summary(profile),
+                "finance_info": finance_info(profile),
+            })
+            semantic_result = semantic_search_from_profile(profile, useMock=RECOMMENDER_CONFIG["use_mock_semantic_search"])
+            yield _ndjson({
+                "type": "preferences",
+                "recommendation_id": semantic_result.get("recommendation_id"),
+                "relaxed_filters": semantic_result.get("relaxed_filters", []),
+                "preferences_from_semantic_search": semantic_result["suggested_cars"],
+            })
+            finance_result = get_finance_offers(profile)
+            for car in iter_cars_with_tco(profile, semantic_result, finance_result):
+                count += 1
+                yield _ndjson({"type": "car", "car": car})
+        except Exception as e:
+            print(f"⚠️ /recommend/stream failed after {count} cars: {type(e).__name__}: {e}")
+            yield _ndjson({"type": "error", "error": f"{type(e).__name__}: {e}"})
+            yield _ndjson({"type": "done", "count": count, "status": "error"})
+            return
+        yield _ndjson({"type": "done", "count": count, "status": "ok"})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/recommender/reload")
+def reload_catalog():
+    """
+    Reload catalog + index Qdrant ngoài luồng /recommend.
+    Luôn đọc RECOMMENDER_CONFIG["csv_path"]: endpoint không nhận đường dẫn từ request
+    (tránh để client chỉ định file bất kỳ trên server).
+    """
+    from recommender import reload_recommender
+    from tco_calculator import refresh_region_coefficients_if_changed
+    from utils.response_cache import get_response_cache
+    stats = reload_recommender(RECOMMENDER_CONFIG["csv_path"])
+    region_config_changed = refresh_region_coefficients_if_changed()
+    if region_config_changed:
+        get_response_cache().invalidate("region_config")
+    return {"status": "reloaded", "region_config_changed": region_config_changed, **stats}
@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 
 @dataclass
@@ -10,4 +10,7 @@ class CarHit:
     emb_score: float = 0.0
     biz_score: float = 0.0
     final_score: float = 0.0
-    reasons: List[str] = None
\ No newline at end of file
+    reasons: List[str] = None
+    contributions: Optional[Dict[str, float]] = None  # {feature: điểm cộng} của rule/boost đã khớp
+    personal_vec: Optional[List[float]] = None  # vector "personal" lưu sẵn trong Qdrant
+    relaxed_filters: Tuple[str, ...] = ()  # filter mềm đã bỏ để tìm được xe này (rỗng = khớp đủ filters)
\ No newline at end of file
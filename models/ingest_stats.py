@@ -0,0 +1,23 @@
+from dataclasses import dataclass, asdict
+
+@dataclass
+class IngestStats:
+    """
+    IngestStats
+    Số liệu của một lần ingest catalog -> Qdrant (throughput, cache, retry)
+    """
+    rows: int = 0              # Số xe đã upsert
+    batches: int = 0           # Số batch đã embed + upsert
+    embedded_texts: int = 0    # Số text phải gọi embedding API (cache miss)
+    cached_texts: int = 0      # Số text lấy từ embedding cache
+    retries: int = 0           # Số lần retry embedding API
+    seconds: float = 0.0       # Tổng thời gian ingest
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        result = asdict(self)
+        result["rows_per_second"] = round(self.rows_per_second, 2)
+        return result
@@ -0,0 +1,26 @@
+from dataclasses import dataclass, field
+from typing import Dict
+
+@dataclass
+class RegionCoefficients:
+    """
+    RegionCoefficients
+    Hệ số TCO đã tính sẵn cho một cặp (bang, số năm) từ REGION_CONFIG
+    """
+    state: str
+    years: int
+    tax_rate: float
+    registration_fee: float
+    fuel_price: float
+    electricity_price: float
+    insurance_rate: float
+    insurance_factor: float          # insurance_base * years
+    parking_base: float
+    parking_escalation: float
+    parking_total: float             # tổng phí gửi xe cộng dồn theo escalation
+    toll_base: float
+    toll_escalation: float
+    toll_total: float                # tổng phí cầu đường cộng dồn theo escalation
+    maintenance: Dict[str, dict] = field(default_factory=dict)        # brand -> {base_maint, escalation}
+    maintenance_totals: Dict[str, float] = field(default_factory=dict)  # brand -> tổng bảo dưỡng
+    default_maintenance_total: float = 0.0
@@ -1,35 +1,260 @@
+import asyncio
+import hashlib
+import json
+import re
 import uuid
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
 import numpy as np
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-import openai
-from business_signals import attach_business_signals
-from utils.vector_utils import minmax_scale, safe_float
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Optional, Tuple
+from business_signals import (
+    SIGNAL_COLUMNS, BusinessSignalRefresher, attach_business_signals, load_business_signals
+)
 from configs.strategy_config import STRATEGIES
+from configs.recommender_config import RECOMMENDER_CONFIG
 from models.car_hit import CarHit
-from sentence_transformers import util
+from models.ingest_stats import IngestStats
+from utils.embedding_cache import EmbeddingCache, EmbeddingMemo
+from utils.rerank_utils import (
+    CatalogColumns, rule_scores, business_scores, blend_scores, top_k_indices,
+    feature_contributions, hit_reasons, reasons_from_contributions
+)
+from utils.embedding_providers import EmbeddingProvider, build_embedding_provider, is_transient_error
+from utils.metrics import CANDIDATES, REGISTRY, stage_timer
+from utils.numpy_index import NumpyVectorIndex
+from utils.response_cache import get_response_cache
+from utils.rw_lock import ReadWriteLock
 
-# Set up your OpenAI API key
-openai.api_key = "key-placeholder"  # Replace with your actual OpenAI API key
+if TYPE_CHECKING:
+    from qdrant_client.models import Filter
+
+# qdrant_client (và utils.qdrant_params) chỉ được import khi vector_backend="qdrant" thực sự dùng tới,
+# để worker với backend "numpy" khởi động mà không phải nạp client + toàn bộ model pydantic của Qdrant
+
+# Identity của một xe trong catalog -> point id cố định trong Qdrant
+IDENTITY_COLUMNS = ["Year", "Make", "Model", "Trim", "Zip"]
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1f0e-3c59-4f0a-9a51-0d4cbe7d2a11")
+# Named vectors trong mỗi point: vector để search và vector cho emb_personal_scores
+RETRIEVAL_VECTOR = "retrieval"
+PERSONAL_VECTOR = "personal"
+# Cột lowercase để filter keyword không phân biệt hoa thường (" Sedan", "suv", ...)
+FILTER_KEY_COLUMNS = {"Make": "MakeKey", "BodyType": "BodyTypeKey", "EngineType": "EngineTypeKey"}
+# Filter mềm, nới theo thứ tự này khi search có filter trả về ít hơn top_k xe
+# (loại động cơ, giá, năm vẫn là ràng buộc cứng)
+RELAXABLE_FILTER_KEYS = (FILTER_KEY_COLUMNS["Make"], FILTER_KEY_COLUMNS["BodyType"])
+# Payload index tạo khi setup collection -> Qdrant lọc trước khi duyệt HNSW
+# (giá trị của PayloadSchemaType)
+PAYLOAD_INDEXES = {
+    "MakeKey": "keyword",
+    "BodyTypeKey": "keyword",
+    "EngineTypeKey": "keyword",
+    "Year": "integer",
+    "PriceUSD": "float",
+}
+PRICE_PATTERN = re.compile(r"\$\s?(\d{1,3}(?:,\d{3})+|\d{4,})")
 
 class HybridCarRecommender:
-    def __init__(self, csv_path: str):
-        import pandas as pd
-        self.df = attach_business_signals(pd.read_csv(csv_path))
-        self.dim = 1536  # OpenAI's text-embedding-ada-002 has a 1536 dimensional output
-        self.qdrant = QdrantClient(path="./qdrant_storage")
-        self._init_collection()
+    def __init__(self, csv_path: str, qdrant_path: str = None):
+        self.csv_path = csv_path
+        self.collection = RECOMMENDER_CONFIG["collection_name"]
+        self.embedder = get_embedding_provider()
+        self.dim = self.embedder.dim
+        qdrant_url = RECOMMENDER_CONFIG["qdrant_url"]
+        # vector_backend="numpy": exact search trong process (catalog nhỏ), không mở Qdrant
+        self.index = None
+        # Chỉ embedded Qdrant cần khoá (search chia sẻ, ghi độc quyền); Qdrant server và index NumPy
+        # (snapshot bất biến) tự xử lý truy cập đồng thời
+        self._qdrant_lock = None
+        if RECOMMENDER_CONFIG["vector_backend"] == "numpy":
+            self.index = NumpyVectorIndex(
+                RECOMMENDER_CONFIG["numpy_index_path"], self.dim, RECOMMENDER_CONFIG["numpy_index_dtype"]
+            )
+            self.qdrant = None
+            self.aqdrant = None
+        elif qdrant_url:
+            from qdrant_client import AsyncQdrantClient, QdrantClient
+            self.qdrant = QdrantClient(url=qdrant_url)
+            self.aqdrant = AsyncQdrantClient(url=qdrant_url)
+        else:
+            from qdrant_client import QdrantClient
+            # Embedded Qdrant giữ file lock trên path nên không mở thêm AsyncQdrantClient;
+            # bản async chạy search của client sync trong thread
+            self.qdrant = QdrantClient(path=qdrant_path or RECOMMENDER_CONFIG["qdrant_path"])
+            self.aqdrant = None
+            self._qdrant_lock = ReadWriteLock()
+        # Khoá khi đổi self.df/self.columns (swap lúc reload, cập nhật tại chỗ khi refresh tín hiệu)
+        self._lock = threading.Lock()
+        self.df = self._load_catalog(csv_path)
+        self.columns = self._build_columns(self.df)
+        self.avg_inventory_days = self._avg_inventory_days(self.df)
+        if self.index is None:
+            self._init_collection()
         self._upsert()
 
+    def _load_catalog(self, csv_path: str):
+        import pandas as pd
+        signals = load_business_signals(RECOMMENDER_CONFIG["business_signals_path"])
+        df = attach_filter_fields(attach_business_signals(pd.read_csv(csv_path), signals))
+        # Một point cho mỗi identity (Year/Make/Model/Trim/Zip), dòng sau ghi đè dòng trước
+        return df.drop_duplicates(subset=IDENTITY_COLUMNS, keep="last").reset_index(drop=True)
+
+    def _build_columns(self, df) -> CatalogColumns:
+        """Catalog dạng cột cho rerank vector hoá, index theo point id."""
+        records = df.to_dict("records")
+        return CatalogColumns.from_records(records, ids=[self._point_id(r) for r in records])
+
+    @staticmethod
+    def _avg_inventory_days(df) -> float:
+        """Context cho auto_pick_strategy; tính lại khi catalog/tín hiệu kinh doanh đổi, không theo request."""
+        return float(np.mean(df["inventory_days"]))
+
+    def _hit_columns(self, hits: List[CarHit]) -> CatalogColumns:
+        """Lấy các cột của hits từ catalog trong RAM; fallback về payload nếu id lạ."""
+        columns = self.columns
+        rows = [columns.row_of_id.get(h.id) for h in hits]
+        if all(r is not None for r in rows):
+            return columns.take(np.asarray(rows, dtype=np.int64))
+        return CatalogColumns.from_records([h.payload for h in hits], vocab=columns.vocab)
+
     def _init_collection(self):
-        self.qdrant.recreate_collection(
-            collection_name="cars",
-            vectors_config=VectorParams(size=self.dim, distance=Distance.COSINE)
+        """
+        Giữ lại collection đã persist trong qdrant_storage; chỉ tạo lại khi chưa có
+        hoặc cấu hình vector không còn khớp (vd. đổi model embedding).
+        HNSW (m, ef_construct), quantization và on_disk lấy từ RECOMMENDER_CONFIG; đổi các thiết lập này
+        trên collection có sẵn thì update_collection (Qdrant tự build lại index) thay vì re-embed.
+        """
+        from qdrant_client.models import Disabled
+        from utils.qdrant_params import (
+            hnsw_config, index_settings_match, quantization_config, vector_params, vector_params_diff
+        )
+        if self.qdrant.collection_exists(self.collection):
+            info = self.qdrant.get_collection(self.collection)
+            vectors = info.config.params.vectors
+            if isinstance(vectors, dict) and all(
+                name in vectors and vectors[name].size == self.dim
+                for name in (RETRIEVAL_VECTOR, PERSONAL_VECTOR)
+            ):
+                if not index_settings_match(info, RECOMMENDER_CONFIG):
+                    self.qdrant.update_collection(
+                        collection_name=self.collection,
+                        vectors_config={name: vector_params_diff(RECOMMENDER_CONFIG) for name in vectors},
+                        hnsw_config=hnsw_config(RECOMMENDER_CONFIG),
+                        quantization_config=quantization_config(RECOMMENDER_CONFIG) or Disabled.DISABLED,
+                    )
+                self._ensure_payload_indexes()
+                return
+            self.qdrant.delete_collection(self.collection)
+        self.qdrant.create_collection(
+            collection_name=self.collection,
+            vectors_config={
+                RETRIEVAL_VECTOR: vector_params(self.dim, RECOMMENDER_CONFIG),
+                PERSONAL_VECTOR: vector_params(self.dim, RECOMMENDER_CONFIG),
+            },
+            hnsw_config=hnsw_config(RECOMMENDER_CONFIG),
+            quantization_config=quantization_config(RECOMMENDER_CONFIG),
         )
+        self._ensure_payload_indexes()
+
+    def _qdrant_access(self, write: bool = False):
+        """Context khoá cho một thao tác với embedded Qdrant: search -> chia sẻ, upsert/delete/set_payload -> độc quyền."""
+        if self._qdrant_lock is None:
+            return nullcontext()
+        return self._qdrant_lock.write() if write else self._qdrant_lock.read()
+
+    def _ensure_payload_indexes(self):
+        """Tạo payload index cho các field dùng để pre-filter (bỏ qua field đã có index)."""
+        from qdrant_client.models import PayloadSchemaType
+        existing = self.qdrant.get_collection(self.collection).payload_schema or {}
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing:
+                self.qdrant.create_payload_index(
+                    collection_name=self.collection, field_name=field_name, field_schema=PayloadSchemaType(schema)
+                )
+
+    def reload(self, csv_path: str = None) -> Dict[str, int]:
+        """
+        Nạp lại catalog (CSV) và đồng bộ phần chênh lệch sang Qdrant mà không tạo client mới
+        (embedded Qdrant giữ file lock trên qdrant_path).
+        """
+        csv_path = csv_path or self.csv_path
+        df = self._load_catalog(csv_path)
+        stats = self.last_sync = self.sync(df)
+        columns = self._build_columns(df)
+        avg_inventory_days = self._avg_inventory_days(df)
+        with self._lock:
+            self.df = df
+            self.columns = columns
+            self.avg_inventory_days = avg_inventory_days
+            self.csv_path = csv_path
+        get_response_cache().invalidate("catalog")
+        print(f"♻️ Reloaded catalog into Qdrant (:path:): {stats}")
+        return stats
+
+    def refresh_business_signals(self, signals=None) -> int:
+        """
+        Cập nhật tín hiệu kinh doanh mà không re-embed: chỉ xe có margin/tồn kho/brand priority
+        thay đổi mới được set_payload trong Qdrant và cập nhật tại chỗ trong self.df/self.columns.
+        Trả về số xe thay đổi.
+        """
+        if signals is None:
+            signals = load_business_signals(RECOMMENDER_CONFIG["business_signals_path"])
+        with self._lock:
+            df, columns = self.df, self.columns
+        cols = SIGNAL_COLUMNS + ["biz_static"]
+        fresh = attach_business_signals(df, signals)
+        diff = fresh[cols].to_numpy(dtype=float) != df[cols].to_numpy(dtype=float)
+        changed = np.flatnonzero(diff.any(axis=1))
+        if not len(changed):
+            return 0
+
+        updates = []
+        for i in changed:
+            row = fresh.iloc[i]
+            payload = {c: row[c].item() if hasattr(row[c], "item") else row[c] for c in cols}
+            payload["_content_hash"] = self._content_hash(row)
+            updates.append((self._point_id(row), payload))
+        if self.index is not None:
+            for point_id, payload in updates:
+                self.index.set_payload(point_id, payload)
+            self.index.commit()
+        else:
+            from qdrant_client.models import SetPayload, SetPayloadOperation
+            operations = [
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in updates
+            ]
+            batch_size = RECOMMENDER_CONFIG["sync_batch_size"]
+            for i in range(0, len(operations), batch_size):
+                with self._qdrant_access(write=True):
+                    self.qdrant.batch_update_points(
+                        collection_name=self.collection, update_operations=operations[i:i + batch_size]
+                    )
 
-    def _row_text(self, row):
+        with self._lock:
+            df.loc[df.index[changed], cols] = fresh.iloc[changed][cols].to_numpy()
+            columns.margin[changed] = fresh["marginUSD"].to_numpy(dtype=float)[changed]
+            columns.inventory_days[changed] = fresh["inventory_days"].to_numpy(dtype=float)[changed]
+            columns.brand_priority[changed] = fresh["brand_priority"].to_numpy(dtype=float)[changed]
+            columns.biz_static[changed] = fresh["biz_static"].to_numpy(dtype=float)[changed]
+            self.avg_inventory_days = self._avg_inventory_days(df)
+        get_response_cache().invalidate("business_signals")
+        print(f"💰 Refreshed business signals for {len(changed)} cars")
+        return len(changed)
+
+    def close(self):
+        if self.qdrant is not None:
+            self.qdrant.close()
+
+    async def aclose(self):
+        """Như close, đóng cả AsyncQdrantClient (gọi qua ashutdown_recommender)."""
+        if self.aqdrant is not None:
+            await self.aqdrant.close()
+        self.close()
+
+    @staticmethod
+    def _row_text(row):
         parts = [
             f"{row.get('Year','')} {row.get('Make','')} {row.get('Model','')} {row.get('Trim','')}",
             f"Type {row.get('BodyType','')}",
@@ -40,133 +265,528 @@ class HybridCarRecommender:
         ]
         return " | ".join([p for p in parts if p])
 
-    def _get_openai_embedding(self, text: str) -> List[float]:
-        """Get embedding from OpenAI's API."""
-        response = openai.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
+    @staticmethod
+    def _personal_text(row):
+        """Text dùng cho emb_personal_scores (mô tả + meta), embed sẵn lúc ingest."""
+        desc = row.get("Description", "") or ""
+        meta = f"{row.get('EngineType','')} {row.get('BodyType','')} {row.get('UseCase','')}"
+        return f"{desc} | {meta}".strip(" |")
+
+    def _embed_uncached(self, text: str) -> List[float]:
+        """Gọi thẳng embedding provider (OpenAI / sentence-transformers / hashing)."""
+        with stage_timer("embedding"):
+            return _with_retry(self.embedder.embed, [text], budget="request")[0]
+
+    def _get_embedding(self, text: str) -> List[float]:
+        """Embedding qua cache (RAM -> đĩa -> provider)."""
+        return get_embedding_cache().get_or_compute(self.embedder.model_name, text, self._embed_uncached)
+
+    def embedding_memo(self) -> EmbeddingMemo:
+        """Memo embedding cho một request (query và pref_text giống nhau chỉ embed một lần)."""
+        return EmbeddingMemo(self._get_embedding, self._aget_embedding)
+
+    async def _aget_embedding(self, text: str) -> List[float]:
+        """
+        Bản async của _get_embedding: LRU trong RAM tra ngay trên event loop; SQLite (đọc/ghi)
+        chạy trong thread, cache miss thì gọi provider.aembed -> không chặn event loop.
+        """
+        cache = get_embedding_cache()
+        model = self.embedder.model_name
+        vec = cache.get_memory(model, text)
+        if vec is not None:
+            return vec
+        vec = await asyncio.to_thread(cache.get, model, text)
+        if vec is None:
+            with stage_timer("embedding"):
+                vec = (await _awith_retry(self.embedder.aembed, [text], budget="request"))[0]
+            await asyncio.to_thread(cache.put, model, text, vec)
+        return vec
+
+    def _get_embeddings(self, texts: List[str], on_retry=None, counts: Dict[str, int] = None) -> List[List[float]]:
+        """
+        Embedding cho nhiều text: lấy từ cache trước, phần còn thiếu gửi trong một request batch.
+        `counts["embedded"]` (nếu truyền vào) nhận số text phải gọi embedding API.
+        """
+        cache = get_embedding_cache()
+        model = self.embedder.model_name
+        vecs = cache.get_many(model, texts)
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if counts is not None:
+            counts["embedded"] = len(missing)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            with stage_timer("embedding"):
+                fresh = _with_retry(self.embedder.embed, missing_texts, on_retry=on_retry)
+            cache.put_many(model, missing_texts, fresh)
+            for i, v in zip(missing, fresh):
+                vecs[i] = v
+        return vecs
+
+    @staticmethod
+    def _point_id(row) -> str:
+        """Point id cố định theo identity của xe, ổn định giữa các lần khởi động."""
+        identity = "|".join(str(row.get(c, "")) for c in IDENTITY_COLUMNS)
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, identity))
+
+    def _content_hash(self, row) -> str:
+        """Hash text được embed + payload; đổi hash nghĩa là point cần upsert lại."""
+        content = json.dumps(
+            {"text": self._row_text(row), "personal": self._personal_text(row), "payload": row.to_dict()},
+            sort_keys=True, default=str
         )
-        # Extract the embedding from the response
-        return response.data[0].embedding
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
 
-    def _upsert(self):
+    def _stored_hashes(self) -> Dict[str, str]:
+        """Đọc (id -> _content_hash) của các point đang có trong collection."""
+        if self.index is not None:
+            return self.index.stored_hashes()
+        stored = {}
+        offset = None
+        while True:
+            with self._qdrant_access():
+                records, offset = self.qdrant.scroll(
+                    collection_name=self.collection,
+                    limit=RECOMMENDER_CONFIG["sync_batch_size"],
+                    offset=offset,
+                    with_payload=["_content_hash"],
+                    with_vectors=False,
+                )
+            for r in records:
+                stored[str(r.id)] = (r.payload or {}).get("_content_hash")
+            if offset is None:
+                return stored
+
+    def sync(self, df) -> Dict[str, Any]:
+        """
+        Đồng bộ incremental catalog -> Qdrant: chỉ ingest xe mới/đổi nội dung
+        và xoá xe không còn trong catalog, theo từng batch `sync_batch_size`.
+        """
+        batch_size = RECOMMENDER_CONFIG["sync_batch_size"]
+        stored = self._stored_hashes()
+        counts = {"added": 0, "updated": 0}
+
+        def changed_rows():
+            for _, row in df.iterrows():
+                pid = self._point_id(row)
+                content_hash = self._content_hash(row)
+                if pid not in stored:
+                    counts["added"] += 1
+                elif stored.pop(pid) != content_hash:
+                    counts["updated"] += 1
+                else:
+                    continue
+                yield row, content_hash
+
+        ingest = self._ingest(changed_rows())
+
+        # Những id còn lại trong `stored` không còn trong catalog
+        deleted_ids = list(stored.keys())
+        if self.index is not None:
+            self.index.delete(deleted_ids)
+            self.index.commit()
+        else:
+            from qdrant_client.models import PointIdsList
+            for i in range(0, len(deleted_ids), batch_size):
+                with self._qdrant_access(write=True):
+                    self.qdrant.delete(
+                        collection_name=self.collection,
+                        points_selector=PointIdsList(points=deleted_ids[i:i + batch_size]),
+                    )
+
+        return {
+            "added": counts["added"],
+            "updated": counts["updated"],
+            "deleted": len(deleted_ids),
+            "unchanged": len(df) - counts["added"] - counts["updated"],
+            "ingest": ingest.as_dict(),
+        }
+
+    def _ingest(self, rows: Iterable) -> IngestStats:
+        """
+        Pipeline ingest dạng streaming: chia rows thành batch `ingest_batch_size`, embed mỗi batch
+        bằng một request, chạy tối đa `ingest_concurrency` batch song song và upsert ngay khi
+        batch embed xong. Bộ nhớ chỉ giữ các batch đang chạy.
+        """
+        batch_size = RECOMMENDER_CONFIG["ingest_batch_size"]
+        concurrency = RECOMMENDER_CONFIG["ingest_concurrency"]
+        stats = IngestStats()
+        started = time.perf_counter()
+
+        def collect(futures):
+            for f in futures:
+                result = f.result()
+                stats.rows += result["rows"]
+                stats.batches += 1
+                stats.embedded_texts += result["embedded"]
+                stats.cached_texts += result["cached"]
+                stats.retries += result["retries"]
+                stats.seconds = time.perf_counter() - started
+                print(f"  … ingested {stats.rows} cars in {stats.batches} batches "
+                      f"({stats.rows_per_second:.1f} cars/s)")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = set()
+            batch = []
+            for item in rows:
+                batch.append(item)
+                if len(batch) < batch_size:
+                    continue
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(self._ingest_batch, batch))
+                batch = []
+            if batch:
+                in_flight.add(pool.submit(self._ingest_batch, batch))
+            collect(wait(in_flight).done)
+
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def _ingest_batch(self, batch) -> Dict[str, int]:
+        """Embed (retrieval + personal) và upsert một batch xe."""
+        texts = []
+        for row, _ in batch:
+            texts.append(self._row_text(row))
+            texts.append(self._personal_text(row))
+        retries = []
+        counts = {}
+        vecs = self._get_embeddings(texts, on_retry=lambda: retries.append(1), counts=counts)
+        embedded = counts["embedded"]
         points = []
-        for _, row in self.df.iterrows():
-            text = self._row_text(row)
-            vec = self._get_openai_embedding(text)  # Get OpenAI embedding
-            payload = row.to_dict()
-            points.append(PointStruct(id=str(uuid.uuid4()), vector=vec, payload=payload))
-        self.qdrant.upsert(collection_name="cars", points=points)
-        print(f"✅ Upserted {len(points)} cars into Qdrant (:path:)")
+        for i, (row, content_hash) in enumerate(batch):
+            # Bỏ giá trị NaN (vd. xe chưa có PriceUSD) để filter IsEmpty nhận ra field bị thiếu
+            payload = {k: v for k, v in row.to_dict().items() if not (isinstance(v, float) and np.isnan(v))}
+            payload["_content_hash"] = content_hash
+            points.append((self._point_id(row), payload, vecs[2 * i], vecs[2 * i + 1]))
+        if self.index is not None:
+            # Chỉ gom lại; sync() commit một lần sau khi ingest xong
+            self.index.upsert(points)
+        else:
+            from qdrant_client.models import PointStruct
+            structs = [
+                PointStruct(id=pid, vector={RETRIEVAL_VECTOR: rvec, PERSONAL_VECTOR: pvec}, payload=payload)
+                for pid, payload, rvec, pvec in points
+            ]
+            with self._qdrant_access(write=True):
+                self.qdrant.upsert(collection_name=self.collection, points=structs)
+        return {"rows": len(points), "embedded": embedded, "cached": len(texts) - embedded, "retries": len(retries)}
+
+    def _upsert(self):
+        stats = self.last_sync = self.sync(self.df)
+        print(f"✅ Synced {len(self.df)} cars into Qdrant (:path:): {stats}")
 
     def retrieve(self, user_query: str, top_k: int = 15,
-                 filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
-        qvec = self._get_openai_embedding(user_query)  # Get OpenAI embedding for the query
-        qfilter = None
-        if filters:
-            must = []
-            for k, v in filters.items():
+                 filters: Optional[Dict[str, Any]] = None,
+                 query_vector: Optional[List[float]] = None) -> List[CarHit]:
+        """query_vector: embedding của user_query nếu đã có (vd. từ EmbeddingMemo của request)."""
+        qvec = query_vector if query_vector is not None else self._get_embedding(user_query)
+        return self.search_by_vector(qvec, top_k=top_k, filters=filters)
+
+    def search_by_vector(self, qvec: List[float], top_k: int = 15,
+                         filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
+        with stage_timer("vector_search"):
+            if self.index is not None:
+                return self.index.search(qvec, top_k=top_k, filters=filters)
+            from utils.qdrant_params import search_params
+            with self._qdrant_access():
+                results = self.qdrant.query_points(
+                    collection_name=self.collection,
+                    query=qvec,
+                    using=RETRIEVAL_VECTOR,
+                    limit=top_k,
+                    query_filter=self._build_filter(filters),
+                    search_params=search_params(RECOMMENDER_CONFIG),
+                    with_payload=True,
+                    with_vectors=[PERSONAL_VECTOR]
+                )
+            return self._to_hits(results.points)
+
+    async def aretrieve(self, user_query: str, top_k: int = 15,
+                        filters: Optional[Dict[str, Any]] = None,
+                        query_vector: Optional[List[float]] = None) -> List[CarHit]:
+        qvec = query_vector if query_vector is not None else await self._aget_embedding(user_query)
+        return await self.asearch_by_vector(qvec, top_k=top_k, filters=filters)
+
+    async def asearch_by_vector(self, qvec: List[float], top_k: int = 15,
+                                filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
+        if self.aqdrant is None:
+            return await asyncio.to_thread(self.search_by_vector, qvec, top_k, filters)
+        from utils.qdrant_params import search_params
+        with stage_timer("vector_search"):
+            results = await self.aqdrant.query_points(
+                collection_name=self.collection,
+                query=qvec,
+                using=RETRIEVAL_VECTOR,
+                limit=top_k,
+                query_filter=self._build_filter(filters),
+                search_params=search_params(RECOMMENDER_CONFIG),
+                with_payload=True,
+                with_vectors=[PERSONAL_VECTOR]
+            )
+            return self._to_hits(results.points)
+
+    def search_relaxed(self, qvec: List[float], top_k: int = 15,
+                       filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
+        """
+        search_by_vector, nhưng khi filters trả về ít hơn top_k xe thì bỏ dần filter mềm
+        (RELAXABLE_FILTER_KEYS) và search lại; xe tìm thêm được đánh dấu hit.relaxed_filters.
+        """
+        hits = self.search_by_vector(qvec, top_k=top_k, filters=filters)
+        for dropped, relaxed in _relaxation_steps(filters):
+            if len(hits) >= top_k:
+                break
+            hits = _merge_relaxed(hits, self.search_by_vector(qvec, top_k=top_k, filters=relaxed), dropped, top_k)
+        return hits
+
+    async def asearch_relaxed(self, qvec: List[float], top_k: int = 15,
+                              filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
+        """Bản async của search_relaxed."""
+        hits = await self.asearch_by_vector(qvec, top_k=top_k, filters=filters)
+        for dropped, relaxed in _relaxation_steps(filters):
+            if len(hits) >= top_k:
+                break
+            more = await self.asearch_by_vector(qvec, top_k=top_k, filters=relaxed)
+            hits = _merge_relaxed(hits, more, dropped, top_k)
+        return hits
+
+    @staticmethod
+    def _build_filter(filters: Optional[Dict[str, Any]]) -> Optional["Filter"]:
+        """
+        filters: {payload key: điều kiện}
+          - giá trị đơn -> MatchValue
+          - list/tuple/set -> MatchAny
+          - dict {"gte", "lte", "gt", "lt", "allow_missing"} -> Range;
+            allow_missing=True thì point thiếu field vẫn qua filter
+        """
+        if not filters:
+            return None
+        from qdrant_client.models import (
+            FieldCondition, Filter, IsEmptyCondition, MatchAny, MatchValue, PayloadField, Range
+        )
+        must = []
+        for k, v in filters.items():
+            if isinstance(v, dict):
+                bounds = {b: v[b] for b in ("gte", "lte", "gt", "lt") if v.get(b) is not None}
+                condition = FieldCondition(key=k, range=Range(**bounds))
+                if v.get("allow_missing"):
+                    condition = Filter(should=[condition, IsEmptyCondition(is_empty=PayloadField(key=k))])
+                must.append(condition)
+            elif isinstance(v, (list, tuple, set)):
+                must.append(FieldCondition(key=k, match=MatchAny(any=list(v))))
+            else:
                 must.append(FieldCondition(key=k, match=MatchValue(value=v)))
-            qfilter = Filter(must=must)
-        results = self.qdrant.search(
-            collection_name="cars",
-            query_vector=qvec,
-            limit=top_k,
-            query_filter=qfilter
+        return Filter(must=must)
+
+    @staticmethod
+    def build_filters(makes: Optional[List[str]] = None, body_types: Optional[List[str]] = None,
+                      engine_type: Optional[str] = None, price_range=None, year_range=None) -> Dict[str, Any]:
+        """
+        Ràng buộc của người dùng -> filters cho retrieve/search (keyword so khớp lowercase):
+          - price_range / year_range: (min, max), None ở một đầu = không giới hạn
+          - xe chưa có PriceUSD không bị loại bởi price_range
+        """
+        filters: Dict[str, Any] = {}
+        for col, values in (("Make", makes), ("BodyType", body_types)):
+            keys = [_filter_key(v) for v in (values or []) if _filter_key(v)]
+            if keys:
+                filters[FILTER_KEY_COLUMNS[col]] = keys
+        if _filter_key(engine_type):
+            filters[FILTER_KEY_COLUMNS["EngineType"]] = _filter_key(engine_type)
+        if price_range and any(b is not None for b in price_range):
+            filters["PriceUSD"] = {"gte": price_range[0], "lte": price_range[1], "allow_missing": True}
+        if year_range and any(b is not None for b in year_range):
+            filters["Year"] = {"gte": year_range[0], "lte": year_range[1]}
+        return filters
+
+    @staticmethod
+    def _to_hits(results) -> List[CarHit]:
+        return [
+            CarHit(
+                id=str(r.id), vec_score=float(r.score), payload=r.payload,
+                personal_vec=(r.vector or {}).get(PERSONAL_VECTOR)
+            )
+            for r in results
+        ]
+
+    def search_batch_by_vectors(self, qvecs: List[List[float]], top_k: int = 15,
+                                filters: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[CarHit]]:
+        """Nhiều query trong một lần gọi Qdrant query_batch_points (hoặc một phép nhân ma trận với index NumPy)."""
+        filters = filters or [None] * len(qvecs)
+        with stage_timer("vector_search"):
+            return self._search_batch(qvecs, top_k, filters)
+
+    def search_batch_relaxed(self, qvecs: List[List[float]], top_k: int = 15,
+                             filters: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[CarHit]]:
+        """
+        search_batch_by_vectors + nới filter mềm như search_relaxed: mỗi bước nới là một
+        search_batch cho các query còn thiếu xe.
+        """
+        filters = filters or [None] * len(qvecs)
+        hits_per_item = self.search_batch_by_vectors(qvecs, top_k=top_k, filters=filters)
+        steps = [_relaxation_steps(f) for f in filters]
+        for step in range(len(RELAXABLE_FILTER_KEYS)):
+            todo = [i for i, hits in enumerate(hits_per_item) if len(hits) < top_k and step < len(steps[i])]
+            if not todo:
+                break
+            more = self.search_batch_by_vectors(
+                [qvecs[i] for i in todo], top_k=top_k, filters=[steps[i][step][1] for i in todo]
+            )
+            for i, extra in zip(todo, more):
+                hits_per_item[i] = _merge_relaxed(hits_per_item[i], extra, steps[i][step][0], top_k)
+        return hits_per_item
+
+    def _search_batch(self, qvecs: List[List[float]], top_k: int,
+                      filters: List[Optional[Dict[str, Any]]]) -> List[List[CarHit]]:
+        if self.index is not None:
+            return self.index.search_batch(qvecs, top_k=top_k, filters=filters)
+        from qdrant_client.models import QueryRequest
+        from utils.qdrant_params import search_params
+        requests = [
+            QueryRequest(
+                query=qvec,
+                using=RETRIEVAL_VECTOR,
+                limit=top_k,
+                filter=self._build_filter(f),
+                params=search_params(RECOMMENDER_CONFIG),
+                with_payload=True,
+                with_vector=[PERSONAL_VECTOR],
+            )
+            for qvec, f in zip(qvecs, filters)
+        ]
+        with self._qdrant_access():
+            results = self.qdrant.query_batch_points(collection_name=self.collection, requests=requests)
+        return [self._to_hits(r.points) for r in results]
+
+    def recommend_batch(self, items: List[Dict[str, Any]], top_k: int = 15,
+                        top_n: Optional[int] = None) -> List[Any]:
+        """
+        Retrieve + rerank cho nhiều profile:
+          - items: mỗi phần tử gồm user_pref, pref_text, strategy, business_cfg
+            (+ tuỳ chọn query, filters) như main.build_search_inputs
+          - mọi text được embed trong các request batch (qua cache), mọi query trong một search_batch
+            (thêm một search_batch cho mỗi bước nới filter mềm, chỉ với các query còn thiếu xe)
+          - lỗi của từng item được cô lập: phần tử kết quả là Exception thay vì List[CarHit]
+        """
+        queries = [item.get("query") or item["pref_text"] for item in items]
+        texts = list(dict.fromkeys(queries + [item["pref_text"] for item in items]))
+        batch_size = RECOMMENDER_CONFIG["ingest_batch_size"]
+        vectors = {}
+        for i in range(0, len(texts), batch_size):
+            chunk = texts[i:i + batch_size]
+            vectors.update(zip(chunk, self._get_embeddings(chunk)))
+        hits_per_item = self.search_batch_relaxed(
+            [vectors[q] for q in queries], top_k=top_k, filters=[item.get("filters") for item in items]
         )
-        hits = [CarHit(id=str(r.id), vec_score=float(r.score), payload=r.payload) for r in results]
-        return hits
+        results = []
+        for item, hits in zip(items, hits_per_item):
+            try:
+                results.append(self.hybrid_rerank(
+                    hits=hits,
+                    user_pref=item["user_pref"],
+                    pref_text=item["pref_text"],
+                    strategy=item.get("strategy", "default"),
+                    business_cfg=item.get("business_cfg"),
+                    top_n=top_n,
+                    pref_vec=vectors[item["pref_text"]],
+                ))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def arecommend(self, query: str, user_pref: Dict[str, Any], pref_text: str,
+                         strategy: str = "default", business_cfg: Dict[str, Any] = None,
+                         top_k: int = 15, top_n: Optional[int] = None,
+                         filters: Optional[Dict[str, Any]] = None,
+                         memo: Optional[EmbeddingMemo] = None) -> List[CarHit]:
+        """
+        Retrieve + rerank bất đồng bộ: embedding của query và pref_text chạy đồng thời
+        (qua memo của request nên text trùng nhau chỉ embed một lần), search qua AsyncQdrantClient
+        (hoặc thread với embedded Qdrant), filter mềm được nới như search_relaxed, rerank là CPU thuần.
+        Hit thiếu personal vector được embed async trước khi rerank (rerank không gọi embedding sync).
+        """
+        memo = memo or self.embedding_memo()
+        qvec, pref_vec = await asyncio.gather(memo.aget(query), memo.aget(pref_text))
+        hits = await self.asearch_relaxed(qvec, top_k=top_k, filters=filters)
+        CANDIDATES.observe(len(hits), phase="retrieved")
+        await self._afill_personal_vecs(hits, memo)
+        return self.hybrid_rerank(
+            hits=hits, user_pref=user_pref, pref_text=pref_text, strategy=strategy,
+            business_cfg=business_cfg, top_n=top_n, pref_vec=pref_vec
+        )
+
+    async def _afill_personal_vecs(self, hits: List[CarHit], memo: EmbeddingMemo):
+        """Embed (qua memo, đồng thời) personal text của các hit mà point trong Qdrant chưa có vector."""
+        missing = [h for h in hits if h.personal_vec is None]
+        if not missing:
+            return
+        vectors = await asyncio.gather(*(memo.aget(self._personal_text(h.payload)) for h in missing))
+        for h, vec in zip(missing, vectors):
+            h.personal_vec = vec
 
-    def rule_personal_score(self, car: Dict[str, Any], pref: Dict[str, Any], reasons: List[str]) -> float:
-        score = 0.0
-        eng = pref.get("EngineType")
-        if eng and str(car.get("EngineType","")).lower() == str(eng).lower():
-            score += 3.0
-            reasons.append(f"EngineType match: {eng}")
-        bt = pref.get("BodyType")
-        if bt and str(car.get("BodyType","")).lower() == str(bt).lower():
-            score += 2.0
-            reasons.append(f"BodyType match: {bt}")
-        price_cap = safe_float(pref.get("PriceMax"), None)
-        price = safe_float(car.get("PriceUSD"), None)
-        if price_cap is not None and price is not None and price <= price_cap:
-            score += 2.0
-            reasons.append(f"Price ≤ {price_cap}")
-        pm = [x.lower() for x in pref.get("PreferredMakes", [])]
-        if pm and str(car.get("Make","")).lower() in pm:
-            score += 1.5
-            reasons.append(f"Preferred make: {car.get('Make')}")
-        pmdl = [x.lower() for x in pref.get("PreferredModels", [])]
-        if pmdl and str(car.get("Model","")).lower() in pmdl:
-            score += 1.0
-            reasons.append(f"Preferred model: {car.get('Model')}")
-        uc_kw = (pref.get("UseCaseKeyword") or "").lower()
-        if uc_kw and uc_kw in str(car.get("Description","")).lower():
-            score += 1.5
-            reasons.append(f"UseCase contains '{uc_kw}'")
-        env = (pref.get("DrivingEnvironment") or "").lower()
-        if env and env in str(car.get("DrivingEnvironment","")).lower():
-            score += 1.0
-            reasons.append(f"Driving environment: {env}")
-        return score
-
-    def emb_personal_score(self, car: Dict[str, Any], pref_text_vec, reasons: List[str]) -> float:
-        desc = car.get("Description", "") or ""
-        meta = f"{car.get('EngineType','')} {car.get('BodyType','')} {car.get('UseCase','')}"
-        txt = f"{desc} | {meta}".strip(" |")
-        car_vec = self._get_openai_embedding(txt)  # Get OpenAI embedding for the car description
-        sim = float(util.cos_sim(pref_text_vec, car_vec).item())
-        return sim
-
-    def business_score(self, car: Dict[str, Any], biz_cfg: Dict[str, Any], reasons: List[str]) -> float:
-        brand_priority = safe_float(car.get("brand_priority"), 0.4)
-        margin = safe_float(car.get("marginUSD"), 3000.0)
-        inv_days = safe_float(car.get("inventory_days"), 20.0)
-        margin_clip = (1500, 9000)
-        inv_clip = (5, 90)
-        m_scaled = (np.clip(margin, *margin_clip) - margin_clip[0]) / (margin_clip[1] - margin_clip[0] + 1e-9)
-        i_scaled = (np.clip(inv_days, *inv_clip) - inv_clip[0]) / (inv_clip[1] - inv_clip[0] + 1e-9)
-        score = 0.4 * brand_priority + 0.3 * m_scaled + 0.3 * i_scaled
-        promoted_brands = [b.lower() for b in biz_cfg.get("promoted_brands", [])]
-        promoted_models = [(m.lower()) for m in biz_cfg.get("promoted_models", [])]
-        car_brand = str(car.get("Make","")).lower()
-        car_model = str(car.get("Model","")).lower()
-        if car_brand in promoted_brands:
-            score += 0.15
-            reasons.append(f"Promoted brand: {car.get('Make')}")
-        if car_model in promoted_models:
-            score += 0.2
-            reasons.append(f"Promoted model: {car.get('Model')}")
-        return float(score)
+    def emb_personal_scores(self, hits: List[CarHit], pref_text_vec) -> np.ndarray:
+        """
+        Cosine giữa pref vector và personal vector của tất cả hits trong một phép nhân ma trận.
+        Vector lấy từ Qdrant (with_vectors); chỉ embed lại khi point thiếu vector.
+        """
+        if not hits:
+            return np.zeros(0, dtype=np.float32)
+        mat = np.asarray([
+            h.personal_vec if h.personal_vec is not None else self._get_embedding(self._personal_text(h.payload))
+            for h in hits
+        ], dtype=np.float32)
+        q = np.asarray(pref_text_vec, dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=1) * np.linalg.norm(q)
+        return (mat @ q) / np.maximum(norms, 1e-12)
 
     def hybrid_rerank(self,
         hits: List[CarHit],
         user_pref: Dict[str, Any],
         pref_text: str,
         strategy: str = "default",
-        business_cfg: Dict[str, Any] = None
+        business_cfg: Dict[str, Any] = None,
+        top_n: Optional[int] = None,
+        pref_vec: Optional[List[float]] = None
     ) -> List[CarHit]:
+        """
+        Rerank vector hoá: tính rule/emb/business score và điểm blend theo STRATEGIES trên mảng
+        NumPy cho toàn bộ hits, rồi chọn top_n bằng partial sort (None = trả về tất cả).
+        pref_vec: embedding của pref_text nếu đã có sẵn (tránh embed lại).
+        Hit trả về luôn có contributions (số); reasons chỉ dựng ngay khi deferred_explanations tắt,
+        còn không thì để None và render bằng hit_reasons() cho xe thực sự trả về.
+        """
+        if not hits:
+            return []
+        if pref_vec is None:
+            pref_vec = self._get_embedding(pref_text)
+        with stage_timer("rerank"):
+            return self._rerank(hits, user_pref, strategy, business_cfg or {}, top_n, pref_vec)
+
+    def _rerank(self, hits: List[CarHit], user_pref: Dict[str, Any], strategy: str,
+                business_cfg: Dict[str, Any], top_n: Optional[int], pref_vec: List[float]) -> List[CarHit]:
         cfg = STRATEGIES.get(strategy, STRATEGIES["default"])
-        wR, wP, wB = cfg["wR"], cfg["wP"], cfg["wB"]
-        gamma_rule = cfg["gamma_rule"]
-        business_cfg = business_cfg or {}
-        pref_vec = self._get_openai_embedding(pref_text)  # Get OpenAI embedding for preferences
-        for h in hits:
-            h.reasons = []
-            h.rule_score = self.rule_personal_score(h.payload, user_pref, h.reasons)
-            h.emb_score = self.emb_personal_score(h.payload, pref_vec, h.reasons)
-            h.biz_score = self.business_score(h.payload, business_cfg, h.reasons)
-        v_scaled = minmax_scale([h.vec_score for h in hits])
-        r_scaled = minmax_scale([h.rule_score for h in hits])
-        e_scaled = minmax_scale([h.emb_score for h in hits])
-        b_scaled = minmax_scale([h.biz_score for h in hits])
-        for i, h in enumerate(hits):
-            p_part = gamma_rule * r_scaled[i] + (1 - gamma_rule) * e_scaled[i]
-            h.final_score = wR * v_scaled[i] + wP * p_part + wB * b_scaled[i]
-        ranked = sorted(hits, key=lambda x: x.final_score, reverse=True)
+        cols = self._hit_columns(hits)
+        rule = rule_scores(cols, user_pref)
+        biz = business_scores(cols, business_cfg)
+        emb = self.emb_personal_scores(hits, pref_vec)
+        vec = np.fromiter((h.vec_score for h in hits), dtype=np.float64, count=len(hits))
+        final = blend_scores(vec, rule["score"], emb, biz["score"], cfg)
+        deferred = RECOMMENDER_CONFIG["deferred_explanations"]
+        ranked = []
+        for i in top_k_indices(final, top_n):
+            h = hits[i]
+            h.rule_score = float(rule["score"][i])
+            h.emb_score = float(emb[i])
+            h.biz_score = float(biz["score"][i])
+            h.final_score = float(final[i])
+            h.contributions = feature_contributions(rule, biz, i)
+            h.reasons = None if deferred else reasons_from_contributions(h.payload, user_pref, h.contributions)
+            ranked.append(h)
         return ranked
 
-    def explain_hit(self, h: CarHit) -> str:
+    @staticmethod
+    def explain_hit(h: CarHit, user_pref: Optional[Dict[str, Any]] = None) -> str:
+        """Breakdown vec/rule/emb/biz/final + reasons của một hit (reasons render từ contributions nếu cần)."""
         p = h.payload
         parts = [
             f"{p.get('Year')} {p.get('Make')} {p.get('Model')} {p.get('Trim')}",
@@ -176,5 +796,258 @@ class HybridCarRecommender:
             f"biz={h.biz_score:.3f}",
             f"final={h.final_score:.3f}"
         ]
-        reason_str = "; ".join(h.reasons[:4])
+        reason_str = "; ".join(hit_reasons(h, user_pref)[:4])
         return f"- {' | '.join(parts)}\n  Reasons: {reason_str}"
+
+
+def _filter_key(value) -> str:
+    return str(value).strip().lower() if value is not None else ""
+
+
+def _relaxation_steps(filters: Optional[Dict[str, Any]]) -> List[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    """
+    filters -> [(các key đã bỏ, filters còn lại)], mỗi bước bỏ thêm một filter mềm có mặt
+    theo RELAXABLE_FILTER_KEYS; relax_soft_filters tắt -> [].
+    """
+    if not filters or not RECOMMENDER_CONFIG["relax_soft_filters"]:
+        return []
+    steps, dropped, remaining = [], (), dict(filters)
+    for key in RELAXABLE_FILTER_KEYS:
+        if key in remaining:
+            dropped += (key,)
+            remaining = {k: v for k, v in remaining.items() if k != key}
+            steps.append((dropped, remaining))
+    return steps
+
+
+def _merge_relaxed(hits: List[CarHit], more: List[CarHit], dropped: Tuple[str, ...], top_k: int) -> List[CarHit]:
+    """Giữ nguyên hits đã có, thêm xe mới từ lần search đã nới (đánh dấu relaxed_filters) cho đủ top_k."""
+    seen = {h.id for h in hits}
+    merged = list(hits)
+    for h in more:
+        if len(merged) >= top_k:
+            break
+        if h.id not in seen:
+            h.relaxed_filters = dropped
+            merged.append(h)
+    return merged
+
+
+def _price_from_description(text) -> float:
+    """Giá ghi trong mô tả ("Priced around $22,000" -> 22000.0); không thấy giá -> NaN."""
+    match = PRICE_PATTERN.search(str(text or ""))
+    return float(match.group(1).replace(",", "")) if match else np.nan
+
+
+def attach_filter_fields(df):
+    """
+    Thêm các field dùng cho pre-filter trong Qdrant:
+      - MakeKey / BodyTypeKey / EngineTypeKey: bản lowercase, bỏ khoảng trắng thừa
+      - PriceUSD (nếu catalog chưa có): base_price thấp nhất trong data/vehicles.json theo
+        Year/Make/Model/Trim, không có thì lấy giá ghi trong Description
+    """
+    from utils.vehicle_repository import get_vehicle_repository
+
+    df = df.copy()
+    for col, key_col in FILTER_KEY_COLUMNS.items():
+        df[key_col] = df[col].map(_filter_key)
+    if "PriceUSD" not in df.columns:
+        base_prices: Dict[tuple, float] = {}
+        for v in get_vehicle_repository().all():
+            key = (v.year, v.make, v.model, v.trim)
+            base_prices[key] = min(base_prices.get(key, v.base_price), v.base_price)
+        df["PriceUSD"] = [
+            base_prices.get((year, make, model, trim), _price_from_description(desc))
+            for year, make, model, trim, desc in zip(df["Year"], df["Make"], df["Model"], df["Trim"], df["Description"])
+        ]
+    return df
+
+
+# Ngân sách retry: "ingest" (ingest/warm/batch offline, chịu chờ được) và "request" (embed query
+# trong lúc xử lý request, phải fail nhanh) -> (key số lần retry, key backoff) trong RECOMMENDER_CONFIG
+RETRY_BUDGETS = {
+    "ingest": ("embedding_max_retries", "embedding_backoff_seconds"),
+    "request": ("embedding_request_max_retries", "embedding_request_backoff_seconds"),
+}
+
+
+def _retry_budget(budget: str):
+    retries_key, backoff_key = RETRY_BUDGETS[budget]
+    return RECOMMENDER_CONFIG[retries_key], RECOMMENDER_CONFIG[backoff_key]
+
+
+def _with_retry(fn, *args, on_retry=None, budget: str = "ingest"):
+    """Gọi fn, retry với exponential backoff khi lỗi tạm thời (kết nối, timeout, 429, 5xx)."""
+    max_retries, backoff = _retry_budget(budget)
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_transient_error(e):
+                raise
+            if on_retry:
+                on_retry()
+            time.sleep(backoff * (2 ** attempt))
+
+
+async def _awith_retry(fn, *args, budget: str = "ingest"):
+    """Bản async của _with_retry (asyncio.sleep thay cho time.sleep)."""
+    max_retries, backoff = _retry_budget(budget)
+    for attempt in range(max_retries + 1):
+        try:
+            return await fn(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_transient_error(e):
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt))
+
+
+# -----------------------------
+# Embedding provider + cache
+# -----------------------------
+_embedding_provider: Optional[EmbeddingProvider] = None
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Provider dùng chung, chọn theo RECOMMENDER_CONFIG["embedding_provider"]."""
+    global _embedding_provider
+    with _embedding_cache_lock:
+        if _embedding_provider is None:
+            _embedding_provider = build_embedding_provider(RECOMMENDER_CONFIG)
+        return _embedding_provider
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                RECOMMENDER_CONFIG["embedding_cache_path"],
+                max_memory_entries=RECOMMENDER_CONFIG["embedding_cache_memory_entries"],
+                max_disk_entries=RECOMMENDER_CONFIG["embedding_cache_disk_entries"],
+            )
+        return _embedding_cache
+
+
+def _embedding_cache_metrics():
+    """Cho /metrics: bộ đếm hit/miss của embedding cache (nếu đã khởi tạo)."""
+    cache = _embedding_cache
+    if cache is None:
+        return []
+    help_text = "Số lần tra embedding cache theo kết quả"
+    return [
+        ("car_recommender_embedding_cache_lookups_total", help_text, {"result": result}, getattr(cache, result))
+        for result in ("hits_memory", "hits_disk", "misses")
+    ]
+
+
+REGISTRY.register_collector(_embedding_cache_metrics, metric_type="counter")
+
+
+def warm_embedding_cache(csv_path: str = None, queries: List[str] = None) -> int:
+    """
+    Pre-populate cache offline từ catalog (text của _row_text/_personal_text) và danh sách query hay gặp,
+    không cần dựng Qdrant. Trả về số text phải gọi embedding provider.
+    """
+    import pandas as pd
+    df = attach_business_signals(pd.read_csv(csv_path or RECOMMENDER_CONFIG["csv_path"]))
+    texts = []
+    for _, row in df.iterrows():
+        texts.append(HybridCarRecommender._row_text(row))
+        texts.append(HybridCarRecommender._personal_text(row))
+    texts.extend(queries or [])
+    provider = get_embedding_provider()
+    return get_embedding_cache().warm(
+        provider.model_name, texts, lambda batch: _with_retry(provider.embed, batch),
+        batch_size=RECOMMENDER_CONFIG["ingest_batch_size"],
+    )
+
+
+# -----------------------------
+# Process-wide singleton
+# -----------------------------
+_recommender: Optional[HybridCarRecommender] = None
+_recommender_lock = threading.Lock()
+_signal_refresher: Optional[BusinessSignalRefresher] = None
+
+
+def init_recommender(csv_path: str = None) -> HybridCarRecommender:
+    """
+    Tạo recommender dùng chung cho cả process (gọi từ lifespan của FastAPI).
+    Gọi nhiều lần chỉ tạo đúng một instance.
+    """
+    global _recommender, _signal_refresher
+    with _recommender_lock:
+        if _recommender is None:
+            _recommender = HybridCarRecommender(csv_path or RECOMMENDER_CONFIG["csv_path"])
+            interval = RECOMMENDER_CONFIG["business_signals_refresh_seconds"]
+            if interval:
+                _signal_refresher = BusinessSignalRefresher(
+                    RECOMMENDER_CONFIG["business_signals_path"],
+                    _recommender.refresh_business_signals,
+                    interval_seconds=interval,
+                )
+                _signal_refresher.start()
+        return _recommender
+
+
+def get_recommender() -> HybridCarRecommender:
+    """
+    Lấy recommender dùng chung; nếu warm-up lúc startup chưa chạy/thất bại thì khởi tạo lazily.
+    """
+    rec = _recommender
+    if rec is None:
+        rec = init_recommender()
+    return rec
+
+
+def reload_recommender(csv_path: str = None) -> Dict[str, int]:
+    """
+    Reload catalog ngoài luồng request (endpoint /recommender/reload hoặc job định kỳ).
+    Chỉ phần chênh lệch so với Qdrant được upsert/xoá.
+    """
+    with _recommender_lock:
+        rec = _recommender
+    if rec is None:
+        return init_recommender(csv_path).last_sync
+    return rec.reload(csv_path)
+
+
+def _detach_recommender() -> Optional[HybridCarRecommender]:
+    """Dừng refresher nền và gỡ recommender dùng chung; trả về instance cũ để đóng."""
+    global _recommender, _signal_refresher
+    with _recommender_lock:
+        if _signal_refresher is not None:
+            _signal_refresher.stop()
+            _signal_refresher = None
+        rec, _recommender = _recommender, None
+    return rec
+
+
+def shutdown_recommender():
+    rec = _detach_recommender()
+    if rec is not None:
+        rec.close()
+
+
+async def ashutdown_recommender():
+    """Như shutdown_recommender nhưng đóng cả AsyncQdrantClient (gọi từ lifespan)."""
+    rec = _detach_recommender()
+    if rec is not None:
+        await rec.aclose()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pre-populate the embedding cache offline")
+    parser.add_argument("--csv", default=RECOMMENDER_CONFIG["csv_path"])
+    parser.add_argument("--queries", help="file text, mỗi dòng một query")
+    args = parser.parse_args()
+    queries = []
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    computed = warm_embedding_cache(args.csv, queries)
+    print(f"✅ Embedding cache warmed ({computed} new embeddings): {get_embedding_cache().stats()}")
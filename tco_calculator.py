@@ -1,10 +1,113 @@
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from configs.region_expense_config import REGION_CONFIG
 from models.breakdown_item import BreakdownItem
 from models.profile import Profile
+from models.region_coefficients import RegionCoefficients
 from models.tco_calculator_summary import TCOCalculatorSummary
 from models.vehicle import Vehicle
 from models.voucher import Voucher
 
+DEFAULT_MAINTENANCE = {"base_maint": 800, "escalation": 1.2}
+
+
+def geometric_sum(escalation, years):
+    """
+    Tổng sum(escalation ** (y - 1)) với y = 1..years dạng closed-form, nhận scalar hoặc mảng
+    (broadcast được): (e^Y - 1) / (e - 1), và = Y khi e == 1.
+    """
+    e = np.asarray(escalation, dtype=float)
+    y = np.asarray(years, dtype=float)
+    flat = np.isclose(e, 1.0)
+    denom = np.where(flat, 1.0, e - 1.0)
+    result = np.where(flat, y, (np.power(e, y) - 1.0) / denom)
+    return float(result) if result.ndim == 0 else result
+
+
+def build_region_coefficients(state: str, years: int) -> RegionCoefficients:
+    config = REGION_CONFIG[state]
+    maintenance = config.get("maintenance", {})
+    parking_base = config.get("parking_fee", 0)
+    parking_escalation = config.get("parking_escalation", 1.0)
+    toll_base = config.get("toll_fee", 0)
+    toll_escalation = config.get("toll_escalation", 1.0)
+    return RegionCoefficients(
+        state=state,
+        years=years,
+        tax_rate=config["tax_rate"],
+        registration_fee=config["registration_fee"],
+        fuel_price=config["fuel_price"],
+        electricity_price=config["electricity_price"],
+        insurance_rate=config["insurance_base"],
+        insurance_factor=config["insurance_base"] * years,
+        parking_base=parking_base,
+        parking_escalation=parking_escalation,
+        parking_total=parking_base * geometric_sum(parking_escalation, years),
+        toll_base=toll_base,
+        toll_escalation=toll_escalation,
+        toll_total=toll_base * geometric_sum(toll_escalation, years),
+        maintenance=maintenance,
+        maintenance_totals={
+            brand: conf["base_maint"] * geometric_sum(conf["escalation"], years)
+            for brand, conf in maintenance.items()
+        },
+        default_maintenance_total=DEFAULT_MAINTENANCE["base_maint"] * geometric_sum(DEFAULT_MAINTENANCE["escalation"], years),
+    )
+
+
+_coefficients: Dict[Tuple[str, int], RegionCoefficients] = {}
+_coefficients_lock = threading.Lock()
+_config_fingerprint = None
+_config_version = 0  # tăng mỗi lần compile lại bảng hệ số
+
+
+def region_config_fingerprint() -> str:
+    return json.dumps(REGION_CONFIG, sort_keys=True, default=str)
+
+
+def get_region_coefficients(state: str, years: int) -> RegionCoefficients:
+    """Hệ số (state, years) từ bảng đã compile; tính và lưu lại nếu chưa có."""
+    coef = _coefficients.get((state, years))
+    if coef is None:
+        with _coefficients_lock:
+            coef = _coefficients.setdefault((state, years), build_region_coefficients(state, years))
+    return coef
+
+
+def precompile_region_coefficients(horizons: Sequence[int] = range(1, 11), fingerprint: str = None):
+    """Compile bảng hệ số cho mọi bang x số năm (gọi lúc startup)."""
+    global _config_fingerprint, _config_version
+    with _coefficients_lock:
+        _coefficients.clear()
+        for state in REGION_CONFIG:
+            for years in horizons:
+                _coefficients[(state, years)] = build_region_coefficients(state, years)
+        _config_fingerprint = fingerprint or region_config_fingerprint()
+        _config_version += 1
+
+
+def refresh_region_coefficients_if_changed(horizons: Sequence[int] = range(1, 11)) -> bool:
+    """
+    So fingerprint của REGION_CONFIG (serialize một lần) với lần compile trước; compile lại nếu khác.
+    Mọi đường tính TCO đi qua đây khi tạo TCOCalculator, nên REGION_CONFIG đổi là có hiệu lực ngay.
+    """
+    fingerprint = region_config_fingerprint()
+    if fingerprint == _config_fingerprint:
+        return False
+    precompile_region_coefficients(horizons, fingerprint)
+    return True
+
+
+def region_config_version() -> int:
+    """Kiểm tra REGION_CONFIG (compile lại nếu đổi) rồi trả về version của bảng hệ số (cho response cache)."""
+    refresh_region_coefficients_if_changed()
+    return _config_version
+
 
 class TCOCalculator:
     """
@@ -19,13 +122,18 @@ class TCOCalculator:
     Các phương thức:
       - _apply_voucher: kiểm tra voucher có áp dụng cho xe/năm không, trả về giá trị giảm giá
       - calculate_tco: tính toán chi phí sở hữu xe, trả về breakdown từng loại chi phí và tổng
+      - calculate_tco_batch: tính TCO cho nhiều xe x nhiều số năm cùng lúc (NumPy broadcasting)
+      - tco_from_batch: một ô của kết quả calculate_tco_batch -> cùng dạng với calculate_tco
     """
 
     def __init__(self, profile: Profile):
         state = profile.state
         if state not in REGION_CONFIG:
             raise ValueError(f"No config found for state {state}")
+        # Bảng hệ số compile lại trước khi dùng nếu REGION_CONFIG đã đổi (stream/batch/bulk đều qua đây)
+        refresh_region_coefficients_if_changed()
         self.config = REGION_CONFIG[state]
+        self.state = state
         self.profile = profile
         self.annual_miles = profile.annual_mileage or 12000
 
@@ -85,11 +193,15 @@ class TCOCalculator:
             "available_vouchers": [v.__dict__ for v in available_vouchers]
         }
 
+    def _coef(self, years: int) -> RegionCoefficients:
+        return get_region_coefficients(self.state, years)
+
     def _calc_initial_cost(self, vehicle: Vehicle, voucher: Voucher, years: int):
+        coef = self._coef(years)
         base_price = vehicle.base_price
         applied_voucher = self._apply_voucher(vehicle, voucher, vehicle.year)
-        tax = base_price * self.config["tax_rate"]
-        reg_fee = self.config["registration_fee"]
+        tax = base_price * coef.tax_rate
+        reg_fee = coef.registration_fee
         initial_cost = base_price + tax + reg_fee - applied_voucher
         return BreakdownItem(
             value=initial_cost,
@@ -102,54 +214,54 @@ class TCOCalculator:
         )
 
     def _calc_energy_cost(self, vehicle: Vehicle, years: int):
+        coef = self._coef(years)
         annual_cost = (
-            self.annual_miles * vehicle.kwh_per_mile * self.config["electricity_price"]
+            self.annual_miles * vehicle.kwh_per_mile * coef.electricity_price
         )
         return BreakdownItem(
             value=annual_cost * years,
             explanation={
                 "annual_mileage": self.annual_miles,
                 "kwh_per_mile": vehicle.kwh_per_mile,
-                "electricity_price": self.config["electricity_price"],
+                "electricity_price": coef.electricity_price,
                 "years": years,
             },
         )
 
     def _calc_fuel_cost(self, vehicle: Vehicle, years: int):
-        annual_cost = (self.annual_miles / vehicle.mpg) * self.config["fuel_price"]
+        coef = self._coef(years)
+        annual_cost = (self.annual_miles / vehicle.mpg) * coef.fuel_price
         return BreakdownItem(
             value=annual_cost * years,
             explanation={
                 "annual_mileage": self.annual_miles,
                 "mpg": vehicle.mpg,
-                "fuel_price": self.config["fuel_price"],
+                "fuel_price": coef.fuel_price,
                 "years": years,
             },
         )
 
     def _calc_insurance(self, vehicle: Vehicle, years: int):
+        coef = self._coef(years)
         base_price = vehicle.base_price
-        insurance = base_price * self.config["insurance_base"] * years
+        insurance = base_price * coef.insurance_factor
         return BreakdownItem(
             value=insurance,
             explanation={
                 "price": base_price,
-                "insurance_rate": self.config["insurance_base"],
+                "insurance_rate": coef.insurance_rate,
                 "years": years,
             },
         )
 
     def _calc_maintenance(self, vehicle: Vehicle, years: int):
+        coef = self._coef(years)
         brand = vehicle.make
-        maint_conf = self.config.get("maintenance", {}).get(
-            brand, {"base_maint": 800, "escalation": 1.2}
-        )
+        maint_conf = coef.maintenance.get(brand, DEFAULT_MAINTENANCE)
         base_maint = maint_conf["base_maint"]
         escalation = maint_conf["escalation"]
 
-        maint_cost = 0
-        for y in range(1, years + 1):
-            maint_cost += base_maint * (escalation ** (y - 1))
+        maint_cost = coef.maintenance_totals.get(brand, coef.default_maintenance_total)
 
         return BreakdownItem(
             value=maint_cost,
@@ -157,31 +269,167 @@ class TCOCalculator:
         )
 
     def _calc_parking(self, years: int):
-        parking_base = self.config.get("parking_fee", 0)
-        parking_escalation = self.config.get("parking_escalation", 1.0)
-        parking_cost = 0
-        for y in range(1, years + 1):
-            parking_cost += parking_base * (parking_escalation ** (y - 1))
+        coef = self._coef(years)
         return BreakdownItem(
-            value=parking_cost,
+            value=coef.parking_total,
             explanation={
-                "base": parking_base,
-                "escalation": parking_escalation,
+                "base": coef.parking_base,
+                "escalation": coef.parking_escalation,
                 "years": years,
             },
         )
 
     def _calc_toll(self, years: int):
-        toll_base = self.config.get("toll_fee", 0)
-        toll_escalation = self.config.get("toll_escalation", 1.0)
-        toll_cost = 0
-        for y in range(1, years + 1):
-            toll_cost += toll_base * (toll_escalation ** (y - 1))
+        coef = self._coef(years)
         return BreakdownItem(
-            value=toll_cost,
+            value=coef.toll_total,
             explanation={
-                "base": toll_base,
-                "escalation": toll_escalation,
+                "base": coef.toll_base,
+                "escalation": coef.toll_escalation,
                 "years": years,
             },
         )
+
+    def calculate_tco_batch(self, vehicles: List[Vehicle], horizons: Sequence[int] = range(1, 11),
+                            voucher_discounts: Sequence[float] = None,
+                            annual_miles: Sequence[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Tính TCO cho N xe x H số năm trong một lần gọi.
+        Trả về dict các ma trận (N, H): initial_cost, fuel_cost, energy_cost, insurance,
+        maintenance, parking, toll, tco_total (fuel_cost = 0 với xe EV, energy_cost = 0 với xe xăng).
+        voucher_discounts: số tiền giảm đã áp dụng cho từng xe (mặc định 0).
+        annual_miles: số dặm/năm cho từng xe (mặc định self.annual_miles), để gộp xe của nhiều profile cùng state.
+        """
+        n = len(vehicles)
+        horizons = [int(h) for h in horizons]
+        coefs = [self._coef(h) for h in horizons]
+        first = coefs[0]
+        years = np.asarray(horizons, dtype=float)[None, :]
+        price = np.fromiter((v.base_price for v in vehicles), dtype=float, count=n)
+        is_ev = np.fromiter((v.fuel_type == "EV" for v in vehicles), dtype=bool, count=n)
+        mpg = np.fromiter((v.mpg or np.nan for v in vehicles), dtype=float, count=n)
+        kwh_per_mile = np.fromiter((v.kwh_per_mile or 0.0 for v in vehicles), dtype=float, count=n)
+        discounts = np.zeros(n) if voucher_discounts is None else np.asarray(voucher_discounts, dtype=float)
+        miles = np.full(n, float(self.annual_miles)) if annual_miles is None else np.asarray(annual_miles, dtype=float)
+
+        # Hàng hệ số theo số năm (1, H), lấy từ bảng đã compile
+        insurance_row = np.array([c.insurance_factor for c in coefs])[None, :]
+        parking_row = np.array([c.parking_total for c in coefs])[None, :]
+        toll_row = np.array([c.toll_total for c in coefs])[None, :]
+        maint_rows = {}
+        for v in vehicles:
+            if v.make not in maint_rows:
+                maint_rows[v.make] = [c.maintenance_totals.get(v.make, c.default_maintenance_total) for c in coefs]
+        maintenance = np.array([maint_rows[v.make] for v in vehicles], dtype=float).reshape(n, len(coefs))
+
+        initial = price * (1 + first.tax_rate) + first.registration_fee - discounts
+        annual_energy = np.where(is_ev, miles * kwh_per_mile * first.electricity_price, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            annual_fuel = np.where(is_ev, 0.0, miles / mpg * first.fuel_price)
+
+        shape = (n, len(coefs))
+        result = {
+            "horizons": np.asarray(horizons),
+            "initial_cost": np.broadcast_to(initial[:, None], shape).copy(),
+            "fuel_cost": annual_fuel[:, None] * years,
+            "energy_cost": annual_energy[:, None] * years,
+            "insurance": price[:, None] * insurance_row,
+            "maintenance": maintenance,
+            "parking": np.broadcast_to(parking_row, shape).copy(),
+            "toll": np.broadcast_to(toll_row, shape).copy(),
+        }
+        result["tco_total"] = sum(result[k] for k in (
+            "initial_cost", "fuel_cost", "energy_cost", "insurance", "maintenance", "parking", "toll"
+        ))
+        return result
+
+    def tco_from_batch(self, batch: Dict[str, np.ndarray], row: int, vehicle: Vehicle,
+                       voucher: Voucher = None, years: int = 5) -> Dict[str, Any]:
+        """
+        Kết quả của `vehicle` (dòng `row`, cột `years`) trong calculate_tco_batch -> dict cùng dạng
+        calculate_tco: giá trị lấy từ ma trận, explanation dựng từ bảng hệ số.
+        """
+        col = int(np.flatnonzero(batch["horizons"] == years)[0])
+        coef = self._coef(years)
+
+        def value(key):
+            return float(batch[key][row, col])
+
+        applied_voucher = self._apply_voucher(vehicle, voucher, vehicle.year)
+        breakdown = {
+            "initial_cost": BreakdownItem(
+                value=value("initial_cost"),
+                explanation={
+                    "base_price": vehicle.base_price,
+                    "tax": vehicle.base_price * coef.tax_rate,
+                    "registration_fee": coef.registration_fee,
+                    "applied_voucher": -applied_voucher,
+                },
+            )
+        }
+        if vehicle.fuel_type == "EV":
+            breakdown["energy_cost"] = BreakdownItem(
+                value=value("energy_cost"),
+                explanation={
+                    "annual_mileage": self.annual_miles,
+                    "kwh_per_mile": vehicle.kwh_per_mile,
+                    "electricity_price": coef.electricity_price,
+                    "years": years,
+                },
+            )
+        else:
+            breakdown["fuel_cost"] = BreakdownItem(
+                value=value("fuel_cost"),
+                explanation={
+                    "annual_mileage": self.annual_miles,
+                    "mpg": vehicle.mpg,
+                    "fuel_price": coef.fuel_price,
+                    "years": years,
+                },
+            )
+        maint_conf = coef.maintenance.get(vehicle.make, DEFAULT_MAINTENANCE)
+        breakdown["insurance"] = BreakdownItem(
+            value=value("insurance"),
+            explanation={"price": vehicle.base_price, "insurance_rate": coef.insurance_rate, "years": years},
+        )
+        breakdown["maintenance"] = BreakdownItem(
+            value=value("maintenance"),
+            explanation={"base": maint_conf["base_maint"], "escalation": maint_conf["escalation"], "years": years},
+        )
+        breakdown["parking"] = BreakdownItem(
+            value=value("parking"),
+            explanation={"base": coef.parking_base, "escalation": coef.parking_escalation, "years": years},
+        )
+        breakdown["toll"] = BreakdownItem(
+            value=value("toll"),
+            explanation={"base": coef.toll_base, "escalation": coef.toll_escalation, "years": years},
+        )
+        return {
+            "tco_total": value("tco_total"),
+            "breakdown": breakdown,
+            "available_vouchers": [],
+        }
+
+
+def calculate_tco_many(items: Sequence[Tuple[TCOCalculator, Vehicle, Optional[Voucher]]],
+                       years: int = 5) -> List[Dict[str, Any]]:
+    """
+    TCO cho nhiều (calculator, xe, voucher), có thể của nhiều profile: gom theo state (cùng bảng hệ số),
+    mỗi state một lần calculate_tco_batch với annual_miles của từng profile.
+    Kết quả cùng dạng calculate_tco, theo thứ tự của items.
+    """
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for i, (calc, _, _) in enumerate(items):
+        groups[calc.state].append(i)
+    results: List[Dict[str, Any]] = [None] * len(items)
+    for positions in groups.values():
+        group = [items[i] for i in positions]
+        batch = group[0][0].calculate_tco_batch(
+            [vehicle for _, vehicle, _ in group],
+            horizons=(years,),
+            voucher_discounts=[calc._apply_voucher(vehicle, voucher, vehicle.year) for calc, vehicle, voucher in group],
+            annual_miles=[calc.annual_miles for calc, _, _ in group],
+        )
+        for row, (i, (calc, vehicle, voucher)) in enumerate(zip(positions, group)):
+            results[i] = calc.tco_from_batch(batch, row, vehicle, voucher, years)
+    return results
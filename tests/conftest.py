@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Chạy được cả `pytest` lẫn `python -m pytest` từ thư mục gốc repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
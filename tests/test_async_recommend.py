@@ -0,0 +1,37 @@
+import asyncio
+
+from models.car_hit import CarHit
+from recommender import HybridCarRecommender
+from utils.embedding_cache import EmbeddingMemo
+
+
+class StubRecommender(HybridCarRecommender):
+    """Không dựng catalog/Qdrant: chỉ cần _personal_text và emb_personal_scores."""
+
+    def __init__(self):
+        self.sync_calls = []
+
+    def _get_embedding(self, text):
+        self.sync_calls.append(text)
+        return [1.0, 0.0]
+
+
+def test_missing_personal_vectors_are_embedded_async():
+    rec = StubRecommender()
+    embedded = []
+
+    async def aembed(text):
+        embedded.append(text)
+        return [0.0, 1.0]
+
+    memo = EmbeddingMemo(rec._get_embedding, aembed)
+    hits = [
+        CarHit(id="1", vec_score=1.0, payload={"Description": "Family SUV"}, personal_vec=[1.0, 0.0]),
+        CarHit(id="2", vec_score=1.0, payload={"Description": "City hatchback"}),
+        CarHit(id="3", vec_score=1.0, payload={"Description": "City hatchback"}),
+    ]
+    asyncio.run(rec._afill_personal_vecs(hits, memo))
+    assert [h.personal_vec for h in hits] == [[1.0, 0.0], [0.0, 1.0], [0.0, 1.0]]
+    assert embedded == [rec._personal_text(hits[1].payload)]  # text trùng chỉ embed một lần
+    assert rec.emb_personal_scores(hits, [0.0, 1.0]).tolist() == [0.0, 1.0, 1.0]
+    assert rec.sync_calls == []
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+import bulk_score
+from bulk_score import Checkpoint, JsonlWriter, iter_profiles
+from configs.recommender_config import RECOMMENDER_CONFIG
+from models.profile import Profile
+
+PROFILES_JSONL = "\n".join([
+    '{"state": "CA", "finance": {"payment_method": "cash", "cash_budget": 30000}, "brand_preference": ["Honda"]}',
+    '{"state": "NY", "finance": {"payment_method": "loan", "cash_budget": 25000, "monthly_capacity": 500}}',
+    '{"state": "TX", "finance": {"payment_method": "cash", "cash_budget": 40000',  # JSON hỏng
+    "",
+    '{"state": "CA", "annual_mileage": 9000, "finance": {"payment_method": "cash", "cash_budget": 22000}}',
+    '{"state": "TX", "finance": {"payment_method": "cash", "cash_budget": 35000}, "body_type": ["SUV"]}',
+]) + "\n"
+
+
+@pytest.fixture
+def profiles_path(tmp_path):
+    path = tmp_path / "profiles.jsonl"
+    path.write_text(PROFILES_JSONL, encoding="utf-8")
+    return str(path)
+
+
+def test_iter_profiles_isolates_malformed_lines(profiles_path):
+    items = list(iter_profiles(profiles_path))
+    # Dòng trống bị bỏ qua, không chiếm index
+    assert [i for i, _ in items] == [0, 1, 2, 3, 4]
+    assert isinstance(items[2][1], json.JSONDecodeError)
+    assert all(isinstance(p, Profile) for i, p in items if i != 2)
+    assert items[3][1].annual_mileage == 9000
+    assert [i for i, _ in iter_profiles(profiles_path, skip=3)] == [3, 4]
+
+
+def test_iter_profiles_reads_nested_and_list_columns_from_csv(tmp_path):
+    path = tmp_path / "profiles.csv"
+    path.write_text(
+        "state,finance.payment_method,finance.cash_budget,brand_preference,eco_friendly,age\n"
+        "CA,cash,30000,Honda|Toyota,yes,\n"
+        "NY,loan,not-a-number,,no,40\n",
+        encoding="utf-8",
+    )
+    (i0, p0), (i1, p1) = iter_profiles(str(path))
+    assert (i0, i1) == (0, 1)
+    assert p0.finance.cash_budget == 30000.0
+    assert p0.brand_preference == ["Honda", "Toyota"]
+    assert p0.eco_friendly is True and p0.age is None
+    assert isinstance(p1, Exception)
+
+
+def test_jsonl_writer_truncates_output_past_checkpoint(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    checkpoint = Checkpoint(output)
+    writer = JsonlWriter(output, checkpoint)
+    writer.write(['{"index": 0}'])
+    checkpoint.processed = 1
+    checkpoint.save()
+    writer.write(['{"index": 1}'])  # ghi xong nhưng chưa kịp lưu checkpoint
+    writer.close()
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"index": 2, "stat')  # dòng ghi dở khi process bị dừng
+
+    resumed = Checkpoint(output)
+    assert (resumed.processed, resumed.offset) == (1, len('{"index": 0}\n'))
+    writer = JsonlWriter(output, resumed)
+    writer.write(['{"index": 1}'])
+    writer.close()
+    with open(output, encoding="utf-8") as f:
+        assert f.read() == '{"index": 0}\n{"index": 1}\n'
+
+
+def test_run_resumes_after_truncated_output(tmp_path, profiles_path, monkeypatch):
+    monkeypatch.setitem(RECOMMENDER_CONFIG, "use_mock_semantic_search", True)
+    output = str(tmp_path / "out.jsonl")
+    assert bulk_score.run(profiles_path, output, chunk_size=2, workers=1) == 5
+    with open(output, encoding="utf-8") as f:
+        expected = f.read()
+    lines = [json.loads(line) for line in expected.splitlines()]
+    assert [r["index"] for r in lines] == [0, 1, 2, 3, 4]
+    assert [r["status"] for r in lines] == ["ok", "ok", "error", "ok", "ok"]
+
+    # Giả lập process chết sau chunk đầu: checkpoint ở 2 profile, output còn thêm phần ghi dở
+    first_chunk = "".join(expected.splitlines(keepends=True)[:2])
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(first_chunk + expected[len(first_chunk):len(first_chunk) + 40])
+    checkpoint = Checkpoint(output)
+    checkpoint.processed, checkpoint.offset = 2, len(first_chunk.encode("utf-8"))
+    checkpoint.save()
+
+    assert bulk_score.run(profiles_path, output, chunk_size=2, workers=1) == 5
+    with open(output, encoding="utf-8") as f:
+        assert f.read() == expected
@@ -0,0 +1,63 @@
+import types
+
+import pytest
+
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache
+
+MODEL = "test-model"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho time.time trong embedding_cache (last_access tăng dần, không trùng nhau)."""
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(embedding_cache, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def _vec(i):
+    return [float(i), 1.0, 0.5]
+
+
+def _disk_texts(cache):
+    return {text for text in (f"t{i}" for i in range(50)) if cache.get(MODEL, text) is not None}
+
+
+def test_evicts_least_recently_used_in_batches(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_memory_entries=1, max_disk_entries=10,
+                           evict_batch_size=4)
+    for i in range(10):
+        clock.now = i
+        cache.put(MODEL, f"t{i}", _vec(i))
+    clock.now = 20
+    assert cache.get(MODEL, "t0") == _vec(0)  # đọc từ đĩa -> t0 thành mới dùng gần nhất
+    clock.now = 21
+    cache.put(MODEL, "t10", _vec(10))
+    # Vượt max -> xoá xuống max - evict_batch_size = 6, bỏ các key có last_access cũ nhất
+    assert cache.stats()["disk_entries"] == 6
+    assert _disk_texts(cache) == {"t0", "t6", "t7", "t8", "t9", "t10"}
+
+    for i in range(11, 15):
+        clock.now = 30 + i
+        cache.put(MODEL, f"t{i}", _vec(i))
+    assert cache.stats()["disk_entries"] == 10  # còn trong lô, chưa evict lại
+    cache.put(MODEL, "t15", _vec(15))
+    assert cache.stats()["disk_entries"] == 6
+    cache.close()
+
+
+def test_get_many_reads_disk_once_and_counts_hits(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_memory_entries=2)
+    cache.put_many(MODEL, ["a", "b", "c"], [_vec(1), _vec(2), _vec(3)])
+    cache.close()
+
+    cache = EmbeddingCache(path, max_memory_entries=2)
+    assert cache.get_many(MODEL, ["a", "x", "a", "c"]) == [_vec(1), None, _vec(1), _vec(3)]
+    assert cache.get_many("other-model", ["a"]) == [None]
+    stats = cache.stats()
+    assert (stats["hits_disk"], stats["misses"], stats["disk_entries"]) == (3, 2, 3)
+    assert cache.get_memory(MODEL, "c") == _vec(3)
+    assert cache.get_memory(MODEL, "b") is None  # chỉ tra RAM
+    cache.close()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from configs.recommender_config import RECOMMENDER_CONFIG
+from models.car_hit import CarHit
+from recommender import HybridCarRecommender
+
+CARS = [
+    {"id": "1", "MakeKey": "honda", "BodyTypeKey": "sedan"},
+    {"id": "2", "MakeKey": "toyota", "BodyTypeKey": "sedan"},
+    {"id": "3", "MakeKey": "toyota", "BodyTypeKey": "suv"},
+    {"id": "4", "MakeKey": "ford", "BodyTypeKey": "truck"},
+    {"id": "5", "MakeKey": "honda", "BodyTypeKey": "suv"},
+]
+
+
+class FakeIndex(HybridCarRecommender):
+    """Chỉ thay phần search: lọc CARS theo filters keyword, thứ tự cố định theo id."""
+
+    def __init__(self):
+        self.calls = []
+
+    def search_by_vector(self, qvec, top_k=15, filters=None):
+        self.calls.append(dict(filters or {}))
+        matches = [c for c in CARS if all(c.get(k) in v for k, v in (filters or {}).items())]
+        return [CarHit(id=c["id"], vec_score=1.0, payload=c) for c in matches[:top_k]]
+
+    async def asearch_by_vector(self, qvec, top_k=15, filters=None):
+        return self.search_by_vector(qvec, top_k, filters)
+
+    def search_batch_by_vectors(self, qvecs, top_k=15, filters=None):
+        return [self.search_by_vector(q, top_k, f) for q, f in zip(qvecs, filters)]
+
+
+def _summary(hits):
+    return [(h.id, h.relaxed_filters) for h in hits]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setitem(RECOMMENDER_CONFIG, "relax_soft_filters", True)
+    return FakeIndex()
+
+
+def test_relaxes_brand_then_body_type_until_top_k(index):
+    filters = {"MakeKey": ["honda"], "BodyTypeKey": ["sedan"]}
+    hits = index.search_relaxed([0.0], top_k=4, filters=filters)
+    assert _summary(hits) == [
+        ("1", ()),
+        ("2", ("MakeKey",)),
+        ("3", ("MakeKey", "BodyTypeKey")),
+        ("4", ("MakeKey", "BodyTypeKey")),
+    ]
+    assert index.calls == [filters, {"BodyTypeKey": ["sedan"]}, {}]
+
+
+def test_stops_relaxing_once_top_k_is_reached(index):
+    hits = index.search_relaxed([0.0], top_k=2, filters={"MakeKey": ["honda"], "BodyTypeKey": ["sedan", "suv"]})
+    assert _summary(hits) == [("1", ()), ("5", ())]
+    assert len(index.calls) == 1
+
+
+def test_async_and_batch_paths_relax_the_same_way(index):
+    filters = [{"MakeKey": ["ford"], "BodyTypeKey": ["suv"]}, {"MakeKey": ["toyota"]}, None]
+    expected = [_summary(index.search_relaxed([0.0], top_k=3, filters=f)) for f in filters]
+    assert [_summary(asyncio.run(index.asearch_relaxed([0.0], top_k=3, filters=f))) for f in filters] == expected
+    assert [_summary(h) for h in index.search_batch_relaxed([[0.0]] * 3, top_k=3, filters=filters)] == expected
+
+
+def test_disabled_relaxation_keeps_hard_filters(index, monkeypatch):
+    monkeypatch.setitem(RECOMMENDER_CONFIG, "relax_soft_filters", False)
+    assert index.search_relaxed([0.0], top_k=3, filters={"MakeKey": ["bmw"]}) == []
+    assert index.search_batch_relaxed([[0.0]], top_k=3, filters=[{"MakeKey": ["bmw"]}]) == [[]]
+
+
+def test_suggested_cars_report_relaxed_profile_fields():
+    from main import suggested_cars_from_hits
+
+    hits = [
+        CarHit(id="1", vec_score=1.0, payload={"Make": "Honda"}, reasons=[]),
+        CarHit(id="2", vec_score=1.0, payload={"Make": "Toyota"}, reasons=[],
+               relaxed_filters=("MakeKey", "BodyTypeKey")),
+    ]
+    assert suggested_cars_from_hits(hits)["relaxed_filters"] == ["brand_preference", "body_type"]
+    assert "relaxed_filters" not in suggested_cars_from_hits(hits[:1])
+
+
+def test_price_filter_upper_bound_leaves_room_for_vouchers(monkeypatch):
+    import main
+    from models.finance import Finance
+    from models.profile import Profile
+    from models.voucher import Voucher
+
+    offers = [
+        Voucher(id=f"V{i}", title="", description="", conditions_apply_text="", valid_until="2099-12-31",
+                type=kind, value=value)
+        for i, (kind, value) in enumerate([("discount", 1500.0), ("discount", 3000.0), ("low_interest", 9000.0)])
+    ]
+    profile = Profile(state="CA", finance=Finance(payment_method="cash", cash_budget=30000))
+    monkeypatch.setattr(main, "get_finance_offers", lambda p: {"special_offers": offers})
+
+    def price_filter():
+        return main.profile_filters(profile, HybridCarRecommender, max_discount=main.max_voucher_discount(profile))["PriceUSD"]
+
+    # Xe giá 35000 với voucher 3000 -> 32000, vẫn trong ngân sách ±2300 -> phải còn sau retrieve
+    assert price_filter()["gte"] == 30000 - main.PRICE_WINDOW_USD
+    assert price_filter()["lte"] == 30000 + main.PRICE_WINDOW_USD + 3000.0
+    monkeypatch.setattr(main, "get_finance_offers", lambda p: {"payment_capacity": {}})
+    assert price_filter()["lte"] == 30000 + main.PRICE_WINDOW_USD
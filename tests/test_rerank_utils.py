@@ -0,0 +1,134 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from utils.rerank_utils import (
+    CatalogColumns, business_scores, feature_contributions, reasons_from_contributions, rule_scores,
+    static_business_score, top_k_indices,
+)
+from utils.vector_utils import safe_float
+
+
+# Bản scalar (duyệt từng xe) trước khi hybrid_rerank được vector hoá, giữ lại làm chuẩn so sánh
+def reference_rule_score(car: Dict[str, Any], pref: Dict[str, Any], reasons: List[str]) -> float:
+    score = 0.0
+    eng = pref.get("EngineType")
+    if eng and str(car.get("EngineType", "")).lower() == str(eng).lower():
+        score += 3.0
+        reasons.append(f"EngineType match: {eng}")
+    bt = pref.get("BodyType")
+    if bt and str(car.get("BodyType", "")).lower() == str(bt).lower():
+        score += 2.0
+        reasons.append(f"BodyType match: {bt}")
+    price_cap = safe_float(pref.get("PriceMax"), None)
+    price = safe_float(car.get("PriceUSD"), None)
+    if price_cap is not None and price is not None and price <= price_cap:
+        score += 2.0
+        reasons.append(f"Price ≤ {price_cap}")
+    pm = [x.lower() for x in pref.get("PreferredMakes", [])]
+    if pm and str(car.get("Make", "")).lower() in pm:
+        score += 1.5
+        reasons.append(f"Preferred make: {car.get('Make')}")
+    pmdl = [x.lower() for x in pref.get("PreferredModels", [])]
+    if pmdl and str(car.get("Model", "")).lower() in pmdl:
+        score += 1.0
+        reasons.append(f"Preferred model: {car.get('Model')}")
+    uc_kw = (pref.get("UseCaseKeyword") or "").lower()
+    if uc_kw and uc_kw in str(car.get("Description", "")).lower():
+        score += 1.5
+        reasons.append(f"UseCase contains '{uc_kw}'")
+    env = (pref.get("DrivingEnvironment") or "").lower()
+    if env and env in str(car.get("DrivingEnvironment", "")).lower():
+        score += 1.0
+        reasons.append(f"Driving environment: {env}")
+    return score
+
+
+def reference_business_score(car: Dict[str, Any], biz_cfg: Dict[str, Any], reasons: List[str]) -> float:
+    score = safe_float(car.get("biz_static"), None)
+    if score is None:
+        score = static_business_score(
+            safe_float(car.get("marginUSD"), 3000.0),
+            safe_float(car.get("inventory_days"), 20.0),
+            safe_float(car.get("brand_priority"), 0.4),
+        )
+    promoted_brands = [b.lower() for b in biz_cfg.get("promoted_brands", [])]
+    promoted_models = [m.lower() for m in biz_cfg.get("promoted_models", [])]
+    if str(car.get("Make", "")).lower() in promoted_brands:
+        score += 0.15
+        reasons.append(f"Promoted brand: {car.get('Make')}")
+    if str(car.get("Model", "")).lower() in promoted_models:
+        score += 0.2
+        reasons.append(f"Promoted model: {car.get('Model')}")
+    return float(score)
+
+
+CARS = [
+    {"Make": "Toyota", "Model": "RAV4", "BodyType": "SUV", "EngineType": "Hybrid", "PriceUSD": 31000,
+     "Description": "Family SUV, great for road trips", "DrivingEnvironment": "Urban and highway",
+     "marginUSD": 4200, "inventory_days": 35, "brand_priority": 0.8},
+    {"Make": "honda", "Model": "Civic", "BodyType": "sedan", "EngineType": "gasoline", "PriceUSD": "24500",
+     "Description": "Efficient commuter", "DrivingEnvironment": "urban", "biz_static": 0.61},
+    {"Make": "Tesla", "Model": "Model Y", "BodyType": "Suv", "EngineType": "EV", "PriceUSD": None,
+     "Description": "Electric crossover for family trips", "DrivingEnvironment": "Suburban"},
+    {"Make": "Ford", "Model": "F-150", "BodyType": "Truck", "EngineType": "Gasoline", "PriceUSD": float("nan"),
+     "marginUSD": 12000, "inventory_days": 2},
+    {"Make": "BMW", "Model": "X3", "BodyType": "SUV", "EngineType": "Gasoline", "PriceUSD": 47000,
+     "Description": "Luxury SUV", "DrivingEnvironment": "Highway", "brand_priority": "0.3"},
+]
+PREFS = [
+    {"EngineType": "hybrid", "BodyType": "suv", "PriceMax": 35000, "PreferredMakes": ["TOYOTA", "Tesla"],
+     "PreferredModels": ["civic"], "UseCaseKeyword": "Family", "DrivingEnvironment": "Urban"},
+    {"EngineType": "Gasoline", "BodyType": "Sedan", "PriceMax": "25000", "PreferredMakes": ["Honda"],
+     "PreferredModels": [], "UseCaseKeyword": None, "DrivingEnvironment": None},
+    # Giá trị không có trong catalog và pref trống
+    {"EngineType": "Diesel", "BodyType": "Wagon", "PriceMax": None, "PreferredMakes": ["Skoda"],
+     "PreferredModels": ["Octavia"], "UseCaseKeyword": "", "DrivingEnvironment": "offroad"},
+    {},
+]
+BIZ_CFGS = [
+    {"promoted_brands": ["toyota", "BMW"], "promoted_models": ["Model Y"]},
+    {"promoted_brands": [], "promoted_models": []},
+    {},
+]
+
+
+@pytest.fixture(scope="module")
+def cols():
+    return CatalogColumns.from_records(CARS, ids=[str(i) for i in range(len(CARS))])
+
+
+@pytest.mark.parametrize("pref", PREFS)
+def test_rule_scores_match_scalar_reference(cols, pref):
+    rule = rule_scores(cols, pref)
+    for i, car in enumerate(CARS):
+        reasons: List[str] = []
+        assert rule["score"][i] == pytest.approx(reference_rule_score(car, pref, reasons)), i
+        contributions = feature_contributions(rule, business_scores(cols, {}), i)
+        assert reasons_from_contributions(car, pref, contributions) == reasons
+
+
+@pytest.mark.parametrize("biz_cfg", BIZ_CFGS)
+def test_business_scores_match_scalar_reference(cols, biz_cfg):
+    biz = business_scores(cols, biz_cfg)
+    for i, car in enumerate(CARS):
+        reasons: List[str] = []
+        assert biz["score"][i] == pytest.approx(reference_business_score(car, biz_cfg, reasons)), i
+        contributions = feature_contributions(rule_scores(cols, {}), biz, i)
+        assert reasons_from_contributions(car, {}, contributions) == reasons
+
+
+def test_take_keeps_scores_of_selected_rows(cols):
+    rows = np.array([4, 0, 2])
+    pref, biz_cfg = PREFS[0], BIZ_CFGS[0]
+    sub = cols.take(rows)
+    assert rule_scores(sub, pref)["score"].tolist() == rule_scores(cols, pref)["score"][rows].tolist()
+    assert business_scores(sub, biz_cfg)["score"].tolist() == business_scores(cols, biz_cfg)["score"][rows].tolist()
+
+
+def test_top_k_indices_matches_full_sort():
+    scores = np.array([0.3, 0.9, 0.1, 0.8, 0.5, 0.7])
+    full = np.argsort(-scores, kind="stable")
+    assert top_k_indices(scores).tolist() == full.tolist()
+    assert top_k_indices(scores, 3).tolist() == full[:3].tolist()
@@ -0,0 +1,83 @@
+import types
+
+import pytest
+
+from models.finance import Finance
+from models.profile import Profile
+from utils import response_cache
+from utils.response_cache import ResponseCache, profile_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho time.monotonic trong response_cache: clock.now += giây để tua thời gian."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2}, ttl_seconds=5)
+    clock.now += 30
+    assert cache.get("a") == {"v": 1}
+    assert cache.get("b") is None
+    clock.now += 30
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (1, 2, 2, 0)
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" mới được dùng -> "b" bị đẩy ra trước
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    cache.put("a", 10)  # ghi đè không làm tăng số entry
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_everything_and_counts_reason():
+    cache = ResponseCache()
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.invalidate("reload") == 2
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == {"reload": 1}
+
+
+def test_validate_invalidates_only_when_a_version_changes():
+    cache = ResponseCache()
+    assert cache.validate({"catalog": 1, "vouchers": "x"}) is False  # lần đầu chỉ ghi nhận version
+    cache.put("a", 1)
+    assert cache.validate({"catalog": 1, "vouchers": "x"}) is False
+    assert cache.get("a") == 1
+    assert cache.validate({"catalog": 2, "vouchers": "y"}) is True
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == {"catalog+vouchers": 1}
+
+
+def _profile(**kwargs):
+    base = dict(state="CA", finance=Finance(payment_method="cash", cash_budget=30000),
+                brand_preference=["Toyota", "Honda"], body_type=["SUV", "Sedan"])
+    base.update(kwargs)
+    return Profile(**base)
+
+
+def test_profile_cache_key_is_canonical():
+    key = profile_cache_key(_profile())
+    # Thứ tự hãng, int/float và field không ảnh hưởng output -> cùng key
+    assert profile_cache_key(_profile(brand_preference=["Honda", "Toyota"])) == key
+    assert profile_cache_key(_profile(finance=Finance(payment_method="cash", cash_budget=30000.0))) == key
+    assert profile_cache_key(_profile(age=42, colors=["red"])) == key
+    # Pipeline thấy string gốc (pref_text, rerank, location) -> khác khoảng trắng là khác key
+    assert profile_cache_key(_profile(brand_preference=[" Honda", "Toyota"])) != key
+    assert profile_cache_key(_profile(habit="commute ")) != profile_cache_key(_profile(habit="commute"))
+    # body_type giữ thứ tự (phần tử đầu là BodyType ưu tiên)
+    assert profile_cache_key(_profile(body_type=["Sedan", "SUV"])) != key
+    assert profile_cache_key(_profile(state="NY")) != key
@@ -0,0 +1,88 @@
+import pytest
+
+from models.profile import Profile
+from models.vehicle import Vehicle
+from models.voucher import Voucher
+from tco_calculator import TCOCalculator, calculate_tco_many
+
+VEHICLES = [
+    Vehicle(make="Toyota", model="Camry", trim="LE", year=2024, base_price=28000, fuel_type="Gasoline", mpg=32),
+    Vehicle(make="Tesla", model="Model 3", trim="RWD", year=2023, base_price=39000, fuel_type="EV", kwh_per_mile=0.25),
+    Vehicle(make="BMW", model="X3", trim="xDrive30i", year=2022, base_price=47000, fuel_type="Gasoline", mpg=25),
+    # Hãng không có trong bảng maintenance -> DEFAULT_MAINTENANCE
+    Vehicle(make="Skoda", model="Octavia", trim="Style", year=2024, base_price=26000, fuel_type="Diesel", mpg=45),
+]
+COMPONENTS = ["initial_cost", "fuel_cost", "energy_cost", "insurance", "maintenance", "parking", "toll"]
+
+
+def _voucher(value=1500.0, **kwargs):
+    return Voucher(
+        id="V1", title="Spring deal", description="", conditions_apply_text="", valid_until="2099-12-31",
+        type="discount", value=value, **kwargs,
+    )
+
+
+@pytest.mark.parametrize("state", ["CA", "NY", "TX"])
+def test_batch_matches_scalar_for_every_vehicle_and_horizon(state):
+    calc = TCOCalculator(Profile(state=state, annual_mileage=15000))
+    horizons = range(1, 11)
+    batch = calc.calculate_tco_batch(VEHICLES, horizons=horizons)
+    for row, vehicle in enumerate(VEHICLES):
+        for col, years in enumerate(horizons):
+            scalar = calc.calculate_tco(vehicle, years=years)
+            assert batch["tco_total"][row, col] == pytest.approx(scalar["tco_total"])
+            for key in COMPONENTS:
+                expected = scalar["breakdown"][key].value if key in scalar["breakdown"] else 0.0
+                assert batch[key][row, col] == pytest.approx(expected), (vehicle.make, years, key)
+
+
+def test_tco_from_batch_matches_calculate_tco_with_voucher():
+    calc = TCOCalculator(Profile(state="CA"))
+    vouchers = [_voucher(), _voucher(applicable_makes=["Honda"]), None, _voucher(excluded_trims=["Style"])]
+    discounts = [calc._apply_voucher(v, voucher, v.year) for v, voucher in zip(VEHICLES, vouchers)]
+    assert discounts == [1500.0, 0.0, 0.0, 0.0]
+    batch = calc.calculate_tco_batch(VEHICLES, horizons=(3, 5), voucher_discounts=discounts)
+    for row, (vehicle, voucher) in enumerate(zip(VEHICLES, vouchers)):
+        expected = calc.calculate_tco(vehicle, voucher, years=5)
+        got = calc.tco_from_batch(batch, row, vehicle, voucher, years=5)
+        assert got["tco_total"] == pytest.approx(expected["tco_total"])
+        assert got["breakdown"].keys() == expected["breakdown"].keys()
+        for key, item in expected["breakdown"].items():
+            assert got["breakdown"][key].value == pytest.approx(item.value)
+            assert got["breakdown"][key].explanation == pytest.approx(item.explanation)
+        assert got["available_vouchers"] == expected["available_vouchers"]
+
+
+def test_calculate_tco_many_groups_profiles_across_states():
+    calcs = [
+        TCOCalculator(Profile(state="CA", annual_mileage=8000)),
+        TCOCalculator(Profile(state="NY")),
+        TCOCalculator(Profile(state="CA", annual_mileage=20000)),
+    ]
+    items = [
+        (calcs[i % len(calcs)], vehicle, _voucher() if i % 2 == 0 else None)
+        for i, vehicle in enumerate(VEHICLES * 2)
+    ]
+    results = calculate_tco_many(items, years=4)
+    assert len(results) == len(items)
+    for (calc, vehicle, voucher), got in zip(items, results):
+        expected = calc.calculate_tco(vehicle, voucher, years=4)
+        assert got["tco_total"] == pytest.approx(expected["tco_total"])
+        for key, item in expected["breakdown"].items():
+            assert got["breakdown"][key].value == pytest.approx(item.value)
+
+
+def test_region_config_change_is_picked_up_by_new_calculators(monkeypatch):
+    from configs.region_expense_config import REGION_CONFIG
+    from tco_calculator import region_config_version
+
+    vehicle = VEHICLES[0]
+    before = TCOCalculator(Profile(state="CA")).calculate_tco(vehicle, years=5)["breakdown"]["parking"].value
+    version = region_config_version()
+    assert region_config_version() == version  # config không đổi -> không compile lại
+
+    # Không qua /recommender/reload hay response cache: chỉ tạo TCOCalculator mới
+    monkeypatch.setitem(REGION_CONFIG, "CA", {**REGION_CONFIG["CA"], "parking_fee": 3600})
+    after = TCOCalculator(Profile(state="CA")).calculate_tco(vehicle, years=5)["breakdown"]["parking"].value
+    assert after == pytest.approx(2 * before)
+    assert region_config_version() == version + 1
@@ -0,0 +1,63 @@
+import json
+import os
+from datetime import date
+
+from models.vehicle import Vehicle
+from models.voucher import Voucher
+from utils.voucher_utils import VoucherIndex, compiled_voucher_index, get_discount_vouchers, get_voucher_index
+
+CAMRY = Vehicle(make="Toyota", model="Camry", trim="LE", year=2024, base_price=28000, fuel_type="Gasoline", mpg=32)
+CIVIC = Vehicle(make="Honda", model="Civic", trim="Sport", year=2023, base_price=24000, fuel_type="Gasoline", mpg=35)
+
+
+def _voucher(id, valid_until="2099-12-31", **kwargs):
+    return Voucher(id=id, title=id, description="", conditions_apply_text="", valid_until=valid_until,
+                   type=kwargs.pop("type", "discount"), value=kwargs.pop("value", 1000.0), **kwargs)
+
+
+VOUCHERS = [
+    _voucher("all"),
+    _voucher("toyota", applicable_makes=["Toyota"], valid_until="2030-06-30"),
+    _voucher("camry-2024-gold", applicable_makes=["Toyota"], applicable_models=["Camry"],
+             applicable_years=[2024], member_levels=["gold"]),
+    _voucher("wildcard-no-le", applicable_makes=["*"], excluded_trims=["LE"]),
+    _voucher("expensive", min_vehicle_price=26000),
+    _voucher("expired", valid_until="2020-01-01"),
+    _voucher("bad-date", valid_until="soon"),
+    _voucher("service", type="free_maintenance"),
+]
+
+
+def test_index_lookup_matches_linear_scan():
+    index = VoucherIndex(VOUCHERS)
+    for vehicle in (CAMRY, CIVIC):
+        for level in ("gold", "regular", None):
+            expected = [v.id for v in get_discount_vouchers(VOUCHERS, vehicle, vehicle.year, level)]
+            assert [v.id for v in get_discount_vouchers(index, vehicle, vehicle.year, level)] == expected
+
+
+def test_lookup_cache_expires_with_earliest_voucher():
+    index = VoucherIndex(VOUCHERS)
+    before = [v.id for v in index.lookup(CAMRY, 2024, "gold", today=date(2030, 6, 30))]
+    assert "toyota" in before
+    # Cùng key, hôm sau voucher "toyota" đã hết hạn -> cache không được trả kết quả cũ
+    after = [v.id for v in index.lookup(CAMRY, 2024, "gold", today=date(2030, 7, 1))]
+    assert after == [v for v in before if v != "toyota"]
+
+
+def test_compiled_voucher_index_is_shared_per_voucher_set():
+    first = compiled_voucher_index(VOUCHERS)
+    assert compiled_voucher_index(list(VOUCHERS)) is first
+    changed = VOUCHERS[:-1] + [_voucher("service", value=50.0)]
+    assert compiled_voucher_index(changed) is not first
+    assert compiled_voucher_index([]).size == 0
+
+
+def test_get_voucher_index_recompiles_when_file_changes(tmp_path):
+    path = tmp_path / "vouchers.json"
+    path.write_text(json.dumps([VOUCHERS[0].__dict__]), encoding="utf-8")
+    index = get_voucher_index(str(path))
+    assert get_voucher_index(str(path)) is index and index.size == 1
+    path.write_text(json.dumps([v.__dict__ for v in VOUCHERS[:2]]), encoding="utf-8")
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    assert get_voucher_index(str(path)).size == 2
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Số last_access gom lại trước khi ghi xuống SQLite (một executemany + một commit)
+ACCESS_FLUSH_SIZE = 256
+# Giới hạn số tham số của một câu "WHERE key IN (...)"
+SQL_IN_CHUNK = 500
+
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Khoá content-addressed: hash(model + text). Cùng text + cùng model -> cùng vector.
+    """
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    EmbeddingCache
+    Cache embedding 2 tầng: LRU trong bộ nhớ phía trước, SQLite trên đĩa phía sau.
+
+    Các field:
+      - max_memory_entries: số vector tối đa giữ trong LRU
+      - max_disk_entries: số vector tối đa trên đĩa; vượt quá thì xoá các vector lâu không dùng nhất
+        (xoá theo lô `evict_batch_size` để không phải đếm lại bảng sau mỗi lần ghi)
+      - hits_memory / hits_disk / misses: bộ đếm để theo dõi hiệu quả cache
+
+    last_access của các lần đọc từ đĩa được gom lại và ghi theo lô (ACCESS_FLUSH_SIZE, trước khi evict
+    và khi close), nên một lần đọc không kéo theo UPDATE + commit.
+    """
+
+    def __init__(self, path: str, max_memory_entries: int = 10000, max_disk_entries: int = 1000000,
+                 evict_batch_size: Optional[int] = None):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.evict_batch_size = evict_batch_size or max(1, max_disk_entries // 100)
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        # Cận trên của số dòng trên đĩa (INSERT OR REPLACE key đã có cũng được cộng); đếm lại khi evict
+        self._disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._pending_access: Dict[str, float] = {}
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_memory(self, model: str, text: str) -> Optional[List[float]]:
+        """Chỉ tra LRU trong RAM (không đụng SQLite) -> an toàn để gọi trên event loop."""
+        key = embedding_key(model, text)
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is None:
+                return None
+            self._memory.move_to_end(key)
+            self.hits_memory += 1
+            return vec.tolist()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = embedding_key(model, text)
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return vec.tolist()
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            vec = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vec)
+            self._touch([key])
+            self.hits_disk += 1
+            return vec.tolist()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Như get cho nhiều text: các key không có trong RAM được đọc bằng một SELECT ... IN theo lô."""
+        keys = [embedding_key(model, text) for text in texts]
+        result: List[Optional[List[float]]] = [None] * len(keys)
+        with self._lock:
+            missing: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    result[i] = vec.tolist()
+                else:
+                    missing.setdefault(key, []).append(i)
+            pending = list(missing)
+            found = []
+            for start in range(0, len(pending), SQL_IN_CHUNK):
+                chunk = pending[start:start + SQL_IN_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, vec)
+                    found.append(key)
+                    for i in missing[key]:
+                        result[i] = vec.tolist()
+            self.hits_disk += sum(len(missing[key]) for key in found)
+            self.misses += sum(1 for r in result if r is None)
+            self._touch(found)
+        return result
+
+    def _touch(self, keys: List[str]):
+        """Ghi nhận last_access cho các key vừa đọc từ đĩa; ghi xuống SQLite khi đủ lô."""
+        now = time.time()
+        for key in keys:
+            self._pending_access[key] = now
+        if len(self._pending_access) >= ACCESS_FLUSH_SIZE:
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self):
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(ts, key) for key, ts in self._pending_access.items()],
+        )
+        self._pending_access.clear()
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = embedding_key(model, text)
+                vec = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vec)
+                rows.append((key, model, int(vec.shape[0]), vec.tobytes(), now))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._disk_entries += len(rows)
+            if self._disk_entries > self.max_disk_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Đếm lại số dòng thật và xoá các vector lâu không dùng nhất xuống còn
+        max_disk_entries - evict_batch_size, để lần evict sau cách ít nhất evict_batch_size lần ghi.
+        """
+        self._flush_access()
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        target = max(self.max_disk_entries - self.evict_batch_size, 0)
+        overflow = count - target
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            count -= overflow
+        self._disk_entries = count
+
+    def get_or_compute(self, model: str, text: str, compute: Callable[[str], List[float]]) -> List[float]:
+        vec = self.get(model, text)
+        if vec is None:
+            vec = compute(text)
+            self.put(model, text, vec)
+        return vec
+
+    def warm(self, model: str, texts: Iterable[str],
+             compute_many: Callable[[List[str]], List[List[float]]], batch_size: int = 64) -> int:
+        """
+        Pre-populate cache offline (vd. trước khi deploy), embed các text còn thiếu theo batch.
+        Trả về số text phải embed mới.
+        """
+        computed = 0
+        pending = []
+
+        def flush():
+            self.put_many(model, pending, compute_many(pending))
+            return len(pending)
+
+        for text in dict.fromkeys(texts):
+            if self.get(model, text) is not None:
+                continue
+            pending.append(text)
+            if len(pending) >= batch_size:
+                computed += flush()
+                pending = []
+        if pending:
+            computed += flush()
+        return computed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self):
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            self._conn.close()
+
+
+class EmbeddingMemo:
+    """
+    EmbeddingMemo
+    Memo theo request: mỗi text chỉ được embed (hoặc đọc cache) một lần trong một request,
+    kể cả khi nhiều coroutine cùng xin một text (dùng chung một task đang chạy).
+    """
+
+    def __init__(self, embed: Callable[[str], List[float]], aembed: Callable = None):
+        self._embed = embed
+        self._aembed = aembed
+        self._vectors: Dict[str, List[float]] = {}
+        self._pending: Dict[str, "asyncio.Task"] = {}
+        self.requested = 0
+
+    def get(self, text: str) -> List[float]:
+        self.requested += 1
+        vec = self._vectors.get(text)
+        if vec is None:
+            vec = self._vectors[text] = self._embed(text)
+        return vec
+
+    async def aget(self, text: str) -> List[float]:
+        self.requested += 1
+        vec = self._vectors.get(text)
+        if vec is not None:
+            return vec
+        task = self._pending.get(text)
+        if task is None:
+            task = self._pending[text] = asyncio.ensure_future(self._aembed(text))
+        vec = await task
+        self._vectors[text] = vec
+        self._pending.pop(text, None)
+        return vec
+
+    @property
+    def embedded(self) -> int:
+        """Số text khác nhau đã embed trong request."""
+        return len(self._vectors)
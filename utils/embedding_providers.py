@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import re
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+
+from utils.metrics import EMBEDDING_CALLS, EMBEDDING_TEXTS, EMBEDDING_TOKENS
+
+# Số chiều gốc của các model OpenAI; model ngoài bảng coi như hỗ trợ `dimensions`
+OPENAI_NATIVE_DIMS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+# Model không nhận tham số `dimensions` (luôn trả về số chiều gốc)
+OPENAI_FIXED_DIM_MODELS = {"text-embedding-ada-002"}
+
+
+class EmbeddingProvider:
+    """
+    EmbeddingProvider
+    Interface chung cho các backend embedding.
+
+    Các field:
+      - model_name: tên model, dùng làm một phần khoá của embedding cache
+      - dim: số chiều vector trả về
+    """
+    model_name: str = ""
+    dim: int = 0
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def _record_usage(self, texts: List[str], tokens: int = None):
+        """Đếm request/text/token gửi tới provider; không có usage thật thì ước lượng token theo số từ."""
+        if tokens is None:
+            tokens = sum(len(re.findall(r"\w+", t)) for t in texts)
+        EMBEDDING_CALLS.inc(model=self.model_name)
+        EMBEDDING_TEXTS.inc(len(texts), model=self.model_name)
+        EMBEDDING_TOKENS.inc(tokens, model=self.model_name)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """Bản async; mặc định chạy embed() trong thread để không chặn event loop."""
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Gọi OpenAI embeddings API (mặc định text-embedding-ada-002, 1536 chiều).
+    `dim` khác số chiều gốc: model text-embedding-3-* nhận tham số dimensions (API trả vector đã rút gọn),
+    model cố định số chiều (ada-002) thì báo lỗi ngay thay vì tạo collection sai kích thước.
+    """
+
+    def __init__(self, model: str = "text-embedding-ada-002", dim: int = None, api_key: str = None):
+        import openai
+        native_dim = OPENAI_NATIVE_DIMS.get(model)
+        self.dim = dim or native_dim or 1536
+        if model in OPENAI_FIXED_DIM_MODELS and self.dim != native_dim:
+            raise ValueError(f"{model} only returns {native_dim}-dim embeddings, got embedding_dim={dim}")
+        if api_key:
+            openai.api_key = api_key
+        self._openai = openai
+        self._async_client = None
+        # Chỉ gửi dimensions khi khác số chiều gốc; tên model kèm số chiều để không lẫn embedding cache
+        self._dimensions = self.dim if model not in OPENAI_FIXED_DIM_MODELS and self.dim != native_dim else None
+        self._model = model
+        self.model_name = model if self._dimensions is None else f"{model}-{self.dim}"
+
+    def _create_kwargs(self, texts: List[str]) -> Dict[str, Any]:
+        kwargs = {"model": self._model, "input": texts}
+        if self._dimensions is not None:
+            kwargs["dimensions"] = self._dimensions
+        return kwargs
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self._openai.embeddings.create(**self._create_kwargs(texts))
+        self._record_usage(texts, _usage_tokens(response))
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        if self._async_client is None:
+            self._async_client = self._openai.AsyncOpenAI(api_key=self._openai.api_key)
+        response = await self._async_client.embeddings.create(**self._create_kwargs(texts))
+        self._record_usage(texts, _usage_tokens(response))
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """
+    Chạy model sentence-transformers ngay trong process (CPU, encode theo batch), không cần network.
+    Nếu `dim` nhỏ hơn số chiều của model thì cắt bớt và chuẩn hoá lại.
+    """
+
+    def __init__(self, model: str = "all-MiniLM-L6-v2", dim: int = None, device: str = "cpu", batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model, device=device)
+        native_dim = self._model.get_sentence_embedding_dimension()
+        self.dim = min(dim or native_dim, native_dim)
+        self.model_name = model if self.dim == native_dim else f"{model}-{self.dim}"
+        self.batch_size = batch_size
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self._record_usage(texts)
+        vecs = self._model.encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+        )
+        vecs = vecs[:, :self.dim]
+        vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs.astype(np.float32).tolist()
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Embedding giả lập, tất định (feature hashing trên token), dùng cho test/benchmark offline.
+    Text giống nhau -> vector giống nhau; text chung nhiều từ -> cosine cao hơn.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model_name = f"hashing-{dim}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vec[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self._record_usage(texts)
+        return [self._embed_one(t).tolist() for t in texts]
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Lỗi đáng retry: mất kết nối / timeout, HTTP 429 (rate limit) và 5xx.
+    Lỗi còn lại (400, 401, sai model, bug...) retry cũng không khỏi -> trả lỗi ngay.
+    Lớp lỗi của openai/httpx chỉ được kiểm tra nếu module đã được nạp (không import thêm).
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(exc, httpx.TransportError):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def _usage_tokens(response):
+    """Số token OpenAI tính phí cho request (None nếu response không có usage)."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def build_embedding_provider(config: Dict[str, Any]) -> EmbeddingProvider:
+    """
+    Tạo provider theo config["embedding_provider"]: "openai" | "sentence-transformers" | "hashing".
+    """
+    name = config.get("embedding_provider", "openai")
+    model = config.get("embedding_model")
+    dim = config.get("embedding_dim")
+    if name == "openai":
+        return OpenAIEmbeddingProvider(model or "text-embedding-ada-002", dim, config.get("openai_api_key"))
+    if name == "sentence-transformers":
+        return SentenceTransformerEmbeddingProvider(
+            model or "all-MiniLM-L6-v2", dim,
+            device=config.get("embedding_device", "cpu"),
+            batch_size=config.get("embedding_batch_size", 64),
+        )
+    if name == "hashing":
+        return HashingEmbeddingProvider(dim or 256)
+    raise ValueError(f"Unknown embedding provider {name}")
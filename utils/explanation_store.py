@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Field của payload giữ lại trong store (đủ cho explain_hit + reasons), không lưu cả payload
+EXPLAIN_PAYLOAD_FIELDS = ("Year", "Make", "Model", "Trim")
+
+
+def compact_hit(h) -> Dict[str, Any]:
+    """CarHit -> bản ghi gọn: id, identity của xe, các score và contributions."""
+    return {
+        "id": h.id,
+        "car": {k: h.payload.get(k) for k in EXPLAIN_PAYLOAD_FIELDS},
+        "vec_score": h.vec_score,
+        "rule_score": h.rule_score,
+        "emb_score": h.emb_score,
+        "biz_score": h.biz_score,
+        "final_score": h.final_score,
+        "contributions": dict(h.contributions or {}),
+    }
+
+
+class ExplanationStore:
+    """
+    ExplanationStore
+    Lưu ngắn hạn (LRU + TTL trong RAM) dữ liệu số của một lần gợi ý để /recommend/{id}/explain
+    render reasons + breakdown khi được hỏi, thay vì dựng sẵn cho mọi request.
+
+    Mỗi record gồm:
+      - strategy / pref_text / user_pref: input của rerank
+      - hits: danh sách compact_hit theo thứ tự xếp hạng
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, hits: List[Any], user_pref: Dict[str, Any], pref_text: str, strategy: str) -> str:
+        """Lưu kết quả rerank, trả về recommendation id."""
+        recommendation_id = uuid.uuid4().hex
+        record = {
+            "strategy": strategy,
+            "pref_text": pref_text,
+            "user_pref": dict(user_pref or {}),
+            "hits": [compact_hit(h) for h in hits],
+        }
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[recommendation_id] = (expires_at, record)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return recommendation_id
+
+    def get(self, recommendation_id: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(recommendation_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[recommendation_id]
+                return None
+            return {**entry[1], "expires_in_seconds": round(entry[0] - now, 1)}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_explanation_store: Optional[ExplanationStore] = None
+_explanation_store_lock = threading.Lock()
+
+
+def get_explanation_store() -> ExplanationStore:
+    """Store dùng chung cho cả process (cấu hình trong RECOMMENDER_CONFIG)."""
+    global _explanation_store
+    from configs.recommender_config import RECOMMENDER_CONFIG
+    with _explanation_store_lock:
+        if _explanation_store is None:
+            _explanation_store = ExplanationStore(
+                max_entries=RECOMMENDER_CONFIG["explain_store_entries"],
+                ttl_seconds=RECOMMENDER_CONFIG["explain_ttl_seconds"],
+            )
+        return _explanation_store
@@ -0,0 +1,178 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 15, 25, 50, 100, 250)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Counter đơn điệu tăng, có label (Prometheus: <name>_total)."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram với bucket cố định (cumulative khi render), có label."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    le = f'le="{_fmt(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Registry
+    Tập metric của process + các collector (hàm đọc số liệu tại thời điểm scrape, vd. bộ đếm của cache).
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]], str]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]],
+                           metric_type: str = "gauge"):
+        """collector() -> [(name, help, labels, value)]; metric_type: "gauge" | "counter"."""
+        self._collectors.append((collector, metric_type))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        collected: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector, metric_type in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                # Một collector lỗi không làm hỏng cả trang /metrics
+                continue
+            for name, help_text, labels, value in samples:
+                entry = collected.setdefault(name, (help_text, metric_type, []))
+                entry[2].append(f"{name}{_labels(list(labels), list(labels.values()))} {_fmt(value)}")
+        for name, (help_text, metric_type, samples) in collected.items():
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", *samples])
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "car_recommender_stage_seconds", "Thời gian từng stage của pipeline gợi ý", ["stage"]))
+EMBEDDING_CALLS = REGISTRY.register(Counter(
+    "car_recommender_embedding_calls_total", "Số request gửi tới embedding provider", ["model"]))
+EMBEDDING_TEXTS = REGISTRY.register(Counter(
+    "car_recommender_embedding_texts_total", "Số text đã embed qua provider (cache miss)", ["model"]))
+EMBEDDING_TOKENS = REGISTRY.register(Counter(
+    "car_recommender_embedding_tokens_total",
+    "Số token embedding (usage của OpenAI; provider local thì ước lượng theo số từ)", ["model"]))
+CANDIDATES = REGISTRY.register(Histogram(
+    "car_recommender_candidates", "Số xe ứng viên mỗi request theo phase", ["phase"], buckets=COUNT_BUCKETS))
+STRATEGY_PICKS = REGISTRY.register(Counter(
+    "car_recommender_strategy_total", "Strategy được auto_pick_strategy chọn", ["strategy"]))
+
+# Thời gian các stage của request hiện tại (cho header Server-Timing); None = không ghi
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Đo một stage: ghi vào histogram và (nếu có) vào timing của request hiện tại."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Bắt đầu thu thập timing cho request hiện tại (dict dùng chung qua threadpool/to_thread)."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Dạng header Server-Timing: "retrieve;dur=12.3, rerank;dur=0.8" (ms)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
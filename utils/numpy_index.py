@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.car_hit import CarHit
+from utils.rerank_utils import top_k_indices
+
+
+def _normalize(vecs) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32)
+    return vecs / np.maximum(np.linalg.norm(vecs, axis=-1, keepdims=True), 1e-12)
+
+
+class _IndexSnapshot:
+    """
+    Snapshot bất biến của index (ma trận vector + payload), thay nguyên khối khi commit
+    nên search không cần khoá.
+    """
+
+    def __init__(self, ids: List[str], hashes: List[str], payloads: List[Dict[str, Any]],
+                 retrieval: np.ndarray, personal: np.ndarray):
+        self.ids = ids
+        self.hashes = hashes
+        self.payloads = payloads
+        self.retrieval = retrieval
+        self.personal = personal
+        self.row_of_id = {pid: i for i, pid in enumerate(ids)}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._columns_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, key: str, numeric: bool) -> np.ndarray:
+        """Cột payload dạng mảng (float64 với NaN = thiếu, hoặc object), tạo lần đầu khi cần filter."""
+        cache_key = f"{key}:{'num' if numeric else 'obj'}"
+        column = self._columns.get(cache_key)
+        if column is None:
+            with self._columns_lock:
+                values = [p.get(key) for p in self.payloads]
+                if numeric:
+                    column = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+                else:
+                    column = np.array(values, dtype=object)
+                self._columns[cache_key] = column
+        return column
+
+    def mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Boolean mask theo cùng quy ước filters với HybridCarRecommender._build_filter:
+        giá trị đơn = bằng, list = thuộc tập, dict = range (allow_missing giữ dòng thiếu field).
+        None = không lọc.
+        """
+        if not filters:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in filters.items():
+            if isinstance(value, dict):
+                column = self.column(key, numeric=True)
+                cond = ~np.isnan(column)
+                with np.errstate(invalid="ignore"):
+                    if value.get("gte") is not None:
+                        cond &= column >= value["gte"]
+                    if value.get("lte") is not None:
+                        cond &= column <= value["lte"]
+                    if value.get("gt") is not None:
+                        cond &= column > value["gt"]
+                    if value.get("lt") is not None:
+                        cond &= column < value["lt"]
+                if value.get("allow_missing"):
+                    cond |= np.isnan(column)
+            elif isinstance(value, (list, tuple, set)):
+                cond = np.isin(self.column(key, numeric=False), list(value))
+            else:
+                cond = self.column(key, numeric=False) == value
+            mask &= cond
+        return mask
+
+
+class NumpyVectorIndex:
+    """
+    NumpyVectorIndex
+    Index vector trong process cho catalog nhỏ (vài nghìn xe): exact cosine bằng một phép nhân ma trận,
+    top-k bằng argpartition, filter bằng boolean mask trên các cột payload.
+
+    Lưu trên đĩa tại `path`:
+      - retrieval.npy / personal.npy: ma trận vector đã chuẩn hoá L2 (float32 hoặc float16), mở bằng mmap
+      - meta.json: ids, _content_hash và payload theo thứ tự dòng
+    upsert/delete/set_payload được gom lại và chỉ áp dụng khi commit() (ghi file mới rồi os.replace).
+    """
+
+    def __init__(self, path: str, dim: int, dtype: str = "float32"):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._pending_upserts: Dict[str, Tuple[str, Dict[str, Any], Sequence[float], Sequence[float]]] = {}
+        self._pending_deletes = set()
+        self._pending_payloads: Dict[str, Dict[str, Any]] = {}
+        self._snapshot = self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _empty(self) -> _IndexSnapshot:
+        empty = np.zeros((0, self.dim), dtype=self.dtype)
+        return _IndexSnapshot([], [], [], empty, empty)
+
+    def _load(self) -> _IndexSnapshot:
+        if not os.path.exists(self._file("meta.json")):
+            return self._empty()
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("dtype") != self.dtype.name:
+            return self._empty()
+        retrieval = np.load(self._file("retrieval.npy"), mmap_mode="r")
+        personal = np.load(self._file("personal.npy"), mmap_mode="r")
+        if not (len(meta["ids"]) == len(retrieval) == len(personal)):
+            # File ghi dở -> coi như index rỗng, sync sẽ ingest lại (embedding lấy từ cache)
+            return self._empty()
+        return _IndexSnapshot(meta["ids"], meta["hashes"], meta["payloads"], retrieval, personal)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def stored_hashes(self) -> Dict[str, str]:
+        snapshot = self._snapshot
+        return dict(zip(snapshot.ids, snapshot.hashes))
+
+    def upsert(self, points: List[Tuple[str, Dict[str, Any], Sequence[float], Sequence[float]]]):
+        """points: (id, payload, retrieval_vec, personal_vec); payload chứa _content_hash."""
+        with self._lock:
+            for point in points:
+                self._pending_upserts[point[0]] = point
+                self._pending_deletes.discard(point[0])
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for pid in ids:
+                self._pending_upserts.pop(pid, None)
+                self._pending_deletes.add(pid)
+
+    def set_payload(self, pid: str, payload: Dict[str, Any]):
+        with self._lock:
+            self._pending_payloads.setdefault(pid, {}).update(payload)
+
+    def commit(self):
+        """Áp dụng các thay đổi đang chờ: ghi ma trận + meta mới xuống đĩa rồi đổi snapshot."""
+        with self._lock:
+            upserts, deletes, payload_updates = self._pending_upserts, self._pending_deletes, self._pending_payloads
+            self._pending_upserts, self._pending_deletes, self._pending_payloads = {}, set(), {}
+        if not (upserts or deletes or payload_updates):
+            return
+        old = self._snapshot
+        keep = [i for i, pid in enumerate(old.ids) if pid not in deletes and pid not in upserts]
+        new_points = list(upserts.values())
+        ids = [old.ids[i] for i in keep] + [p[0] for p in new_points]
+        payloads = [dict(old.payloads[i]) for i in keep] + [dict(p[1]) for p in new_points]
+        for payload, pid in zip(payloads, ids):
+            if pid in payload_updates:
+                payload.update(payload_updates[pid])
+        hashes = [p.get("_content_hash") for p in payloads]
+
+        def matrix(old_matrix, column):
+            new_rows = _normalize([p[column] for p in new_points]) if new_points else np.zeros((0, self.dim), np.float32)
+            return np.concatenate([np.asarray(old_matrix[keep], dtype=self.dtype), new_rows.astype(self.dtype)])
+
+        retrieval, personal = matrix(old.retrieval, 2), matrix(old.personal, 3)
+        os.makedirs(self.path, exist_ok=True)
+        for name, data in (("retrieval.npy", retrieval), ("personal.npy", personal)):
+            np.save(self._file(name + ".tmp.npy"), data)
+            os.replace(self._file(name + ".tmp.npy"), self._file(name))
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "ids": ids, "hashes": hashes,
+                       "payloads": payloads}, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self._file("meta.json"))
+        self._snapshot = self._load()
+
+    def _hits(self, snapshot: _IndexSnapshot, rows: np.ndarray, scores: np.ndarray) -> List[CarHit]:
+        return [
+            CarHit(
+                id=snapshot.ids[r], vec_score=float(s), payload=snapshot.payloads[r],
+                personal_vec=np.asarray(snapshot.personal[r], dtype=np.float32).tolist()
+            )
+            for r, s in zip(rows, scores)
+        ]
+
+    def search(self, qvec: Sequence[float], top_k: int = 15,
+               filters: Optional[Dict[str, Any]] = None) -> List[CarHit]:
+        return self.search_batch([qvec], top_k=top_k, filters=[filters])[0]
+
+    def search_batch(self, qvecs: List[Sequence[float]], top_k: int = 15,
+                     filters: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[CarHit]]:
+        """Exact top-k cho nhiều query: một phép nhân (N, dim) x (dim, B), rồi mask + argpartition từng cột."""
+        snapshot = self._snapshot
+        filters = filters or [None] * len(qvecs)
+        if not len(snapshot):
+            return [[] for _ in qvecs]
+        queries = _normalize(qvecs)
+        # float16 chỉ để tiết kiệm RAM/đĩa; nhân ma trận luôn ở float32 (BLAS)
+        scores = np.asarray(snapshot.retrieval, dtype=np.float32) @ queries.T
+        results = []
+        for j, f in enumerate(filters):
+            column = scores[:, j]
+            mask = snapshot.mask(f)
+            rows = np.flatnonzero(mask) if mask is not None else np.arange(len(snapshot))
+            best = top_k_indices(column[rows], top_k)
+            results.append(self._hits(snapshot, rows[best], column[rows[best]]))
+        return results
@@ -0,0 +1,71 @@
+from typing import Any, Dict, Optional
+
+from qdrant_client.models import (
+    CompressionRatio, Distance, HnswConfigDiff, ProductQuantization, ProductQuantizationConfig,
+    QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams,
+    VectorParams, VectorParamsDiff
+)
+
+
+def hnsw_config(config: Dict[str, Any]) -> HnswConfigDiff:
+    """HNSW của collection: m (số cạnh mỗi node), ef_construct (độ rộng tìm kiếm khi build)."""
+    return HnswConfigDiff(m=config.get("hnsw_m", 16), ef_construct=config.get("hnsw_ef_construct", 100))
+
+
+def quantization_config(config: Dict[str, Any]):
+    """
+    config["quantization"]:
+      - None: giữ vector float32 gốc
+      - "scalar": int8 (bộ nhớ ~1/4, recall gần như không đổi khi có rescore)
+      - "product": PQ nén x16 (bộ nhớ rất nhỏ, cần rescore + oversampling để giữ recall)
+    """
+    kind = config.get("quantization")
+    always_ram = config.get("quantization_always_ram", True)
+    if not kind:
+        return None
+    if kind == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=always_ram))
+    if kind == "product":
+        return ProductQuantization(product=ProductQuantizationConfig(compression=CompressionRatio.X16, always_ram=always_ram))
+    raise ValueError(f"Unknown quantization {kind}")
+
+
+def vector_params(dim: int, config: Dict[str, Any]) -> VectorParams:
+    """VectorParams (cosine) cho một named vector; on_disk=True thì vector gốc nằm trên đĩa (mmap)."""
+    return VectorParams(size=dim, distance=Distance.COSINE, on_disk=config.get("vectors_on_disk", False))
+
+
+def vector_params_diff(config: Dict[str, Any]) -> VectorParamsDiff:
+    """Phần có thể đổi tại chỗ của VectorParams (dùng với update_collection)."""
+    return VectorParamsDiff(on_disk=config.get("vectors_on_disk", False))
+
+
+def search_params(config: Dict[str, Any]) -> Optional[SearchParams]:
+    """
+    Tham số lúc search: hnsw_ef (None = mặc định của Qdrant) và rescore/oversampling
+    khi collection có quantization.
+    """
+    ef = config.get("hnsw_ef_search")
+    quantization = None
+    if config.get("quantization"):
+        quantization = QuantizationSearchParams(
+            rescore=config.get("quantization_rescore", True),
+            oversampling=config.get("quantization_oversampling", 2.0),
+        )
+    if ef is None and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=ef, quantization=quantization)
+
+
+def index_settings_match(info, config: Dict[str, Any]) -> bool:
+    """So HNSW, loại quantization và on_disk của collection hiện có với config."""
+    on_disk = config.get("vectors_on_disk", False)
+    if any(bool(v.on_disk) != on_disk for v in info.config.params.vectors.values()):
+        return False
+    hnsw = info.config.hnsw_config
+    wanted = hnsw_config(config)
+    if hnsw.m != wanted.m or hnsw.ef_construct != wanted.ef_construct:
+        return False
+    current = info.config.quantization_config
+    wanted_q = quantization_config(config)
+    return type(current) is type(wanted_q)
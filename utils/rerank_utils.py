@@ -0,0 +1,221 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.vector_utils import safe_float
+
+# Trọng số của các rule trong rule score (điểm cá nhân hoá theo user_pref)
+RULE_WEIGHTS = {
+    "engine": 3.0,
+    "body": 2.0,
+    "price": 2.0,
+    "make": 1.5,
+    "model": 1.0,
+    "use_case": 1.5,
+    "environment": 1.0,
+}
+PROMOTED_BRAND_BOOST = 0.15
+PROMOTED_MODEL_BOOST = 0.2
+MARGIN_CLIP = (1500, 9000)
+INVENTORY_CLIP = (5, 90)
+
+CATEGORICAL_COLUMNS = ["EngineType", "BodyType", "Make", "Model"]
+
+
+def _norm(value) -> str:
+    return str(value if value is not None else "").lower()
+
+
+class CatalogColumns:
+    """
+    CatalogColumns
+    Catalog dạng cột (NumPy) để rerank vector hoá thay vì duyệt từng payload.
+
+    Các field:
+      - vocab: {cột: {giá trị lowercase: code}} cho EngineType/BodyType/Make/Model
+      - codes: {cột: mảng int32}; giá trị pref không có trong vocab -> code -2 (không khớp dòng nào)
+      - price / margin / inventory_days / brand_priority: mảng float64 (NaN = thiếu)
+      - biz_static: business score cố định theo xe (tính sẵn từ margin/tồn kho/brand priority)
+      - description / environment: mảng str lowercase cho các rule dạng "contains"
+      - row_of_id: point id -> vị trí dòng
+    """
+
+    def __init__(self, vocab, codes, price, margin, inventory_days, brand_priority, biz_static,
+                 description, environment, ids: Sequence[str] = ()):
+        self.vocab = vocab
+        self.codes = codes
+        self.price = price
+        self.margin = margin
+        self.inventory_days = inventory_days
+        self.brand_priority = brand_priority
+        self.biz_static = biz_static
+        self.description = description
+        self.environment = environment
+        self.ids = list(ids)
+        self.row_of_id = {pid: i for i, pid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.price)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], ids: Sequence[str] = (),
+                     vocab: Optional[Dict[str, Dict[str, int]]] = None) -> "CatalogColumns":
+        vocab = {c: dict(v) for c, v in vocab.items()} if vocab else {c: {} for c in CATEGORICAL_COLUMNS}
+        codes = {}
+        for col in CATEGORICAL_COLUMNS:
+            mapping = vocab.setdefault(col, {})
+            codes[col] = np.fromiter(
+                (mapping.setdefault(_norm(r.get(col, "")), len(mapping)) for r in records),
+                dtype=np.int32, count=len(records),
+            )
+
+        def floats(key, default):
+            return np.array([safe_float(r.get(key), default) for r in records], dtype=np.float64)
+
+        margin = floats("marginUSD", 3000.0)
+        inventory_days = floats("inventory_days", 20.0)
+        brand_priority = floats("brand_priority", 0.4)
+        biz_static = floats("biz_static", np.nan)
+        missing = np.isnan(biz_static)
+        if missing.any():
+            biz_static[missing] = static_business_score(margin, inventory_days, brand_priority)[missing]
+        return cls(
+            vocab=vocab,
+            codes=codes,
+            price=floats("PriceUSD", np.nan),
+            margin=margin,
+            inventory_days=inventory_days,
+            brand_priority=brand_priority,
+            biz_static=biz_static,
+            description=np.array([_norm(r.get("Description", "") or "") for r in records], dtype=str),
+            environment=np.array([_norm(r.get("DrivingEnvironment", "")) for r in records], dtype=str),
+            ids=ids,
+        )
+
+    def take(self, rows: np.ndarray) -> "CatalogColumns":
+        """Cắt ra các dòng ứng với candidates (giữ nguyên vocab)."""
+        return CatalogColumns(
+            vocab=self.vocab,
+            codes={c: v[rows] for c, v in self.codes.items()},
+            price=self.price[rows],
+            margin=self.margin[rows],
+            inventory_days=self.inventory_days[rows],
+            brand_priority=self.brand_priority[rows],
+            biz_static=self.biz_static[rows],
+            description=self.description[rows],
+            environment=self.environment[rows],
+        )
+
+    def code_of(self, col: str, value) -> int:
+        return self.vocab.get(col, {}).get(_norm(value), -2)
+
+    def codes_of(self, col: str, values) -> List[int]:
+        return [self.code_of(col, v) for v in (values or [])]
+
+
+def rule_scores(cols: CatalogColumns, pref: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Rule score cho mọi dòng của cols: trả về mask từng rule và "score" tổng.
+    """
+    n = len(cols)
+    masks = {}
+    eng = pref.get("EngineType")
+    masks["engine"] = cols.codes["EngineType"] == cols.code_of("EngineType", eng) if eng else np.zeros(n, bool)
+    bt = pref.get("BodyType")
+    masks["body"] = cols.codes["BodyType"] == cols.code_of("BodyType", bt) if bt else np.zeros(n, bool)
+    price_cap = safe_float(pref.get("PriceMax"), None)
+    masks["price"] = cols.price <= price_cap if price_cap is not None else np.zeros(n, bool)
+    masks["make"] = np.isin(cols.codes["Make"], cols.codes_of("Make", pref.get("PreferredMakes")))
+    masks["model"] = np.isin(cols.codes["Model"], cols.codes_of("Model", pref.get("PreferredModels")))
+    uc_kw = _norm(pref.get("UseCaseKeyword") or "")
+    masks["use_case"] = np.char.find(cols.description, uc_kw) >= 0 if uc_kw else np.zeros(n, bool)
+    env = _norm(pref.get("DrivingEnvironment") or "")
+    masks["environment"] = np.char.find(cols.environment, env) >= 0 if env else np.zeros(n, bool)
+    score = np.zeros(n, dtype=np.float64)
+    for key, weight in RULE_WEIGHTS.items():
+        score += weight * masks[key]
+    masks["score"] = score
+    return masks
+
+
+def static_business_score(margin, inventory_days, brand_priority):
+    """Phần business score chỉ phụ thuộc vào xe (brand priority, margin, tồn kho); nhận scalar hoặc mảng."""
+    m_scaled = (np.clip(margin, *MARGIN_CLIP) - MARGIN_CLIP[0]) / (MARGIN_CLIP[1] - MARGIN_CLIP[0] + 1e-9)
+    i_scaled = (np.clip(inventory_days, *INVENTORY_CLIP) - INVENTORY_CLIP[0]) / (INVENTORY_CLIP[1] - INVENTORY_CLIP[0] + 1e-9)
+    return 0.4 * brand_priority + 0.3 * m_scaled + 0.3 * i_scaled
+
+
+def business_scores(cols: CatalogColumns, biz_cfg: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Business score cho mọi dòng của cols: static score + boost cho brand/model đang promote."""
+    masks = {
+        "promoted_brand": np.isin(cols.codes["Make"], cols.codes_of("Make", biz_cfg.get("promoted_brands"))),
+        "promoted_model": np.isin(cols.codes["Model"], cols.codes_of("Model", biz_cfg.get("promoted_models"))),
+    }
+    masks["score"] = (
+        cols.biz_static
+        + PROMOTED_BRAND_BOOST * masks["promoted_brand"]
+        + PROMOTED_MODEL_BOOST * masks["promoted_model"]
+    )
+    return masks
+
+
+def feature_contributions(rule: Dict[str, np.ndarray], biz: Dict[str, np.ndarray], i: int) -> Dict[str, float]:
+    """
+    Đóng góp dạng số của dòng i: {feature: điểm cộng} chỉ cho các rule/boost khớp
+    (trọng số RULE_WEIGHTS cho rule score, PROMOTED_*_BOOST cho business score).
+    """
+    contributions = {key: weight for key, weight in RULE_WEIGHTS.items() if rule[key][i]}
+    if biz["promoted_brand"][i]:
+        contributions["promoted_brand"] = PROMOTED_BRAND_BOOST
+    if biz["promoted_model"][i]:
+        contributions["promoted_model"] = PROMOTED_MODEL_BOOST
+    return contributions
+
+
+def reasons_from_contributions(car: Dict[str, Any], pref: Dict[str, Any],
+                               contributions: Dict[str, float]) -> List[str]:
+    """Dựng reasons (mỗi rule/boost khớp một dòng, theo thứ tự cố định) từ các feature đã khớp."""
+    texts = {
+        "engine": lambda: f"EngineType match: {pref.get('EngineType')}",
+        "body": lambda: f"BodyType match: {pref.get('BodyType')}",
+        "price": lambda: f"Price ≤ {safe_float(pref.get('PriceMax'), None)}",
+        "make": lambda: f"Preferred make: {car.get('Make')}",
+        "model": lambda: f"Preferred model: {car.get('Model')}",
+        "use_case": lambda: f"UseCase contains '{_norm(pref.get('UseCaseKeyword') or '')}'",
+        "environment": lambda: f"Driving environment: {_norm(pref.get('DrivingEnvironment') or '')}",
+        "promoted_brand": lambda: f"Promoted brand: {car.get('Make')}",
+        "promoted_model": lambda: f"Promoted model: {car.get('Model')}",
+    }
+    return [texts[key]() for key in texts if key in contributions]
+
+
+def hit_reasons(hit, pref: Dict[str, Any]) -> List[str]:
+    """Reasons của một CarHit; chế độ deferred_explanations thì render từ contributions khi cần."""
+    if hit.reasons is None:
+        hit.reasons = reasons_from_contributions(hit.payload, pref or {}, hit.contributions or {})
+    return hit.reasons
+
+
+def minmax_scale_array(values: np.ndarray) -> np.ndarray:
+    if values.size == 0:
+        return values
+    vmin, vmax = values.min(), values.max()
+    if np.isclose(vmax - vmin, 0.0):
+        return np.full(values.shape, 0.5)
+    return (values - vmin) / (vmax - vmin)
+
+
+def blend_scores(vec, rule, emb, biz, cfg: Dict[str, float]) -> np.ndarray:
+    """final = wR*vec + wP*(gamma*rule + (1-gamma)*emb) + wB*biz, các thành phần đã min-max."""
+    gamma_rule = cfg["gamma_rule"]
+    p_part = gamma_rule * minmax_scale_array(rule) + (1 - gamma_rule) * minmax_scale_array(emb)
+    return cfg["wR"] * minmax_scale_array(vec) + cfg["wP"] * p_part + cfg["wB"] * minmax_scale_array(biz)
+
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Chỉ số top-k theo score giảm dần (argpartition rồi mới sort k phần tử)."""
+    n = scores.shape[0]
+    if k is None or k >= n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
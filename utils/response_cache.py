@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+from typing import Any, Dict, Optional
+
+from utils.metrics import REGISTRY
+
+# Các field của Profile thực sự ảnh hưởng tới response của /recommend
+# (profile summary, semantic search + filter, strategy, voucher, TCO)
+RESPONSE_CACHE_FIELDS = (
+    "state", "zip", "finance", "habit", "parking", "annual_mileage", "eco_friendly",
+    "brand_preference", "body_type", "engine_type", "car_condition_preference", "campaign", "memberLevel",
+)
+# Field dạng tập hợp (thứ tự không đổi kết quả); body_type giữ thứ tự vì phần tử đầu là BodyType ưu tiên
+UNORDERED_FIELDS = {"brand_preference"}
+
+
+def _canonical(value):
+    if is_dataclass(value):
+        value = asdict(value)
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return value
+
+
+def profile_cache_key(profile) -> str:
+    """
+    Hash của các field ảnh hưởng tới output, đã chuẩn hoá (bỏ None, sort tập hợp, số -> float).
+    String giữ nguyên (không strip/lower): pipeline dùng giá trị gốc (pref_text, rerank, location trả về),
+    nên hai profile chỉ khác khoảng trắng vẫn có thể cho response khác nhau.
+    """
+    canonical = {}
+    for name in RESPONSE_CACHE_FIELDS:
+        value = _canonical(getattr(profile, name, None))
+        if name in UNORDERED_FIELDS and value:
+            value = sorted(value)
+        if value not in (None, [], {}):
+            canonical[name] = value
+    content = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    ResponseCache
+    Cache response theo profile: LRU + TTL trong RAM.
+
+    Invalidate toàn bộ khi:
+      - gọi invalidate(reason) từ các hook (reload catalog, refresh business signals, REGION_CONFIG đổi)
+      - validate(versions) thấy một nguồn dữ liệu đổi version (mtime file, fingerprint, ngày hiện tại
+        -> voucher hết hạn theo valid_until)
+
+    Các field:
+      - hits / misses / evictions / expirations: bộ đếm
+      - invalidations: {reason: số lần}
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._versions: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations: Dict[str, int] = {}
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value, ttl_seconds: float = None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, reason: str = "manual") -> int:
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self.invalidations[reason] = self.invalidations.get(reason, 0) + 1
+        return dropped
+
+    def validate(self, versions: Dict[str, Any]) -> bool:
+        """So version các nguồn dữ liệu với lần trước; có nguồn đổi -> invalidate, trả về True."""
+        with self._lock:
+            previous, self._versions = self._versions, dict(versions)
+        if previous is None or previous == versions:
+            return False
+        changed = sorted(k for k in versions if previous.get(k) != versions[k])
+        self.invalidate("+".join(changed))
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / (self.hits + self.misses), 4) if self.hits + self.misses else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": dict(self.invalidations),
+            }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Cache dùng chung cho cả process (cấu hình trong RECOMMENDER_CONFIG)."""
+    global _response_cache
+    from configs.recommender_config import RECOMMENDER_CONFIG
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                max_entries=RECOMMENDER_CONFIG["response_cache_entries"],
+                ttl_seconds=RECOMMENDER_CONFIG["response_cache_ttl_seconds"],
+            )
+        return _response_cache
+
+
+def _response_cache_metrics():
+    """Cho /metrics: bộ đếm của response cache (nếu đã khởi tạo)."""
+    cache = _response_cache
+    if cache is None:
+        return []
+    stats = cache.stats()
+    samples = [
+        ("car_recommender_response_cache_lookups_total", "Số lần tra response cache theo kết quả",
+         {"result": result}, stats[result])
+        for result in ("hits", "misses")
+    ]
+    samples.append(("car_recommender_response_cache_evictions_total", "Số entry bị đẩy ra do đầy (LRU)",
+                    {}, stats["evictions"]))
+    samples.append(("car_recommender_response_cache_expirations_total", "Số entry hết TTL", {}, stats["expirations"]))
+    samples.extend(
+        ("car_recommender_response_cache_invalidations_total", "Số lần xoá toàn bộ cache theo lý do",
+         {"reason": reason}, count)
+        for reason, count in stats["invalidations"].items()
+    )
+    return samples
+
+
+REGISTRY.register_collector(_response_cache_metrics, metric_type="counter")
@@ -1,7 +1,6 @@
 import math
 import numpy as np
 from typing import List, Optional
-from sentence_transformers import util
 
 def minmax_scale(values: List[float]) -> List[float]:
     if not values:
@@ -20,5 +19,9 @@ def safe_float(x, default=None) -> Optional[float]:
         return default
 
 def cosine(a, b) -> float:
-    return float(util.cos_sim(a, b).item())
+    """Cosine similarity bằng NumPy (không cần torch); vector rỗng/bằng 0 -> 0.0."""
+    a = np.asarray(a, dtype=np.float64).ravel()
+    b = np.asarray(b, dtype=np.float64).ravel()
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom > 0 else 0.0
 
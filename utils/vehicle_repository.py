@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from models.vehicle import Vehicle
+from utils.db import get_vehicles_from_db
+
+VehicleKey = Tuple[int, str, str, str]
+
+
+class _VehicleIndexes:
+    """Snapshot bất biến của danh sách xe + các index, thay thế nguyên khối khi reload."""
+
+    def __init__(self, vehicles: List[Vehicle], price_bucket_size: float):
+        self.vehicles = vehicles
+        self.by_key: Dict[VehicleKey, List[Vehicle]] = defaultdict(list)
+        self.by_make: Dict[str, List[Vehicle]] = defaultdict(list)
+        self.by_body_type: Dict[str, List[Vehicle]] = defaultdict(list)
+        self.by_price_bucket: Dict[int, List[Vehicle]] = defaultdict(list)
+        for v in vehicles:
+            self.by_key[(v.year, v.make, v.model, v.trim)].append(v)
+            self.by_make[(v.make or "").lower()].append(v)
+            self.by_body_type[(v.body_type or "").lower()].append(v)
+            self.by_price_bucket[int(v.base_price // price_bucket_size)].append(v)
+
+
+class VehicleRepository:
+    """
+    VehicleRepository
+    Giữ danh sách xe (data/vehicles.json) trong RAM, chỉ parse lại khi file đổi (mtime).
+
+    Các index:
+      - (year, make, model, trim) -> xe: tra cứu O(1) cho mỗi xe được gợi ý
+      - make / body_type (lowercase) -> xe
+      - price bucket (base_price // price_bucket_size) -> xe
+    """
+
+    def __init__(self, json_path: str = "data/vehicles.json", price_bucket_size: float = 5000):
+        self.json_path = json_path
+        self.price_bucket_size = price_bucket_size
+        self._mtime: Optional[float] = None
+        self._indexes: Optional[_VehicleIndexes] = None
+        self._lock = threading.Lock()
+
+    def _current(self) -> _VehicleIndexes:
+        mtime = os.path.getmtime(self.json_path)
+        if self._indexes is None or mtime != self._mtime:
+            with self._lock:
+                if self._indexes is None or mtime != self._mtime:
+                    self._indexes = _VehicleIndexes(get_vehicles_from_db(self.json_path), self.price_bucket_size)
+                    self._mtime = mtime
+        return self._indexes
+
+    @property
+    def version(self) -> Optional[float]:
+        """mtime của file lần nạp gần nhất (dùng để invalidate cache phía trên)."""
+        self._current()
+        return self._mtime
+
+    def all(self) -> List[Vehicle]:
+        return self._current().vehicles
+
+    def find(self, year: int, make: str, model: str, trim: str) -> List[Vehicle]:
+        return self._current().by_key.get((year, make, model, trim), [])
+
+    def by_make(self, make: str) -> List[Vehicle]:
+        return self._current().by_make.get((make or "").lower(), [])
+
+    def by_body_type(self, body_type: str) -> List[Vehicle]:
+        return self._current().by_body_type.get((body_type or "").lower(), [])
+
+    def in_price_range(self, min_price: float, max_price: float) -> List[Vehicle]:
+        """Xe có base_price trong [min_price, max_price], chỉ duyệt các bucket giao với khoảng giá."""
+        indexes = self._current()
+        result = []
+        for bucket in range(int(min_price // self.price_bucket_size), int(max_price // self.price_bucket_size) + 1):
+            result.extend(v for v in indexes.by_price_bucket.get(bucket, []) if min_price <= v.base_price <= max_price)
+        return result
+
+
+_repository: Optional[VehicleRepository] = None
+_repository_lock = threading.Lock()
+
+
+def get_vehicle_repository(json_path: str = "data/vehicles.json") -> VehicleRepository:
+    """Repository dùng chung cho cả process."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = VehicleRepository(json_path)
+        return _repository
@@ -1,11 +1,22 @@
-from datetime import datetime
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
 from models.voucher import Voucher
-from typing import List
+from typing import Dict, List, Optional, Union
 
-def get_discount_vouchers(vouchers: List[Voucher], vehicle, year: int, member_level: str) -> List[Voucher]:
+# Số bộ voucher (special_offers khác nhau) giữ index đã compile; số kết quả lookup cache cho mỗi index
+VOUCHER_INDEX_CACHE_SIZE = 32
+LOOKUP_CACHE_ENTRIES = 50000
+
+def get_discount_vouchers(vouchers: Union[List[Voucher], "VoucherIndex"], vehicle, year: int, member_level: str) -> List[Voucher]:
     """
-    Helper: filter các voucher giảm giá, chỉ lấy voucher còn hạn sử dụng
+    Helper: filter các voucher giảm giá, chỉ lấy voucher còn hạn sử dụng.
+    Truyền VoucherIndex (compile một lần cho nhiều xe) để tra cứu bằng index thay vì duyệt từng voucher.
     """
+    if isinstance(vouchers, VoucherIndex):
+        return vouchers.lookup(vehicle, year, member_level)
     today = datetime.today().date()
     result = []
     for v in vouchers:
@@ -60,3 +71,147 @@ def is_voucher_applicable(voucher, vehicle, year: int, member_level: str) -> boo
         return False
 
     return True
+
+
+WILDCARDS = {"*", "all"}
+
+
+def _parse_date(value: str) -> Optional[date]:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+
+def _values_or_any(values) -> List:
+    """Danh sách điều kiện -> các khoá index; [None] nghĩa là áp dụng cho mọi giá trị."""
+    if not values or any(v in WILDCARDS for v in values):
+        return [None]
+    return list(dict.fromkeys(values))
+
+
+@dataclass
+class CompiledVoucher:
+    """
+    CompiledVoucher
+    Voucher đã được parse sẵn lúc load (ngày hết hạn, tập trim loại trừ) để tra cứu nhanh.
+    """
+    order: int                      # Vị trí trong danh sách gốc (giữ thứ tự ưu tiên)
+    voucher: Voucher
+    valid_until: date
+    excluded_trims: frozenset
+    min_vehicle_price: float
+
+
+class VoucherIndex:
+    """
+    VoucherIndex
+    Voucher giảm giá được compile và index theo (make, model, year, member_level); None trong khoá
+    là wildcard ("*"/"all" hoặc danh sách rỗng). Tra cứu một xe chỉ cần 16 lần lookup dict thay vì
+    duyệt toàn bộ voucher. Kết quả được cache theo xe + hạng thành viên và tự hết hiệu lực khi
+    voucher sớm hết hạn nhất trong kết quả hết hạn.
+    Compile một lần cho mỗi bộ voucher: dùng get_voucher_index (file, theo mtime) hoặc
+    compiled_voucher_index (danh sách voucher, theo nội dung) thay vì tạo mới mỗi request.
+    """
+
+    def __init__(self, vouchers: List[Voucher], voucher_type: str = "discount"):
+        self._index: Dict[tuple, List[CompiledVoucher]] = defaultdict(list)
+        self._cache: Dict[tuple, tuple] = {}
+        self.size = 0
+        self.max_discount = 0.0  # giảm giá lớn nhất trong bộ (cận trên cho bộ lọc giá trước voucher)
+        for order, v in enumerate(vouchers):
+            if v.type != voucher_type:
+                continue
+            valid_until = _parse_date(v.valid_until)
+            if valid_until is None:
+                continue
+            compiled = CompiledVoucher(
+                order=order,
+                voucher=v,
+                valid_until=valid_until,
+                excluded_trims=frozenset(v.excluded_trims or []),
+                min_vehicle_price=v.min_vehicle_price or 0.0,
+            )
+            self.size += 1
+            self.max_discount = max(self.max_discount, v.value or 0.0)
+            for make in _values_or_any(v.applicable_makes):
+                for model in _values_or_any(v.applicable_models):
+                    for year in (v.applicable_years or [None]):
+                        for level in (v.member_levels or [None]):
+                            self._index[(make, model, year, level)].append(compiled)
+
+    def _candidates(self, vehicle, year: int, member_level: str) -> List[CompiledVoucher]:
+        found = {}
+        for make in (vehicle.make, None):
+            for model in (vehicle.model, None):
+                for y in (year, None):
+                    for level in (member_level, None):
+                        for c in self._index.get((make, model, y, level), ()):
+                            found[c.order] = c
+        return [found[k] for k in sorted(found)]
+
+    def lookup(self, vehicle, year: int, member_level: str, today: date = None) -> List[Voucher]:
+        """Các voucher giảm giá còn hạn áp dụng được cho xe, theo thứ tự gốc."""
+        today = today or datetime.today().date()
+        key = (vehicle.make, vehicle.model, year, vehicle.trim, vehicle.base_price, member_level)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] <= today < cached[1]:
+            return cached[2]
+        result = [
+            c for c in self._candidates(vehicle, year, member_level)
+            if c.valid_until >= today
+            and vehicle.trim not in c.excluded_trims
+            and vehicle.base_price >= c.min_vehicle_price
+        ]
+        # Hợp lệ từ hôm nay tới ngày voucher sớm hết hạn nhất còn trong kết quả
+        expires = min((c.valid_until for c in result), default=date.max)
+        vouchers = [c.voucher for c in result]
+        if len(self._cache) >= LOOKUP_CACHE_ENTRIES:
+            self._cache.clear()
+        self._cache[key] = (today, expires + timedelta(days=1) if expires < date.max else date.max, vouchers)
+        return vouchers
+
+
+def _voucher_key(v: Voucher) -> tuple:
+    return tuple(tuple(x) if isinstance(x, list) else x for x in (getattr(v, f.name) for f in fields(v)))
+
+
+_compiled: "OrderedDict[tuple, VoucherIndex]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def compiled_voucher_index(vouchers: List[Voucher]) -> VoucherIndex:
+    """
+    VoucherIndex cho một danh sách voucher (vd. special_offers), cache theo nội dung (LRU
+    VOUCHER_INDEX_CACHE_SIZE bộ): cùng bộ voucher chỉ compile một lần và dùng chung lookup cache.
+    """
+    key = tuple(_voucher_key(v) for v in vouchers)
+    with _compiled_lock:
+        index = _compiled.get(key)
+        if index is not None:
+            _compiled.move_to_end(key)
+            return index
+    index = VoucherIndex(vouchers)
+    with _compiled_lock:
+        index = _compiled.setdefault(key, index)
+        while len(_compiled) > VOUCHER_INDEX_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return index
+
+
+_voucher_index: Optional[VoucherIndex] = None
+_voucher_mtime: Optional[float] = None
+_voucher_lock = threading.Lock()
+
+
+def get_voucher_index(json_path: str = "data/vouchers.json") -> VoucherIndex:
+    """VoucherIndex dùng chung cho vouchers trong DB, compile lại khi file đổi (mtime)."""
+    global _voucher_index, _voucher_mtime
+    from utils.db import get_vouchers_from_db
+    mtime = os.path.getmtime(json_path)
+    with _voucher_lock:
+        if _voucher_index is None or mtime != _voucher_mtime:
+            _voucher_index = VoucherIndex(get_vouchers_from_db(json_path))
+            _voucher_mtime = mtime
+        return _voucher_index
+